@@ -1,4 +1,6 @@
 from flask import Flask, render_template, jsonify, request, send_from_directory
+import multiprocessing
+import threading
 import os
 
 # Obtener la ruta base del proyecto
@@ -32,6 +34,37 @@ try:
 except Exception as e:
     print(f"[-] Error al importar rutas: {e}")
 
+
+def iniciar_servicios():
+    """Arranca los servicios en segundo plano de la app (una vez por proceso).
+
+    Con "spawn" (Windows) los procesos del pool de PDF pueden importar este módulo
+    como __mp_main__; ellos no llaman a esta función.
+    """
+    try:
+        # Migraciones pendientes (bajo advisory lock: con varios workers las aplica uno solo)
+        from database.migrations import aplicar_migraciones
+        threading.Thread(target=aplicar_migraciones, name="migraciones", daemon=True).start()
+        # Reencola documentos que quedaron pendientes en el spool
+        from services.document_queue import document_queue
+        document_queue.start()
+        # Levanta los procesos de renderizado de PDF (en segundo plano) antes de la primera factura
+        from services.pdf_service import pdf_service
+        pdf_service.start()
+        # Conecta PostgreSQL/Mongo de los logs (en segundo plano salvo LOG_BACKENDS_INIT=inmediato)
+        from config.settings import LOG_BACKENDS_CONFIG
+        from services.log_registry import log_registry
+        log_registry.iniciar(diferido=LOG_BACKENDS_CONFIG["init"] != "inmediato")
+    except Exception as e:
+        print(f"[-] Error al iniciar servicios: {e}")
+
+
+# gunicorn/WSGI importan este módulo desde el proceso servidor: ahí se arrancan los servicios.
+# Un hijo de multiprocessing se llama distinto desde antes de reimportar el módulo principal
+# (`parent_process()` todavía es None en ese momento).
+if multiprocessing.current_process().name == "MainProcess":
+    iniciar_servicios()
+
 if __name__ == "__main__":
     print("\n" + "="*60)
     print("[+] Iniciando Facturacion_Pizza")
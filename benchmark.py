@@ -0,0 +1,112 @@
+"""
+Microbenchmarks de la generación de documentos.
+
+Uso:
+    python benchmark.py pdf [-n 200] [--items 5]
+    python benchmark.py xml [-n 2000] [--items 5]
+    python benchmark.py letras [-n 1000000]
+"""
+import argparse
+import random
+import statistics
+import time
+from typing import Callable, Dict, List
+
+
+def _medir(fn: Callable[[], object], n: int, calentamiento: int = 5) -> Dict[str, float]:
+    for _ in range(calentamiento):
+        fn()
+    tiempos: List[float] = []
+    for _ in range(n):
+        t0 = time.perf_counter()
+        fn()
+        tiempos.append((time.perf_counter() - t0) * 1000)
+    tiempos.sort()
+    return {
+        "media_ms": statistics.fmean(tiempos),
+        "p50_ms": tiempos[len(tiempos) // 2],
+        "p95_ms": tiempos[min(len(tiempos) - 1, int(len(tiempos) * 0.95))],
+    }
+
+
+def _imprimir(nombre: str, r: Dict[str, float], base: Dict[str, float] = None):
+    extra = f"  x{base['media_ms'] / r['media_ms']:.2f}" if base else ""
+    print(f"  {nombre:<12} media={r['media_ms']:.3f} ms  p50={r['p50_ms']:.3f} ms  p95={r['p95_ms']:.3f} ms{extra}")
+
+
+def _carrito(items: int) -> List[Dict]:
+    return [{"nombre": f"Pizza {i}", "precio": 35000 + i * 1000, "cantidad": 1 + i % 3} for i in range(items)]
+
+
+def bench_pdf(args):
+    from services.pdf_generator import _parse_xml, renderizar_pdf
+    from services.xml_generator import generar_xml_base
+
+    cliente = {"nombre": "Cliente Benchmark", "nit": "900123456", "email": "bench@example.com"}
+    data = _parse_xml(generar_xml_base("FAC-BENCH", cliente, _carrito(args.items)))
+    print(f"PDF por factura ({args.items} ítems, n={args.n})")
+    antes = _medir(lambda: renderizar_pdf(data, "platypus"), args.n)
+    despues = _medir(lambda: renderizar_pdf(data, "plantilla"), args.n)
+    _imprimir("platypus", antes)
+    _imprimir("plantilla", despues, antes)
+
+
+def bench_xml(args):
+    from services.xml_generator import _generar_xml_etree, generar_xml_base
+
+    cliente = {"nombre": "Cliente Benchmark", "nit": "900123456", "email": "bench@example.com"}
+    carrito = _carrito(args.items)
+    print(f"XML por factura ({args.items} ítems, n={args.n})")
+    antes = _medir(lambda: _generar_xml_etree("FAC-BENCH", cliente, carrito), args.n)
+    despues = _medir(lambda: generar_xml_base("FAC-BENCH", cliente, carrito), args.n)
+    _imprimir("elementtree", antes)
+    _imprimir("plantilla", despues, antes)
+
+
+def bench_letras(args):
+    from decimal import Decimal
+
+    from models.monto_letras import _pesos, numero_a_letras
+
+    rnd = random.Random(42)
+    # Montos con centavos de 0 a 10 millones de pesos (casi todos distintos) y, aparte,
+    # los mismos tomados de 2000 totales frecuentes (carritos repetidos)
+    aleatorios = [Decimal(rnd.randint(0, 10 ** 9)) / 100 for _ in range(args.n)]
+    frecuentes = aleatorios[:2000]
+    repetidos = [rnd.choice(frecuentes) for _ in range(args.n)]
+    print(f"Monto en letras (n={args.n})")
+    for nombre, montos in (("aleatorios", aleatorios), ("repetidos", repetidos)):
+        _pesos.cache_clear()
+        t0 = time.perf_counter()
+        for monto in montos:
+            numero_a_letras(monto)
+        total = time.perf_counter() - t0
+        info = _pesos.cache_info()
+        print(f"  {nombre:<12} total={total:.2f} s  por monto={total / args.n * 1e6:.2f} µs  "
+              f"aciertos caché={info.hits / args.n:.0%}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    sub = parser.add_subparsers(dest="cmd", required=True)
+
+    p = sub.add_parser("pdf", help="latencia por PDF: motor platypus vs plantilla en caché")
+    p.add_argument("-n", type=int, default=200)
+    p.add_argument("--items", type=int, default=5)
+    p.set_defaults(func=bench_pdf)
+
+    p = sub.add_parser("xml", help="latencia por XML: ElementTree vs plantillas pre-serializadas")
+    p.add_argument("-n", type=int, default=2000)
+    p.add_argument("--items", type=int, default=5)
+    p.set_defaults(func=bench_xml)
+
+    p = sub.add_parser("letras", help="costo de numero_a_letras sobre montos aleatorios")
+    p.add_argument("-n", type=int, default=1_000_000)
+    p.set_defaults(func=bench_letras)
+
+    args = parser.parse_args()
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -13,6 +13,19 @@ DB_CONFIG = {
     "port": os.getenv("DB_PORT", "5432")
 }
 
+# Pool de conexiones PostgreSQL
+DB_POOL_CONFIG = {
+    "min_size": int(os.getenv("DB_POOL_MIN", 1)),
+    "max_size": int(os.getenv("DB_POOL_MAX", 10)),
+    # Segundos máximos esperando una conexión libre cuando el pool está agotado
+    "timeout": float(os.getenv("DB_POOL_TIMEOUT", 5)),
+    # Inactividad (segundos) tras la cual se valida la conexión con SELECT 1 al prestarla
+    "health_check_after": float(os.getenv("DB_POOL_CHECK_AFTER", 30)),
+    # Vida máxima (segundos) de una conexión antes de reciclarla
+    "max_lifetime": float(os.getenv("DB_POOL_MAX_LIFETIME", 1800)),
+    "connect_timeout": int(os.getenv("DB_CONNECT_TIMEOUT", 5)),
+}
+
 # Config MongoDB
 MONGO_CONFIG = {
     "uri": "mongodb://localhost:27017/",
@@ -21,10 +34,75 @@ MONGO_CONFIG = {
     "collection_facturacion": "logs_facturacion",
     # Colección para eventos/errores de sistema generales
     "collection_sistema": "logs_sistema",
+    # Marcador con la versión del esquema de logs (colecciones e índices ya creados)
+    "collection_meta": "logs_esquema",
+    # Conexiones máximas del cliente compartido por proceso
+    "max_pool_size": int(os.getenv("MONGO_MAX_POOL", 10)),
     # Tamaño máximo colección capped (en bytes). 50MB por defecto.
+    # Es la única retención: MongoDB no admite índices TTL en colecciones capped
     "max_size_bytes": int(os.getenv("MONGO_LOG_MAX_SIZE", 50 * 1024 * 1024)),
-    # TTL (segundos) para eliminación automática adicional (ej: 30 días)
-    "ttl_seconds": int(os.getenv("MONGO_LOG_TTL", 30 * 24 * 3600)),
+}
+
+# Envío de logs en segundo plano a PostgreSQL (tabla logs) y Mongo (ver services/log_shipper.py)
+LOG_SHIPPER_CONFIG = {
+    # 0 vuelve a escribir cada log en el hilo de la petición
+    "enabled": os.getenv("LOG_ASYNC", "1").lower() not in ("0", "false", "no"),
+    "max_queue": int(os.getenv("LOG_QUEUE_MAX", 10000)),
+    # Registros por lote (un INSERT multi-fila / un insert_many por colección)
+    "batch_size": int(os.getenv("LOG_BATCH", 200)),
+    # Segundos máximos que un registro espera en la cola antes de enviarse
+    "flush_interval": float(os.getenv("LOG_FLUSH_SECONDS", 0.5)),
+    # Con la cola llena: "drop" descarta el registro; "block" espera hasta block_timeout y luego descarta
+    "policy": os.getenv("LOG_QUEUE_POLICY", "drop").lower(),
+    "block_timeout": float(os.getenv("LOG_BLOCK_TIMEOUT", 0.05)),
+}
+
+# Conexión de los backends de logs (PostgreSQL y Mongo, ver services/log_registry.py)
+LOG_BACKENDS_CONFIG = {
+    # "diferido": se conectan en un hilo al arrancar la app; "inmediato": el arranque espera la conexión
+    "init": os.getenv("LOG_BACKENDS_INIT", "diferido").lower(),
+    # Fallos seguidos que abren el circuito y segundos hasta el siguiente intento
+    "breaker_failures": int(os.getenv("LOG_BREAKER_FAILURES", 3)),
+    "breaker_cooldown": float(os.getenv("LOG_BREAKER_COOLDOWN", 30)),
+    # Registros retenidos en memoria por backend mientras no responde (se descartan los más antiguos)
+    "buffer_max": int(os.getenv("LOG_BUFFER_MAX", 20000)),
+}
+
+# Persistencia de facturas: productos, detalle e impuestos con sentencias multi-fila
+FACTURA_BULK_INSERT = os.getenv("FACTURA_BULK_INSERT", "1").lower() not in ("0", "false", "no")
+
+# Caché en proceso de ids de Producto, Impuesto y Receptor
+CATALOG_CACHE_CONFIG = {
+    "max_entries": int(os.getenv("CATALOG_CACHE_MAX", 1024)),
+    "ttl_seconds": float(os.getenv("CATALOG_CACHE_TTL", 600)),
+    # TTL de las entradas negativas ("no existe")
+    "negative_ttl_seconds": float(os.getenv("CATALOG_CACHE_NEGATIVE_TTL", 30)),
+}
+
+# Formato de almacenamiento del PDF en FacturaDocumento
+DOCUMENT_STORAGE_CONFIG = {
+    # "raw": bytes en pdf_blob (+ códec, sha256 y longitud); "base64": formato anterior (base64doc + pdf)
+    "format": os.getenv("DOC_STORAGE_FORMAT", "raw").lower(),
+    # Compresión de pdf_blob: none, zlib o zstd (zstd requiere el paquete `zstandard`; si falta se usa zlib)
+    "codec": os.getenv("DOC_STORAGE_CODEC", "none").lower(),
+    "level": int(os.getenv("DOC_STORAGE_LEVEL", 6)),
+}
+
+# Generación de PDF
+PDF_CONFIG = {
+    # "plantilla": encabezado, estilos y QR precalculados por proceso; "platypus": motor anterior
+    "motor": os.getenv("PDF_ENGINE", "plantilla").lower(),
+    # Renderizado diferido: /generar-xml solo guarda el XML y el PDF se genera en la primera descarga
+    "lazy": os.getenv("PDF_LAZY", "0").lower() in ("1", "true", "si", "yes"),
+}
+
+# Pool de procesos para renderizar PDF (ver services/pdf_service.py)
+PDF_SERVICE_CONFIG = {
+    # 0 desactiva el pool y se renderiza en el hilo de la petición
+    "workers": int(os.getenv("PDF_WORKERS", min(4, os.cpu_count() or 1))),
+    # Trabajos en curso como máximo; sin cupo se renderiza en el proceso de la app
+    "max_pending": int(os.getenv("PDF_MAX_PENDING", 16)),
+    "timeout_seconds": float(os.getenv("PDF_TIMEOUT", 20)),
 }
 
 # Directorios
@@ -37,9 +115,91 @@ STATIC_PDFS = os.path.join(PROJECT_ROOT, "static/pdfs")
 ERROR_DIR = os.path.join(PROJECT_ROOT, "error")
 LOG_FILE = os.path.join(PROJECT_ROOT, "logs/facturacion.log")
 
+# Asignación de folios
+FOLIO_CONFIG = {
+    # Secuencia PostgreSQL de la que salen los folios (se crea si no existe)
+    "sequence": os.getenv("FOLIO_SEQUENCE", "factura_folio_seq"),
+    # Folios reservados por viaje a la BD. >1 ahorra consultas pero deja huecos si el proceso se reinicia
+    "block_size": int(os.getenv("FOLIO_BLOCK_SIZE", 1)),
+    # Espejo local de la marca de agua; solo se usa para asignar si la BD no está disponible
+    "state_file": os.path.join(PROJECT_ROOT, "folio.txt"),
+}
+
+# Cola en segundo plano para guardar documentos (XML/PDF) en FacturaDocumento
+DOCUMENT_QUEUE_CONFIG = {
+    "workers": int(os.getenv("DOC_QUEUE_WORKERS", 2)),
+    # Trabajos en memoria como máximo; con la cola llena se guarda en la misma petición
+    "max_backlog": int(os.getenv("DOC_QUEUE_MAX_BACKLOG", 200)),
+    "max_retries": int(os.getenv("DOC_QUEUE_MAX_RETRIES", 5)),
+    # Espera antes del primer reintento; se duplica en cada intento
+    "retry_backoff_seconds": float(os.getenv("DOC_QUEUE_BACKOFF", 2)),
+    # Spool durable: pendientes/ se reencola al arrancar, fallidos/ queda para revisión
+    "spool_dir": os.path.join(PROJECT_ROOT, "spool/documentos"),
+}
+
+# Almacén de XML/PDF por hash de contenido (ver services/blob_store.py)
+BLOB_STORE_CONFIG = {
+    # Con 0 se vuelve a escribir en pendientes/base y static/pdfs
+    "enabled": os.getenv("BLOB_STORE", "1").lower() not in ("0", "false", "no"),
+    "root": os.getenv("BLOB_STORE_DIR", os.path.join(PROJECT_ROOT, "blobs")),
+    # El GC no toca objetos más nuevos que esto (segundos)
+    "gc_grace_seconds": float(os.getenv("BLOB_STORE_GC_GRACE", 3600)),
+}
+
+# Caché de PDFs renderizados bajo demanda (modo PDF_LAZY, ver services/pdf_cache.py)
+PDF_CACHE_CONFIG = {
+    "dir": os.getenv("PDF_CACHE_DIR", os.path.join(PROJECT_ROOT, "cache", "pdfs")),
+    "memory_max_bytes": int(float(os.getenv("PDF_CACHE_MEMORY_MB", 32)) * 1024 * 1024),
+    "disk_max_bytes": int(float(os.getenv("PDF_CACHE_DISK_MB", 512)) * 1024 * 1024),
+}
+
+# Exportación masiva de PDFs (/api/facturas/exportar, ver services/exportador.py)
+EXPORT_CONFIG = {
+    # Facturas resueltas por lote (una consulta BD por lote)
+    "batch_size": int(os.getenv("EXPORT_BATCH", 32)),
+    # Hilos que envían renderizados al pool de procesos en paralelo
+    "render_threads": int(os.getenv("EXPORT_RENDER_THREADS", max(2, PDF_SERVICE_CONFIG["workers"]))),
+    # Tope de facturas en un solo PDF concatenado (el ZIP no tiene tope)
+    "max_pdf_facturas": int(os.getenv("EXPORT_PDF_MAX", 1000)),
+}
+
+# Regeneración masiva de PDFs (python -m services.backfill_pdf)
+BACKFILL_CONFIG = {
+    "workers": int(os.getenv("BACKFILL_WORKERS", os.cpu_count() or 1)),
+    # Filas por lote: lectura del cursor, renderizado y un upsert por lote
+    "batch_size": int(os.getenv("BACKFILL_BATCH", 100)),
+    "checkpoint": os.getenv("BACKFILL_CHECKPOINT", os.path.join(PROJECT_ROOT, "spool", "backfill_pdf.json")),
+}
+
+# Spool local de los logs antes de PostgreSQL/Mongo (ver services/log_spool.py)
+LOG_SPOOL_CONFIG = {
+    # Con 0 los registros pendientes solo se guardan en memoria (LOG_BUFFER_MAX)
+    "enabled": os.getenv("LOG_SPOOL", "1").lower() not in ("0", "false", "no"),
+    "dir": os.getenv("LOG_SPOOL_DIR", os.path.join(PROJECT_ROOT, "spool", "logs")),
+    # Tamaño a partir del cual se rota el segmento
+    "segment_bytes": int(float(os.getenv("LOG_SPOOL_SEGMENT_MB", 16)) * 1024 * 1024),
+    # fsync como mucho cada tantos segundos (y siempre al rotar o al vaciar la cola)
+    "fsync_interval": float(os.getenv("LOG_SPOOL_FSYNC_SECONDS", 1)),
+    # Tope del spool por backend; al superarlo se descartan los segmentos más antiguos
+    "max_bytes": int(float(os.getenv("LOG_SPOOL_MAX_MB", 1024)) * 1024 * 1024),
+}
+
+# Seguimiento en vivo de los logs Mongo (/api/logs/stream, ver services/log_tail.py)
+LOG_TAIL_CONFIG = {
+    # Espera máxima de cada getMore del cursor tailable (ms)
+    "max_await_ms": int(os.getenv("LOG_TAIL_AWAIT_MS", 1000)),
+    # Eventos en cola por cliente; si no los consume a tiempo se descartan los más antiguos
+    "cola_max": int(os.getenv("LOG_TAIL_QUEUE", 1000)),
+    "max_suscriptores": int(os.getenv("LOG_TAIL_MAX_CLIENTES", 100)),
+    # Segundos sin eventos tras los que se envía un latido (mantiene viva la conexión)
+    "latido": float(os.getenv("LOG_TAIL_HEARTBEAT", 15)),
+}
+
 # Crear carpetas si no existen
 os.makedirs(PENDIENTES_BASE, exist_ok=True)
 os.makedirs(PENDIENTES_DIAN, exist_ok=True)
 os.makedirs(STATIC_PDFS, exist_ok=True)
 os.makedirs(ERROR_DIR, exist_ok=True)
 os.makedirs(os.path.dirname(LOG_FILE), exist_ok=True)
+os.makedirs(DOCUMENT_QUEUE_CONFIG["spool_dir"], exist_ok=True)
+os.makedirs(BLOB_STORE_CONFIG["root"], exist_ok=True)
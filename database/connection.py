@@ -1,54 +1,311 @@
+import threading
+import time
+from contextlib import contextmanager
+
 import psycopg2
-from config.settings import DB_CONFIG
+from psycopg2 import extensions
+from config.settings import DB_CONFIG, DB_POOL_CONFIG
+
+
+class PoolTimeoutError(Exception):
+    """No se liberó ninguna conexión del pool dentro del tiempo de espera."""
+
+
+class ConnectionPool:
+    """Pool de conexiones PostgreSQL seguro para hilos.
+
+    - Mantiene entre `min_size` y `max_size` conexiones físicas.
+    - Valida la conexión al prestarla (`SELECT 1` si estuvo inactiva más de
+      `health_check_after` segundos) y recicla las que superan `max_lifetime`.
+    - Si el pool está agotado espera como máximo `timeout` segundos y luego
+      lanza `PoolTimeoutError`.
+    """
+
+    def __init__(self, min_size=1, max_size=10, timeout=5.0, health_check_after=30.0,
+                 max_lifetime=1800.0, **connect_kwargs):
+        self.min_size = max(0, int(min_size))
+        self.max_size = max(1, int(max_size), self.min_size)
+        self.timeout = float(timeout)
+        self.health_check_after = float(health_check_after)
+        self.max_lifetime = float(max_lifetime)
+        self._connect_kwargs = connect_kwargs
+        self._cond = threading.Condition()
+        # Conexiones libres: (conn, creada_en, ultimo_uso)
+        self._idle = []
+        self._created_at = {}
+        self._open = 0
+        self._in_use = 0
+        self._waiting = 0
+        self._closed = False
+        self._stats = {"created": 0, "recycled": 0, "timeouts": 0, "checkouts": 0}
+
+    def prefill(self):
+        """Abre conexiones hasta `min_size`; los fallos no son fatales."""
+        while True:
+            with self._cond:
+                if self._open >= self.min_size or self._closed:
+                    return
+                self._open += 1
+            try:
+                conn = self._connect()
+            except Exception:
+                with self._cond:
+                    self._open -= 1
+                    self._cond.notify()
+                return
+            with self._cond:
+                now = time.monotonic()
+                self._idle.append((conn, self._created_at[id(conn)], now))
+                self._cond.notify()
+
+    def _connect(self):
+        conn = psycopg2.connect(**self._connect_kwargs)
+        with self._cond:
+            self._created_at[id(conn)] = time.monotonic()
+            self._stats["created"] += 1
+        print("[+] Conexion exitosa a PostgreSQL (pool)")
+        return conn
+
+    def _discard(self, conn):
+        with self._cond:
+            self._created_at.pop(id(conn), None)
+        try:
+            if not conn.closed:
+                conn.close()
+        except Exception:
+            pass
+
+    def _is_healthy(self, conn, created_at, last_used):
+        if conn.closed:
+            return False
+        now = time.monotonic()
+        if self.max_lifetime > 0 and now - created_at > self.max_lifetime:
+            return False
+        if now - last_used > self.health_check_after:
+            try:
+                cur = conn.cursor()
+                cur.execute("SELECT 1")
+                cur.fetchone()
+                cur.close()
+                conn.rollback()
+            except Exception:
+                return False
+        return True
+
+    def getconn(self, timeout=None):
+        """Presta una conexión. Lanza `PoolTimeoutError` si el pool está agotado."""
+        wait = self.timeout if timeout is None else float(timeout)
+        deadline = time.monotonic() + wait
+        while True:
+            entry = None
+            with self._cond:
+                while True:
+                    if self._closed:
+                        raise psycopg2.InterfaceError("El pool de conexiones está cerrado")
+                    if self._idle:
+                        entry = self._idle.pop()
+                        break
+                    if self._open < self.max_size:
+                        self._open += 1
+                        break
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        self._stats["timeouts"] += 1
+                        raise PoolTimeoutError(
+                            f"Pool agotado: {self._in_use}/{self.max_size} conexiones en uso tras {wait:.1f}s"
+                        )
+                    self._waiting += 1
+                    try:
+                        self._cond.wait(remaining)
+                    finally:
+                        self._waiting -= 1
+                self._in_use += 1
+                self._stats["checkouts"] += 1
+
+            if entry is None:
+                try:
+                    return self._connect()
+                except Exception:
+                    with self._cond:
+                        self._open -= 1
+                        self._in_use -= 1
+                        self._cond.notify()
+                    raise
+
+            conn, created_at, last_used = entry
+            if self._is_healthy(conn, created_at, last_used):
+                return conn
+            # Conexión caída o vencida: se recicla y se vuelve a intentar
+            self._discard(conn)
+            with self._cond:
+                self._open -= 1
+                self._in_use -= 1
+                self._stats["recycled"] += 1
+                self._cond.notify()
+
+    def putconn(self, conn, discard=False):
+        """Devuelve una conexión al pool (o la descarta si está rota)."""
+        if not discard and not conn.closed:
+            try:
+                if conn.info.transaction_status != extensions.TRANSACTION_STATUS_IDLE:
+                    # Igual que al cerrar: lo no confirmado se descarta
+                    conn.rollback()
+            except Exception:
+                discard = True
+        if discard or conn.closed or self._closed:
+            self._discard(conn)
+            with self._cond:
+                self._open -= 1
+                self._in_use -= 1
+                self._cond.notify()
+            return
+        with self._cond:
+            created_at = self._created_at.get(id(conn), time.monotonic())
+            self._idle.append((conn, created_at, time.monotonic()))
+            self._in_use -= 1
+            self._cond.notify()
+
+    def closeall(self):
+        """Cierra las conexiones libres; las prestadas se cierran al devolverse."""
+        with self._cond:
+            self._closed = True
+            idle, self._idle = self._idle, []
+            self._open -= len(idle)
+            self._cond.notify_all()
+        for conn, _, _ in idle:
+            self._discard(conn)
+
+    def stats(self):
+        """Métricas del pool: en uso, libres, esperando, creadas y recicladas."""
+        with self._cond:
+            return {
+                "min_size": self.min_size,
+                "max_size": self.max_size,
+                "open": self._open,
+                "in_use": self._in_use,
+                "idle": len(self._idle),
+                "waiting": self._waiting,
+                **self._stats,
+            }
+
+
+class PooledConnection:
+    """Conexión prestada por el pool; `close()` la devuelve en lugar de cerrarla."""
+
+    def __init__(self, pool, conn):
+        self._pool = pool
+        self._conn = conn
+
+    @property
+    def closed(self):
+        return self._conn is None or self._conn.closed
+
+    def close(self):
+        conn, self._conn = self._conn, None
+        if conn is not None:
+            self._pool.putconn(conn)
+
+    def __getattr__(self, name):
+        conn = self.__dict__.get("_conn")
+        if conn is None:
+            raise psycopg2.InterfaceError("La conexión ya fue devuelta al pool")
+        return getattr(conn, name)
+
+    def __del__(self):
+        try:
+            self.close()
+        except Exception:
+            pass
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_pool():
+    """Retorna el pool global, creándolo en el primer uso."""
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                pool = ConnectionPool(
+                    min_size=DB_POOL_CONFIG["min_size"],
+                    max_size=DB_POOL_CONFIG["max_size"],
+                    timeout=DB_POOL_CONFIG["timeout"],
+                    health_check_after=DB_POOL_CONFIG["health_check_after"],
+                    max_lifetime=DB_POOL_CONFIG["max_lifetime"],
+                    dbname=DB_CONFIG["dbname"],
+                    user=DB_CONFIG["user"],
+                    password=DB_CONFIG["password"],
+                    host=DB_CONFIG["host"],
+                    port=DB_CONFIG["port"],
+                    connect_timeout=DB_POOL_CONFIG["connect_timeout"],
+                )
+                pool.prefill()
+                _pool = pool
+    return _pool
+
+
+def pool_stats():
+    """Métricas del pool (vacío si aún no se ha creado)."""
+    return _pool.stats() if _pool is not None else {}
+
 
 def get_connection():
     """
-    Retorna una conexión a la base de datos PostgreSQL.
+    Retorna una conexión del pool de PostgreSQL, o None si no está disponible.
+    `close()` la devuelve al pool.
     """
     try:
-        conn = psycopg2.connect(
-            dbname=DB_CONFIG["dbname"],
-            user=DB_CONFIG["user"],
-            password=DB_CONFIG["password"],
-            host=DB_CONFIG["host"],
-            port=DB_CONFIG["port"]
-        )
-        print("[+] Conexion exitosa a PostgreSQL")
-        return conn
+        pool = get_pool()
+        return PooledConnection(pool, pool.getconn())
     except Exception as e:
         print("[-] Error de conexion a PostgreSQL:", e)
         return None
 
 
+@contextmanager
+def pooled_connection():
+    """
+    Presta una conexión del pool durante el bloque `with` (None si la BD no está
+    disponible) y la devuelve al salir.
+    """
+    conn = get_connection()
+    try:
+        yield conn
+    finally:
+        if conn is not None:
+            conn.close()
+
+
 def init_databases():
     """
     Inicializa las tablas necesarias en PostgreSQL.
     """
     from models.log import Log
-    
+
     print("[*] Inicializando PostgreSQL...")
-    conn = get_connection()
-    if conn:
-        try:
-            Log.create_table(conn)
-            print("[+] PostgreSQL inicializado correctamente")
-        except Exception as e:
-            print(f"[-] Error en PostgreSQL: {e}")
-        finally:
-            conn.close()
-    else:
-        print("[-] No se pudo conectar a PostgreSQL")
+    with pooled_connection() as conn:
+        if conn:
+            try:
+                Log.create_table(conn)
+                from database.migrations import aplicar_migraciones
+                aplicar_migraciones()
+                print("[+] PostgreSQL inicializado correctamente")
+                from database.schema import schema_registry
+                schema_registry.reload()
+            except Exception as e:
+                print(f"[-] Error en PostgreSQL: {e}")
+        else:
+            print("[-] No se pudo conectar a PostgreSQL")
 
 
 if __name__ == "__main__":
-    conn = get_connection()
-    if conn:
-        cur = conn.cursor()
-        cur.execute("SELECT table_name FROM information_schema.tables WHERE table_schema='public';")
-        tablas = cur.fetchall()
-        print("[*] Tablas disponibles:", [t[0] for t in tablas])
-        cur.close()
-        init_databases()
-        conn.close()
-
-
+    with pooled_connection() as conn:
+        if conn:
+            cur = conn.cursor()
+            cur.execute("SELECT table_name FROM information_schema.tables WHERE table_schema='public';")
+            tablas = cur.fetchall()
+            print("[*] Tablas disponibles:", [t[0] for t in tablas])
+            cur.close()
+    init_databases()
@@ -0,0 +1,159 @@
+"""
+Migraciones del esquema PostgreSQL.
+
+Cada migración se aplica una sola vez (registro en `schema_migraciones`) dentro de
+su propia transacción y bajo un advisory lock, para que varios procesos que
+arrancan a la vez no la ejecuten dos veces.
+
+Ejecutar manualmente: python -m database.migrations
+"""
+from typing import List, Tuple
+
+from database.connection import pooled_connection
+
+# Clave del advisory lock compartida por todos los procesos de la app
+_LOCK_KEY = "facturacion_migraciones"
+
+MIGRACIONES: List[Tuple[str, str]] = [
+    (
+        "001_facturadocumento_uuid_unique",
+        """
+        -- Fusionar duplicados por uuid en la fila más reciente antes de exigir unicidad
+        WITH agg AS (
+            SELECT uuid, MAX(id) AS keep_id,
+                   (array_agg(idfactura ORDER BY id DESC) FILTER (WHERE idfactura IS NOT NULL))[1] AS idfactura,
+                   (array_agg(xml ORDER BY id DESC) FILTER (WHERE xml IS NOT NULL))[1] AS xml,
+                   (array_agg(base64doc ORDER BY id DESC) FILTER (WHERE base64doc IS NOT NULL))[1] AS base64doc,
+                   (array_agg(pdf ORDER BY id DESC) FILTER (WHERE pdf IS NOT NULL))[1] AS pdf
+            FROM facturadocumento
+            WHERE uuid IS NOT NULL
+            GROUP BY uuid
+            HAVING COUNT(*) > 1
+        )
+        UPDATE facturadocumento d
+        SET idfactura = agg.idfactura, xml = agg.xml, base64doc = agg.base64doc, pdf = agg.pdf
+        FROM agg
+        WHERE d.id = agg.keep_id;
+
+        DELETE FROM facturadocumento d
+        USING facturadocumento k
+        WHERE d.uuid = k.uuid AND d.id < k.id;
+
+        ALTER TABLE facturadocumento ADD CONSTRAINT facturadocumento_uuid_key UNIQUE (uuid);
+        """,
+    ),
+    (
+        "002_facturadocumento_pdf_blob",
+        """
+        -- PDF en bytes (opcionalmente comprimido) en lugar de base64doc + pdf
+        ALTER TABLE facturadocumento
+            ADD COLUMN IF NOT EXISTS pdf_blob BYTEA,
+            ADD COLUMN IF NOT EXISTS pdf_codec VARCHAR(10),
+            ADD COLUMN IF NOT EXISTS pdf_sha256 CHAR(64),
+            ADD COLUMN IF NOT EXISTS pdf_len INTEGER;
+        -- pdf_blob se guarda comprimido por el códec, no tiene sentido que TOAST lo vuelva a comprimir
+        ALTER TABLE facturadocumento ALTER COLUMN pdf_blob SET STORAGE EXTERNAL;
+        """,
+    ),
+    (
+        "003_indices_listado_facturas",
+        """
+        -- Listado paginado de /api/facturas (filtro por fecha, cliente y documento por factura)
+        CREATE INDEX IF NOT EXISTS idx_factura_fecha_id ON factura (fecha, id);
+        CREATE INDEX IF NOT EXISTS idx_facturareceptor_receptor ON facturareceptor (idreceptor);
+        CREATE INDEX IF NOT EXISTS idx_receptor_nit ON receptor (nit);
+        CREATE INDEX IF NOT EXISTS idx_facturadocumento_factura ON facturadocumento (idfactura, id);
+        """,
+    ),
+    (
+        "004_indice_folio",
+        """
+        -- Exportación por rango de folio (/api/facturas/exportar)
+        CREATE INDEX IF NOT EXISTS idx_factura_folio ON factura (folio, id);
+        """,
+    ),
+    (
+        "005_logs_spool_id",
+        """
+        -- Clave del spool de logs: reenviar un lote ya guardado no duplica filas
+        DO $$
+        BEGIN
+            IF to_regclass('logs') IS NOT NULL THEN
+                ALTER TABLE logs ADD COLUMN IF NOT EXISTS spool_id VARCHAR(40);
+                CREATE UNIQUE INDEX IF NOT EXISTS idx_logs_spool_id ON logs (spool_id);
+            END IF;
+        END $$;
+        """,
+    ),
+    (
+        "006_indices_consulta_logs",
+        """
+        -- Consultas de logs: filtro por nivel/módulo y orden (timestamp, id) de la paginación
+        DO $$
+        BEGIN
+            IF to_regclass('logs') IS NOT NULL THEN
+                CREATE INDEX IF NOT EXISTS idx_logs_ts_id ON logs (timestamp DESC, id DESC);
+                CREATE INDEX IF NOT EXISTS idx_logs_level_ts ON logs (level, timestamp DESC, id DESC);
+                CREATE INDEX IF NOT EXISTS idx_logs_module_ts ON logs (module, timestamp DESC, id DESC);
+                CREATE INDEX IF NOT EXISTS idx_logs_level_module_ts ON logs (level, module, timestamp DESC, id DESC);
+                -- Cubiertos por los anteriores
+                DROP INDEX IF EXISTS idx_logs_level;
+                DROP INDEX IF EXISTS idx_logs_module;
+                DROP INDEX IF EXISTS idx_logs_timestamp;
+            END IF;
+        END $$;
+        """,
+    ),
+    (
+        "007_indice_folio_id",
+        """
+        -- 004 no crea nada: el esquema base ya usa el nombre idx_factura_folio para el
+        -- índice de solo folio. Ese se deja como está y (folio, id) va con otro nombre
+        CREATE INDEX IF NOT EXISTS idx_factura_folio_id ON factura (folio, id);
+        """,
+    ),
+]
+
+
+def aplicar_migraciones() -> List[str]:
+    """Aplica las migraciones pendientes. Retorna los ids aplicados en esta llamada."""
+    aplicadas: List[str] = []
+    with pooled_connection() as conn:
+        if conn is None:
+            print("[-] Migraciones: sin conexión BD")
+            return aplicadas
+        cur = conn.cursor()
+        cur.execute(
+            """
+            CREATE TABLE IF NOT EXISTS schema_migraciones (
+                id VARCHAR(100) PRIMARY KEY,
+                aplicada TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+            """
+        )
+        conn.commit()
+        for mig_id, sql in MIGRACIONES:
+            try:
+                cur.execute("SELECT pg_advisory_xact_lock(hashtext(%s))", (_LOCK_KEY,))
+                cur.execute("SELECT 1 FROM schema_migraciones WHERE id = %s", (mig_id,))
+                if cur.fetchone():
+                    conn.commit()
+                    continue
+                cur.execute(sql)
+                cur.execute("INSERT INTO schema_migraciones (id) VALUES (%s)", (mig_id,))
+                conn.commit()
+                aplicadas.append(mig_id)
+                print(f"[+] Migración aplicada: {mig_id}")
+            except Exception as e:
+                conn.rollback()
+                print(f"[-] Error aplicando migración {mig_id}: {e}")
+                break
+        cur.close()
+    if aplicadas:
+        from database.schema import schema_registry
+        schema_registry.reload()
+    return aplicadas
+
+
+if __name__ == "__main__":
+    aplicar_migraciones()
@@ -0,0 +1,136 @@
+"""
+Registro de capacidades del esquema PostgreSQL.
+
+Introspecta una vez por proceso (o al llamar `reload()`) los tipos de columna,
+las restricciones/índices únicos y los índices de las tablas de facturación, para
+que los modelos no consulten el catálogo en cada petición. Por ejemplo, el tipo de
+`facturadocumento.pdf` (BYTEA o TEXT) o si `uuid` es único y admite ON CONFLICT.
+"""
+import threading
+import time
+from typing import Dict, List, Optional, Sequence
+
+from database.connection import pooled_connection
+
+TABLAS = (
+    "factura",
+    "facturadocumento",
+    "facturaimpuesto",
+    "facturareceptor",
+    "detallefactura",
+    "producto",
+    "impuesto",
+    "receptor",
+    "logs",
+)
+
+
+class SchemaRegistry:
+    """Caché de columnas, restricciones únicas e índices de las tablas de la app."""
+
+    # Si la BD no respondió, no se reintenta la introspección antes de este plazo (segundos)
+    RETRY_AFTER = 30.0
+
+    def __init__(self, tables: Sequence[str] = TABLAS):
+        self.tables = tuple(t.lower() for t in tables)
+        self._lock = threading.Lock()
+        self._loaded = False
+        self._last_attempt = 0.0
+        self._columns: Dict[str, Dict[str, str]] = {}
+        # {tabla: {nombre_indice: {"columns": [...], "unique": bool, "primary": bool, "partial": bool}}}
+        self._indexes: Dict[str, Dict[str, Dict]] = {}
+
+    def _introspect(self, cur):
+        columns: Dict[str, Dict[str, str]] = {t: {} for t in self.tables}
+        cur.execute(
+            """
+            SELECT table_name, column_name, data_type
+            FROM information_schema.columns
+            WHERE table_schema = 'public' AND table_name = ANY(%s)
+            """,
+            (list(self.tables),),
+        )
+        for table, column, data_type in cur.fetchall():
+            columns[table][column] = data_type.lower()
+
+        indexes: Dict[str, Dict[str, Dict]] = {t: {} for t in self.tables}
+        cur.execute(
+            """
+            SELECT t.relname, i.relname, ix.indisunique, ix.indisprimary, ix.indpred IS NOT NULL,
+                   array_agg(a.attname::text ORDER BY k.ord)
+            FROM pg_index ix
+            JOIN pg_class t ON t.oid = ix.indrelid
+            JOIN pg_class i ON i.oid = ix.indexrelid
+            JOIN pg_namespace n ON n.oid = t.relnamespace
+            JOIN LATERAL unnest(ix.indkey) WITH ORDINALITY AS k(attnum, ord) ON true
+            JOIN pg_attribute a ON a.attrelid = t.oid AND a.attnum = k.attnum
+            WHERE n.nspname = 'public' AND t.relname = ANY(%s)
+            GROUP BY t.relname, i.relname, ix.indisunique, ix.indisprimary, ix.indpred
+            """,
+            (list(self.tables),),
+        )
+        for table, index, unique, primary, partial, cols in cur.fetchall():
+            indexes[table][index] = {"columns": list(cols), "unique": unique, "primary": primary, "partial": partial}
+        return columns, indexes
+
+    def load(self, force: bool = False) -> bool:
+        """Introspecta el esquema si aún no se hizo (o siempre con `force`). Retorna si está cargado."""
+        if self._loaded and not force:
+            return True
+        with self._lock:
+            if self._loaded and not force:
+                return True
+            if not force and time.monotonic() - self._last_attempt < self.RETRY_AFTER and self._last_attempt:
+                return False
+            self._last_attempt = time.monotonic()
+            try:
+                with pooled_connection() as conn:
+                    if conn is None:
+                        return False
+                    cur = conn.cursor()
+                    self._columns, self._indexes = self._introspect(cur)
+                    cur.close()
+                self._loaded = True
+                print(f"[schema] Esquema introspectado: {len(self._columns)} tablas")
+            except Exception as e:
+                print(f"[schema] No se pudo introspectar el esquema: {e}")
+            return self._loaded
+
+    def reload(self) -> bool:
+        """Vuelve a introspectar (p. ej. tras aplicar una migración)."""
+        return self.load(force=True)
+
+    def column_type(self, table: str, column: str) -> Optional[str]:
+        """Tipo (`data_type` de information_schema) de la columna, o None si no existe/no se sabe."""
+        if not self.load():
+            return None
+        return self._columns.get(table.lower(), {}).get(column.lower())
+
+    def has_column(self, table: str, column: str) -> bool:
+        return self.column_type(table, column) is not None
+
+    def is_unique(self, table: str, columns: Sequence[str]) -> bool:
+        """True si existe un índice único no parcial exactamente sobre esas columnas (apto para ON CONFLICT)."""
+        if not self.load():
+            return False
+        wanted = {c.lower() for c in columns}
+        return any(
+            ix["unique"] and not ix["partial"] and set(ix["columns"]) == wanted
+            for ix in self._indexes.get(table.lower(), {}).values()
+        )
+
+    def has_index(self, table: str, columns: Sequence[str]) -> bool:
+        """True si algún índice empieza por esas columnas, en ese orden."""
+        if not self.load():
+            return False
+        wanted: List[str] = [c.lower() for c in columns]
+        return any(
+            ix["columns"][: len(wanted)] == wanted
+            for ix in self._indexes.get(table.lower(), {}).values()
+        )
+
+    def snapshot(self) -> Dict:
+        return {"cargado": self._loaded, "columnas": self._columns, "indices": self._indexes}
+
+
+schema_registry = SchemaRegistry()
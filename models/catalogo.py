@@ -0,0 +1,126 @@
+"""
+Caché en proceso de ids del catálogo (Producto, Impuesto, Receptor).
+
+Estos ids casi no cambian (pocas pizzas, una tasa de IVA, clientes frecuentes), así
+que `guardar_factura` los resuelve desde memoria y solo consulta la BD en un fallo.
+
+- LRU con tamaño máximo y TTL por entrada.
+- Entradas negativas ("no existe") con TTL corto. `lookup` las devuelve como None;
+  quien va a crear la fila debe volver a consultar la BD antes del INSERT, porque
+  otro worker pudo haberla creado mientras la entrada seguía vigente.
+- Escritura diferida: los ids creados dentro de una transacción se publican con
+  `publicar()` tras el commit; si hay rollback se llama `descartar()`.
+"""
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Hashable, List, Optional, Tuple
+
+from config.settings import CATALOG_CACHE_CONFIG
+
+# Resultado de `lookup` cuando la clave no está en caché
+MISS = object()
+
+
+class CatalogCache:
+    """Caché LRU/TTL de clave → id con soporte de entradas negativas."""
+
+    def __init__(self, name: str, max_entries: int = 1024, ttl: float = 600.0, negative_ttl: float = 30.0):
+        self.name = name
+        self.max_entries = max(1, int(max_entries))
+        self.ttl = float(ttl)
+        self.negative_ttl = float(negative_ttl)
+        self._data: "OrderedDict[Hashable, Tuple[Optional[int], float]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._stats = {"hits": 0, "negative_hits": 0, "misses": 0, "evictions": 0, "invalidations": 0}
+
+    def lookup(self, key: Hashable):
+        """Retorna el id, None si se sabe que no existe, o `MISS` si no hay dato vigente."""
+        now = time.monotonic()
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None or entry[1] <= now:
+                if entry is not None:
+                    del self._data[key]
+                self._stats["misses"] += 1
+                return MISS
+            self._data.move_to_end(key)
+            if entry[0] is None:
+                self._stats["negative_hits"] += 1
+            else:
+                self._stats["hits"] += 1
+            return entry[0]
+
+    def _store(self, key: Hashable, value: Optional[int], ttl: float):
+        with self._lock:
+            self._data[key] = (value, time.monotonic() + ttl)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+                self._stats["evictions"] += 1
+
+    def put(self, key: Hashable, value: int):
+        self._store(key, value, self.ttl)
+
+    def put_missing(self, key: Hashable):
+        """Registra que la clave no existe en BD (entrada negativa)."""
+        self._store(key, None, self.negative_ttl)
+
+    def invalidate(self, key: Hashable):
+        with self._lock:
+            if self._data.pop(key, None) is not None:
+                self._stats["invalidations"] += 1
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def stats(self) -> Dict:
+        with self._lock:
+            total = self._stats["hits"] + self._stats["negative_hits"] + self._stats["misses"]
+            hit_ratio = (self._stats["hits"] + self._stats["negative_hits"]) / total if total else 0.0
+            return {"entries": len(self._data), "hit_ratio": round(hit_ratio, 4), **self._stats}
+
+
+def _nueva_cache(name: str) -> CatalogCache:
+    return CatalogCache(
+        name,
+        max_entries=CATALOG_CACHE_CONFIG["max_entries"],
+        ttl=CATALOG_CACHE_CONFIG["ttl_seconds"],
+        negative_ttl=CATALOG_CACHE_CONFIG["negative_ttl_seconds"],
+    )
+
+
+productos_cache = _nueva_cache("producto")
+impuestos_cache = _nueva_cache("impuesto")
+receptores_cache = _nueva_cache("receptor")
+
+
+def clave_impuesto(tipo: str, tasa) -> Tuple[str, float]:
+    return (tipo, round(float(tasa), 2))
+
+
+def registrar(pendientes: Optional[List], cache: CatalogCache, key: Hashable, value: int):
+    """Guarda en caché ya mismo, o difiere hasta el commit si se pasa `pendientes`."""
+    if pendientes is None:
+        cache.put(key, value)
+    else:
+        pendientes.append((cache, key, value))
+
+
+def publicar(pendientes: List):
+    """Publica en caché los ids resueltos/creados en una transacción ya confirmada."""
+    for cache, key, value in pendientes:
+        cache.put(key, value)
+    pendientes.clear()
+
+
+def descartar(pendientes: List):
+    """Tras un rollback: invalida las claves tocadas para no servir ids inexistentes."""
+    for cache, key, _ in pendientes:
+        cache.invalidate(key)
+    pendientes.clear()
+
+
+def stats() -> Dict:
+    return {c.name: c.stats() for c in (productos_cache, impuestos_cache, receptores_cache)}
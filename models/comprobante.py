@@ -0,0 +1,131 @@
+"""
+Modelo de cálculo de la factura (comprobante).
+
+Se construye una vez por petición a partir del carrito y es la única fuente de
+los importes: el XML, el PDF y la BD leen de aquí en lugar de recalcular cada uno
+a su manera.
+
+- Importes en `Decimal` (sin errores de punto flotante).
+- El precio unitario se redondea a centavos (ROUND_HALF_UP) al entrar: el importe
+  y el IVA salen del mismo precio que se escribe en el XML.
+- IVA por línea redondeado a centavos con ROUND_HALF_UP; el impuesto total es la
+  suma de las líneas y el total es subtotal + impuesto.
+
+Diferencias con el cálculo en float anterior a este módulo, solo con precios con
+centavos: un IVA de medio centavo exacto (p. ej. 12.50 x 3 -> 7.125) ahora sube a
+7.13 (antes `round()` daba 7.12), y un precio con más de dos decimales se redondea
+antes de multiplicar (antes el XML mostraba el precio redondeado pero el importe
+usaba el original). Los casos `iva_medio_centavo` y `precio_tres_decimales` de
+test_factura.py fijan los valores nuevos.
+- `__slots__` en las clases: son objetos pequeños que se crean por cada factura.
+
+En el flujo de /generar-xml el comprobante viaja junto al XML serializado y nadie
+vuelve a parsear ese XML; `Comprobante.desde_xml` queda solo para documentos
+cargados de disco o de la BD.
+"""
+import xml.etree.ElementTree as ET
+from datetime import datetime
+from decimal import ROUND_HALF_UP, Decimal
+from typing import Dict, List, Optional
+
+TASA_IVA = Decimal("19.00")
+CENTAVOS = Decimal("0.01")
+
+
+def a_decimal(valor) -> Decimal:
+    """Convierte precios/cantidades (int, float, str o Decimal) sin arrastrar el error binario del float."""
+    if isinstance(valor, Decimal):
+        return valor
+    if isinstance(valor, float):
+        return Decimal(repr(valor))
+    return Decimal(valor if valor not in (None, "") else 0)
+
+
+def impuesto_de(base: Decimal, tasa: Decimal = TASA_IVA) -> Decimal:
+    return (base * tasa / 100).quantize(CENTAVOS, rounding=ROUND_HALF_UP)
+
+
+class LineaComprobante:
+    """Una línea del carrito con su importe e IVA ya calculados."""
+
+    __slots__ = ("numero", "descripcion", "cantidad", "precio", "importe", "impuesto")
+
+    def __init__(self, numero: int, descripcion: str, cantidad, precio):
+        self.numero = numero
+        self.descripcion = descripcion
+        # La cantidad conserva su tipo original: el XML la escribe con str()
+        self.cantidad = cantidad
+        self.precio = a_decimal(precio).quantize(CENTAVOS, rounding=ROUND_HALF_UP)
+        self.importe = a_decimal(cantidad) * self.precio
+        self.impuesto = impuesto_de(self.importe)
+
+    @property
+    def codigo(self) -> str:
+        return f"PZ{self.numero:02d}"
+
+
+class Comprobante:
+    """Factura calculada: receptor, líneas y totales."""
+
+    __slots__ = ("uuid", "folio", "cliente", "lineas", "subtotal", "impuesto", "total", "tasa", "emitida")
+
+    def __init__(self, uuid: Optional[str], cliente: Dict, lineas: List[LineaComprobante], emitida: Optional[datetime] = None):
+        self.asignar_uuid(uuid)
+        self.cliente = cliente
+        self.lineas = lineas
+        self.tasa = TASA_IVA
+        self.emitida = emitida or datetime.now()
+        self.subtotal = sum((l.importe for l in lineas), Decimal(0))
+        self.impuesto = sum((l.impuesto for l in lineas), Decimal(0))
+        self.total = self.subtotal + self.impuesto
+
+    def asignar_uuid(self, uuid: Optional[str]):
+        """Fija el uuid y el folio que sale de él; /generar-xml valida el carrito antes de pedir folio."""
+        self.uuid = uuid
+        # Extraer folio del uuid (ej: "FAC-41" -> "41")
+        self.folio = uuid.split("-")[-1] if uuid and "-" in uuid else "0"
+
+    @classmethod
+    def desde_carrito(cls, uuid: Optional[str], cliente: Dict, carrito: List[Dict], emitida: Optional[datetime] = None) -> "Comprobante":
+        lineas = [
+            LineaComprobante(i, item["nombre"], item["cantidad"], item["precio"])
+            for i, item in enumerate(carrito, 1)
+        ]
+        return cls(uuid, cliente or {}, lineas, emitida)
+
+    @classmethod
+    def desde_xml(cls, xml_text: str) -> "Comprobante":
+        """Reconstruye el comprobante de un XML generado por `services.xml_generator`.
+
+        Los importes se recalculan desde las líneas con las mismas reglas.
+        """
+        root = ET.fromstring(xml_text)
+        enc = root.find("Encabezado")
+        fecha = f"{enc.findtext('fecha', default='')} {enc.findtext('hora', default='00:00:00')}"
+        try:
+            emitida = datetime.strptime(fecha, "%Y-%m-%d %H:%M:%S")
+        except ValueError:
+            emitida = None
+        cliente = {"nombre": enc.findtext("nombrereceptor", default="Cliente"), "email": enc.findtext("mailreceptor", default="")}
+        lineas = []
+        for i, det in enumerate(root.findall("Detalle/Det"), 1):
+            cantidad = det.findtext("cantidad", default="1")
+            lineas.append(LineaComprobante(
+                int(det.findtext("idConcepto", default=str(i)) or i),
+                det.findtext("descripcion", default=""),
+                int(cantidad) if cantidad.isdigit() else a_decimal(cantidad),
+                det.findtext("precioUnitario", default="0"),
+            ))
+        return cls(enc.findtext("llavecomprobante", default=""), cliente, lineas, emitida)
+
+    @property
+    def cliente_nombre(self):
+        return self.cliente.get("nombre", "Cliente")
+
+    @property
+    def cliente_email(self):
+        return self.cliente.get("email", "")
+
+    def impuestos(self) -> List[Dict]:
+        """Impuestos agregados en la forma que usa la BD: [{tipo, tasa, base, valor}]."""
+        return [{"tipo": "IVA", "tasa": self.tasa, "base": self.subtotal, "valor": self.impuesto}]
@@ -0,0 +1,174 @@
+"""
+Consulta de logs (PostgreSQL `logs` y colecciones Mongo de facturación y sistema).
+
+- Paginación por clave: más recientes primero, ordenados por (ts, _id) en Mongo y
+  (timestamp, id) en PostgreSQL; cada página pide lo anterior al cursor `siguiente`
+  de la página previa, así el costo no crece con las páginas.
+- Las consultas tienen la forma de los índices compuestos (nivel, módulo, ts): ver
+  `INDICES` en `services.log_registry` y la migración `006_indices_consulta_logs`.
+- Proyección: el traceback (`error` / `error_details`) solo se lee si se pide.
+- `linea_de_tiempo` devuelve todas las fases registradas de una factura (por uuid).
+"""
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+
+try:
+    from bson import ObjectId
+except Exception:
+    ObjectId = None  # Sin pymongo no hay consultas Mongo
+
+LIMITE_MAXIMO = 500
+LIMITE_LINEA_DE_TIEMPO = 1000
+
+# Campos que devuelve la API para cada documento Mongo (el _id se devuelve como "id")
+CAMPOS_MONGO = ("ts", "level", "module", "message", "uuid", "phase", "data")
+
+
+# ---------- cursor ----------
+def codificar_cursor(ts: datetime, id_) -> str:
+    """Cursor "ts|id" (el id lleva prefijo de tipo: ObjectId, texto o entero)."""
+    if ObjectId is not None and isinstance(id_, ObjectId):
+        clave = f"o:{id_}"
+    elif isinstance(id_, int):
+        clave = f"i:{id_}"
+    else:
+        clave = f"s:{id_}"
+    return f"{ts.isoformat()}|{clave}"
+
+
+def decodificar_cursor(cursor: str) -> Tuple[datetime, object]:
+    """Inverso de `codificar_cursor`. Lanza ValueError si el cursor no es válido."""
+    try:
+        ts, clave = cursor.split("|", 1)
+        tipo, valor = clave.split(":", 1)
+        ts = datetime.fromisoformat(ts)
+        if tipo == "o" and ObjectId is not None:
+            return ts, ObjectId(valor)
+        if tipo == "i":
+            return ts, int(valor)
+        if tipo == "s":
+            return ts, valor
+    except Exception:
+        pass
+    raise ValueError(f"Cursor inválido: {cursor}")
+
+
+def _limite(limite) -> int:
+    return max(1, min(int(limite), LIMITE_MAXIMO))
+
+
+# ---------- MongoDB ----------
+def proyeccion_mongo(con_error: bool = False) -> Dict:
+    """Proyección de `CAMPOS_MONGO` (más `error` si se pide el traceback)."""
+    proyeccion = {c: 1 for c in CAMPOS_MONGO}
+    if con_error:
+        proyeccion["error"] = 1
+    return proyeccion
+
+
+def documento_api(doc: Dict, con_error: bool = False) -> Dict:
+    """Documento Mongo con los campos que devuelve la API (el `_id` va como texto en `id`)."""
+    fila = {"id": str(doc["_id"])}
+    fila.update({c: doc.get(c) for c in CAMPOS_MONGO})
+    if con_error:
+        fila["error"] = doc.get("error")
+    return fila
+
+
+def _antes_de_mongo(ts: datetime, id_) -> List[Dict]:
+    """Condición "antes de (ts, _id)" en el orden descendente de Mongo.
+
+    Conviven _id ObjectId (driver) y texto (clave del spool). En BSON un ObjectId va
+    después de un texto, y `$lt` solo compara valores del mismo tipo: con el mismo ts,
+    tras un ObjectId vienen los ObjectId menores y todos los de texto.
+    """
+    condiciones = [{"ts": {"$lt": ts}}, {"ts": ts, "_id": {"$lt": id_}}]
+    if ObjectId is not None and isinstance(id_, ObjectId):
+        condiciones.append({"ts": ts, "_id": {"$type": "string"}})
+    return condiciones
+
+
+def buscar_mongo(collection, *, limite: int = 50, level: Optional[str] = None, module: Optional[str] = None,
+                 uuid: Optional[str] = None, antes_de: Optional[str] = None, con_error: bool = False) -> Dict:
+    """Una página de la colección, más recientes primero.
+
+    Retorna {"logs": [...], "siguiente": cursor para `antes_de` o None si es la última página}.
+    """
+    limite = _limite(limite)
+    query: Dict = {}
+    if level:
+        query["level"] = level
+    if module:
+        query["module"] = module
+    if uuid:
+        query["uuid"] = uuid
+    if antes_de:
+        ts, id_ = decodificar_cursor(antes_de)
+        query["$or"] = _antes_de_mongo(ts, id_)
+    cursor = (
+        collection.find(query, proyeccion_mongo(con_error))
+        .sort([("ts", -1), ("_id", -1)])
+        .limit(limite + 1)
+    )
+    docs = list(cursor)
+    hay_mas = len(docs) > limite
+    docs = docs[:limite]
+    return {
+        "logs": [documento_api(d, con_error) for d in docs],
+        "siguiente": codificar_cursor(docs[-1]["ts"], docs[-1]["_id"]) if hay_mas else None,
+    }
+
+
+def linea_de_tiempo(collection, uuid: str, con_error: bool = False) -> List[Dict]:
+    """Eventos de una factura en orden cronológico (índice uuid+ts)."""
+    cursor = (
+        collection.find({"uuid": uuid}, proyeccion_mongo(con_error))
+        .sort([("ts", 1), ("_id", 1)])
+        .limit(LIMITE_LINEA_DE_TIEMPO)
+    )
+    return [documento_api(d, con_error) for d in cursor]
+
+
+# ---------- PostgreSQL ----------
+def buscar_postgres(conn, *, limite: int = 50, level: Optional[str] = None, module: Optional[str] = None,
+                    antes_de: Optional[str] = None, con_error: bool = False) -> Dict:
+    """Una página de la tabla `logs`, más recientes primero (mismo formato que `buscar_mongo`)."""
+    limite = _limite(limite)
+    columnas = ["id", "level", "message", "module", "timestamp"] + (["error_details"] if con_error else [])
+    where, params = [], []
+    if level:
+        where.append("level = %s")
+        params.append(level)
+    if module:
+        where.append("module = %s")
+        params.append(module)
+    if antes_de:
+        ts, id_ = decodificar_cursor(antes_de)
+        where.append("(timestamp, id) < (%s, %s)")
+        params.extend([ts, id_])
+    sql = f"SELECT {', '.join(columnas)} FROM logs"
+    if where:
+        sql += " WHERE " + " AND ".join(where)
+    sql += " ORDER BY timestamp DESC, id DESC LIMIT %s"
+    params.append(limite + 1)
+
+    cur = conn.cursor()
+    try:
+        cur.execute(sql, params)
+        rows = cur.fetchall()
+    finally:
+        cur.close()
+        conn.rollback()
+    hay_mas = len(rows) > limite
+    rows = rows[:limite]
+    logs = []
+    for row in rows:
+        fila = dict(zip(columnas, row))
+        fila["ts"] = fila.pop("timestamp")
+        if con_error:
+            fila["error"] = fila.pop("error_details")
+        logs.append(fila)
+    return {
+        "logs": logs,
+        "siguiente": codificar_cursor(rows[-1][4], rows[-1][0]) if hay_mas else None,
+    }
@@ -0,0 +1,211 @@
+"""
+Formato de almacenamiento del PDF en FacturaDocumento.
+
+Formato "raw" (por defecto): el PDF se guarda una sola vez como bytes en
+`pdf_blob`, opcionalmente comprimido (`pdf_codec`: none, zlib o zstd), junto con
+su `pdf_sha256` y `pdf_len` (del PDF sin comprimir). `base64doc` y `pdf` quedan
+en NULL; el Base64 solo se calcula en la API cuando el cliente lo pide.
+
+Formato "base64": el anterior (`base64doc` y, si la columna es BYTEA, `pdf`).
+También se usa si la migración 002 (columnas nuevas) no está aplicada.
+
+Compactar filas antiguas: python -m models.documento --compactar
+"""
+import base64
+import hashlib
+import zlib
+from typing import Dict, Optional, Sequence, Tuple
+
+import psycopg2
+
+from config.settings import DOCUMENT_STORAGE_CONFIG
+from database.connection import pooled_connection
+from database.schema import schema_registry
+
+try:
+    import zstandard
+except Exception:
+    zstandard = None  # Opcional: sin el paquete se usa zlib
+
+CODECS = ("none", "zlib", "zstd")
+
+
+def codec_configurado() -> str:
+    codec = DOCUMENT_STORAGE_CONFIG["codec"]
+    if codec not in CODECS:
+        print(f"[documento] Códec desconocido '{codec}', se usa 'none'")
+        return "none"
+    if codec == "zstd" and zstandard is None:
+        print("[documento] zstandard no instalado, se usa zlib")
+        return "zlib"
+    return codec
+
+
+def formato_raw_disponible() -> bool:
+    """True si se configuró el formato raw y la tabla tiene las columnas de la migración 002."""
+    return DOCUMENT_STORAGE_CONFIG["format"] == "raw" and schema_registry.has_column("facturadocumento", "pdf_blob")
+
+
+def comprimir(data: bytes, codec: str) -> bytes:
+    level = DOCUMENT_STORAGE_CONFIG["level"]
+    if codec == "zlib":
+        return zlib.compress(data, level)
+    if codec == "zstd":
+        return zstandard.ZstdCompressor(level=level).compress(data)
+    return data
+
+
+def descomprimir(payload: bytes, codec: Optional[str]) -> bytes:
+    if codec == "zlib":
+        return zlib.decompress(payload)
+    if codec == "zstd":
+        if zstandard is None:
+            raise RuntimeError("PDF comprimido con zstd pero el paquete zstandard no está instalado")
+        return zstandard.ZstdDecompressor().decompress(payload)
+    return payload
+
+
+def columnas_pdf(pdf_bytes: bytes) -> Dict[str, object]:
+    """Valores de las columnas PDF de FacturaDocumento según el formato vigente.
+
+    Incluye en NULL las columnas del otro formato, para no dejar una copia vieja.
+    """
+    raw = formato_raw_disponible()
+    cols: Dict[str, object] = {}
+    if raw:
+        codec = codec_configurado()
+        cols["pdf_blob"] = psycopg2.Binary(comprimir(pdf_bytes, codec))
+        cols["pdf_codec"] = codec
+        cols["pdf_sha256"] = hashlib.sha256(pdf_bytes).hexdigest()
+        cols["pdf_len"] = len(pdf_bytes)
+        cols["base64doc"] = None
+        cols["pdf"] = None
+        return cols
+
+    cols["base64doc"] = base64.b64encode(pdf_bytes).decode("ascii")
+    # Bytes solo si la columna es BYTEA; si no, se usa base64doc
+    cols["pdf"] = psycopg2.Binary(pdf_bytes) if schema_registry.column_type("facturadocumento", "pdf") == "bytea" else None
+    if schema_registry.has_column("facturadocumento", "pdf_blob"):
+        cols.update({"pdf_blob": None, "pdf_codec": None, "pdf_sha256": None, "pdf_len": None})
+    return cols
+
+
+def _pdf_desde_fila(uuid: str, pdf_blob, pdf_codec, pdf_sha256, pdf_value, b64_text) -> Optional[bytes]:
+    if pdf_blob is not None:
+        data = descomprimir(bytes(pdf_blob), pdf_codec)
+        if pdf_sha256 and hashlib.sha256(data).hexdigest() != pdf_sha256:
+            print(f"[documento] sha256 no coincide para {uuid}, se ignora pdf_blob")
+        else:
+            return data
+    if pdf_value is not None:
+        # Columna BYTEA → memoryview; columna TEXT → no es el PDF binario
+        if isinstance(pdf_value, (bytes, memoryview)):
+            return bytes(pdf_value)
+    if b64_text:
+        try:
+            return base64.b64decode(b64_text)
+        except Exception:
+            print(f"[documento] base64doc inválido para {uuid}")
+    return None
+
+
+def cargar_documento(uuid: str) -> Optional[Tuple[Optional[str], Optional[bytes]]]:
+    """Retorna (xml, pdf_bytes) del documento, o None si no existe / no hay BD.
+
+    Lee cualquiera de los formatos (raw, BYTEA o base64doc).
+    """
+    tiene_blob = schema_registry.has_column("facturadocumento", "pdf_blob")
+    cols = "xml, pdf, base64doc" + (", pdf_blob, pdf_codec, pdf_sha256" if tiene_blob else "")
+    with pooled_connection() as conn:
+        if conn is None:
+            return None
+        cur = conn.cursor()
+        cur.execute(f"SELECT {cols} FROM FacturaDocumento WHERE uuid = %s LIMIT 1", (uuid,))
+        row = cur.fetchone()
+        cur.close()
+    if not row:
+        return None
+    xml_text, pdf_value, b64_text = row[:3]
+    pdf_blob, pdf_codec, pdf_sha256 = row[3:] if tiene_blob else (None, None, None)
+    return xml_text, _pdf_desde_fila(uuid, pdf_blob, pdf_codec, pdf_sha256, pdf_value, b64_text)
+
+
+def cargar_documentos(uuids: Sequence[str]) -> Optional[Dict[str, Tuple[Optional[str], Optional[bytes]]]]:
+    """Versión por lotes de `cargar_documento`: {uuid: (xml, pdf_bytes)} en una sola consulta.
+
+    Los uuid sin documento no aparecen en el resultado. None si no hay BD.
+    """
+    if not uuids:
+        return {}
+    tiene_blob = schema_registry.has_column("facturadocumento", "pdf_blob")
+    cols = "uuid, xml, pdf, base64doc" + (", pdf_blob, pdf_codec, pdf_sha256" if tiene_blob else "")
+    with pooled_connection() as conn:
+        if conn is None:
+            return None
+        cur = conn.cursor()
+        cur.execute(f"SELECT {cols} FROM FacturaDocumento WHERE uuid = ANY(%s) ORDER BY id DESC", (list(uuids),))
+        rows = cur.fetchall()
+        cur.close()
+        conn.rollback()
+    documentos = {}
+    for row in rows:
+        uuid, xml_text, pdf_value, b64_text = row[:4]
+        if uuid in documentos:
+            continue
+        pdf_blob, pdf_codec, pdf_sha256 = row[4:] if tiene_blob else (None, None, None)
+        documentos[uuid] = (xml_text, _pdf_desde_fila(uuid, pdf_blob, pdf_codec, pdf_sha256, pdf_value, b64_text))
+    return documentos
+
+
+def compactar_documentos(lote: int = 200) -> int:
+    """Pasa al formato raw las filas guardadas con base64doc/pdf. Retorna cuántas migró.
+
+    Trabaja por lotes (una transacción por lote) para no bloquear la tabla.
+    """
+    if not formato_raw_disponible():
+        print("[documento] Formato raw no disponible (DOC_STORAGE_FORMAT o migración 002)")
+        return 0
+    pdf_bytea = schema_registry.column_type("facturadocumento", "pdf") == "bytea"
+    total = 0
+    ultimo_id = 0
+    while True:
+        with pooled_connection() as conn:
+            if conn is None:
+                break
+            cur = conn.cursor()
+            cur.execute(
+                """
+                SELECT id, uuid, pdf, base64doc FROM FacturaDocumento
+                WHERE id > %s AND pdf_blob IS NULL AND (base64doc IS NOT NULL OR pdf IS NOT NULL)
+                ORDER BY id
+                LIMIT %s
+                FOR UPDATE SKIP LOCKED
+                """,
+                (ultimo_id, lote),
+            )
+            filas = cur.fetchall()
+            if not filas:
+                cur.close()
+                break
+            for doc_id, uuid, pdf_value, b64_text in filas:
+                ultimo_id = doc_id
+                data = _pdf_desde_fila(uuid, None, None, None, pdf_value if pdf_bytea else None, b64_text)
+                if data is None:
+                    continue
+                cols = columnas_pdf(data)
+                sets = ", ".join(f"{c} = %s" for c in cols)
+                cur.execute(f"UPDATE FacturaDocumento SET {sets} WHERE id = %s", (*cols.values(), doc_id))
+                total += 1
+            conn.commit()
+            cur.close()
+        print(f"[documento] Compactados {total} documentos (último id={ultimo_id})")
+    return total
+
+
+if __name__ == "__main__":
+    import sys
+
+    if "--compactar" in sys.argv:
+        compactar_documentos()
+    else:
+        print("Uso: python -m models.documento --compactar")
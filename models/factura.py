@@ -1,150 +1,91 @@
 import os
-import base64
 from typing import Optional, List, Dict
-import xml.etree.ElementTree as ET
 from datetime import datetime
-from database.connection import get_connection
-
-FOLIO_FILE = os.path.join(os.path.dirname(os.path.dirname(__file__)), "folio.txt")
-
+import psycopg2
+from psycopg2.extras import execute_values
+from config.settings import FACTURA_BULK_INSERT
+from database.connection import pooled_connection
+from database.schema import schema_registry
+from models.folio import folio_allocator
+from models.documento import columnas_pdf
+from models.comprobante import Comprobante, LineaComprobante
+from models.monto_letras import numero_a_letras
+from models import catalogo
+from models.catalogo import MISS, productos_cache, impuestos_cache, receptores_cache
 
 def obtener_proximo_folio() -> int:
-    """Devuelve un folio único basado en el mayor entre BD y `folio.txt` + 1.
+    """Devuelve el próximo folio desde la secuencia de BD (ver `models.folio`).
 
-    No modifica el esquema de la BD. Actualiza `folio.txt` para mantener consistencia.
+    Es seguro entre hilos y entre workers; si la BD no está disponible continúa desde `folio.txt`.
     """
-    file_val = 0
-    try:
-        if os.path.exists(FOLIO_FILE):
-            with open(FOLIO_FILE, "r", encoding="utf-8") as f:
-                contenido = (f.read() or "0").strip()
-                file_val = int(contenido or 0)
-    except Exception:
-        file_val = 0
-
-    db_val = 0
-    try:
-        conn = get_connection()
-        if conn:
-            cur = conn.cursor()
-            cur.execute("SELECT COALESCE(MAX(folio), 0) FROM Factura;")
-            row = cur.fetchone()
-            db_val = int(row[0] or 0)
-            cur.close()
-            conn.close()
-    except Exception:
-        db_val = 0
-
-    next_val = max(file_val, db_val) + 1
-    try:
-        with open(FOLIO_FILE, "w", encoding="utf-8") as f:
-            f.write(str(next_val))
-            f.flush()
-    except Exception:
-        pass
-    return next_val
-
-def _numero_a_letras_simplificado(numero: int) -> str:
-    try:
-        n = int(numero)
-    except Exception:
-        n = 0
-    return f"CANTIDAD {n} PESOS CON 00 CENTAVOS"
+    return folio_allocator.allocate()
 
-
-def _get_or_create_receptor(cur, nit: str, nombre: str, email: str) -> int:
+def _get_or_create_receptor(cur, nit: str, nombre: str, email: str, pendientes: Optional[List] = None) -> int:
+    cached = receptores_cache.lookup(nit)
+    if cached is not None and cached is not MISS:
+        return cached
+    # Una entrada negativa pudo quedar vieja (otro worker creó la fila): se consulta antes de insertar
     cur.execute("SELECT id FROM Receptor WHERE nit=%s LIMIT 1", (nit,))
     row = cur.fetchone()
     if row:
+        catalogo.registrar(pendientes, receptores_cache, nit, row[0])
         return row[0]
     cur.execute(
         "INSERT INTO Receptor (nit, tipoDoc, nombre, email) VALUES (%s, %s, %s, %s) RETURNING id",
         (nit or "", "13", nombre or "", email or ""),
     )
-    return cur.fetchone()[0]
+    id_receptor = cur.fetchone()[0]
+    catalogo.registrar(pendientes, receptores_cache, nit, id_receptor)
+    return id_receptor
 
 
-def _get_or_create_producto(cur, descripcion: str, precio: float, impuesto_defecto: float = 19.0) -> int:
-    codigo = (descripcion or "PROD").upper().replace(" ", "_")[:20]
+def _get_or_create_producto(cur, descripcion: str, precio: float, impuesto_defecto: float = 19.0, pendientes: Optional[List] = None) -> int:
+    codigo = _codigo_producto(descripcion)
+    cached = productos_cache.lookup(codigo)
+    if cached is not None and cached is not MISS:
+        return cached
     cur.execute("SELECT id FROM Producto WHERE codigo=%s LIMIT 1", (codigo,))
     row = cur.fetchone()
     if row:
+        catalogo.registrar(pendientes, productos_cache, codigo, row[0])
         return row[0]
     cur.execute(
         "INSERT INTO Producto (codigo, descripcion, precio, impuestoDefecto) VALUES (%s, %s, %s, %s) RETURNING id",
         (codigo, descripcion or codigo, float(precio), float(impuesto_defecto)),
     )
-    return cur.fetchone()[0]
+    id_prod = cur.fetchone()[0]
+    catalogo.registrar(pendientes, productos_cache, codigo, id_prod)
+    return id_prod
 
 
-def _get_or_create_impuesto(cur, tipo: str = "IVA", tasa: float = 19.0) -> int:
+def _get_or_create_impuesto(cur, tipo: str = "IVA", tasa: float = 19.0, pendientes: Optional[List] = None) -> int:
+    clave = catalogo.clave_impuesto(tipo, tasa)
+    cached = impuestos_cache.lookup(clave)
+    if cached is not None and cached is not MISS:
+        return cached
     cur.execute("SELECT id FROM Impuesto WHERE tipo=%s AND tasa=%s LIMIT 1", (tipo, float(tasa)))
     row = cur.fetchone()
     if row:
+        catalogo.registrar(pendientes, impuestos_cache, clave, row[0])
         return row[0]
     cur.execute(
         "INSERT INTO Impuesto (tipo, tasa) VALUES (%s, %s) RETURNING id",
         (tipo, float(tasa)),
     )
-    return cur.fetchone()[0]
+    imp_id = cur.fetchone()[0]
+    catalogo.registrar(pendientes, impuestos_cache, clave, imp_id)
+    return imp_id
 
 
-def _map_tipo_impuesto(xml_code: str) -> str:
-    if (xml_code or "").strip() == "01":
-        return "IVA"
-    if (xml_code or "").strip() == "02":
-        return "RET"
-    if (xml_code or "").strip() == "03":
-        return "INC"
-    return "IMP"
+def _codigo_producto(descripcion: str) -> str:
+    return (descripcion or "PROD").upper().replace(" ", "_")[:20]
 
 
-def _parse_impuestos_from_xml(xml_text: Optional[str]) -> List[Dict]:
-    """Extrae impuestos desde el XML en forma de lista {tipo, tasa, base, valor}."""
-    result: List[Dict] = []
-    if not xml_text:
-        return result
-    try:
-        root = ET.fromstring(xml_text)
-        for imp in root.findall(".//Impuestos/Imp"):
-            tasa = float(imp.findtext("tasa", default="0") or 0)
-            base = float(imp.findtext("baseimpuestos", default="0") or 0)
-            valor = float(imp.findtext("importe", default="0") or 0)
-            tipo = _map_tipo_impuesto(imp.findtext("tipoImpuesto", default=""))
-            result.append({"tipo": tipo, "tasa": tasa, "base": base, "valor": valor})
-        if not result:
-            # Fallback: usar encabezado si no hay nodos Imp
-            enc = root.find("Encabezado")
-            if enc is not None:
-                base = float(enc.findtext("baseimpuesto", default="0") or 0)
-                valor = float(enc.findtext("totalimpuestos", default="0") or 0)
-                if base or valor:
-                    result.append({"tipo": "IVA", "tasa": 19.0, "base": base, "valor": valor})
-    except Exception:
-        pass
-    return result
-
-
-def guardar_factura(*, folio: int, cliente_nombre: str, cliente_nit: str, cliente_email: str, subtotal: int, impuesto: int, total: int, carrito: Optional[List[Dict]] = None, xml_text: Optional[str] = None):
-    """Inserta en el esquema existente y retorna el id de Factura.
-
-    No altera tablas; usa tablas: Factura, Receptor, FacturaReceptor, DetalleFactura, Impuesto, FacturaImpuesto.
-    """
-    conn = get_connection()
-    if conn is None:
-        print("[guardar_factura] Sin conexión BD")
-        return None
-    cur = conn.cursor()
-    print(f"[guardar_factura] Iniciando folio={folio} subtotal={subtotal} impuesto={impuesto} total={total}")
-    try:
-
-        # Receptor
-        id_receptor = _get_or_create_receptor(cur, cliente_nit, cliente_nombre, cliente_email)
-        print(f"[guardar_factura] id_receptor={id_receptor}")
-
-    # Cabecera factura
-        cur.execute(
-            """
+def _insertar_cabecera_bulk(cur, folio: int, subtotal, impuesto, total, id_receptor: int) -> int:
+    """Inserta la cabecera de Factura y su relación con el receptor en una sola sentencia."""
+    cur.execute(
+        """
+        WITH f AS (
             INSERT INTO Factura (
                 folio, prefijo, tipoComprobante, fecha, hora, fechaVencimiento,
                 subtotal, impuesto, total, montoLetra, estado, idEmisor, idResolucion
@@ -152,136 +93,275 @@ def guardar_factura(*, folio: int, cliente_nombre: str, cliente_nit: str, client
                 %s, 'FAC', '01', CURRENT_DATE, CURRENT_TIME, CURRENT_DATE,
                 %s, %s, %s, %s, 'EMITIDA', NULL, NULL
             ) RETURNING id
-            """,
-            (int(folio), float(subtotal), float(impuesto), float(total), _numero_a_letras_simplificado(total)),
+        ), r AS (
+            INSERT INTO FacturaReceptor (idFactura, idReceptor)
+            SELECT id, %s FROM f
+            ON CONFLICT DO NOTHING
         )
-        factura_id = cur.fetchone()[0]
-        print(f"[guardar_factura] factura_id={factura_id}")
+        SELECT id FROM f
+        """,
+        (int(folio), float(subtotal), float(impuesto), float(total), numero_a_letras(total), id_receptor),
+    )
+    return cur.fetchone()[0]
 
-    # Relación Factura-Receptor
-        cur.execute(
-            "INSERT INTO FacturaReceptor (idFactura, idReceptor) VALUES (%s, %s) ON CONFLICT DO NOTHING",
-            (factura_id, id_receptor),
+
+def _resolver_productos_bulk(cur, lineas: List[LineaComprobante], impuesto_defecto: float = 19.0, pendientes: Optional[List] = None) -> Dict[str, int]:
+    """Devuelve {codigo: id}; lo que no está en caché se crea/resuelve con un solo upsert."""
+    ids: Dict[str, int] = {}
+    productos = {}
+    for linea in lineas:
+        codigo = _codigo_producto(linea.descripcion)
+        if codigo in ids or codigo in productos:
+            continue
+        cached = productos_cache.lookup(codigo)
+        if cached is not None and cached is not MISS:
+            ids[codigo] = cached
+        else:
+            productos[codigo] = (codigo, linea.descripcion or codigo, float(linea.precio), float(impuesto_defecto))
+    if not productos:
+        return ids
+    filas = execute_values(
+        cur,
+        """
+        WITH entrada (codigo, descripcion, precio, impuestoDefecto) AS (VALUES %s),
+        nuevos AS (
+            INSERT INTO Producto (codigo, descripcion, precio, impuestoDefecto)
+            SELECT codigo, descripcion, precio, impuestoDefecto FROM entrada
+            ON CONFLICT (codigo) DO NOTHING
+            RETURNING id, codigo
         )
+        SELECT id, codigo FROM nuevos
+        UNION ALL
+        SELECT p.id, p.codigo FROM Producto p JOIN entrada e ON e.codigo = p.codigo
+        """,
+        list(productos.values()),
+        template="(%s, %s, %s::numeric, %s::numeric)",
+        page_size=len(productos),
+        fetch=True,
+    )
+    for id_prod, codigo in filas:
+        ids[codigo] = id_prod
+        catalogo.registrar(pendientes, productos_cache, codigo, id_prod)
+    # Un INSERT concurrente confirmado tras nuestro snapshot no aparece en ninguna rama; se resuelve uno a uno
+    for codigo, (_, descripcion, precio, imp) in productos.items():
+        if codigo not in ids:
+            ids[codigo] = _get_or_create_producto(cur, descripcion, precio, imp, pendientes=pendientes)
+    return ids
+
+
+def _insertar_detalles_bulk(cur, factura_id: int, lineas: List[LineaComprobante], pendientes: Optional[List] = None):
+    """Inserta todas las líneas de DetalleFactura con un único INSERT multi-fila."""
+    ids = _resolver_productos_bulk(cur, lineas, pendientes=pendientes)
+    filas = [
+        (factura_id, ids[_codigo_producto(l.descripcion)], int(l.cantidad), l.precio, l.importe, l.impuesto)
+        for l in lineas
+    ]
+    execute_values(
+        cur,
+        "INSERT INTO DetalleFactura (idFactura, idProducto, cantidad, precioUnitario, subtotalLinea, impuestoLinea) VALUES %s",
+        filas,
+        page_size=len(filas),
+    )
 
-    # Detalle e impuestos (si hay carrito)
-        if carrito:
-            for item in carrito:
-                id_prod = _get_or_create_producto(cur, item.get("nombre"), item.get("precio", 0))
-                cantidad = int(item.get("cantidad", 1))
-                precio_u = float(item.get("precio", 0))
-                subtotal_linea = cantidad * precio_u
-                impuesto_linea = round(subtotal_linea * 0.19, 2)
-                cur.execute(
-                    """
-                    INSERT INTO DetalleFactura (idFactura, idProducto, cantidad, precioUnitario, subtotalLinea, impuestoLinea)
-                    VALUES (%s, %s, %s, %s, %s, %s)
-                    """,
-                    (factura_id, id_prod, cantidad, precio_u, subtotal_linea, impuesto_linea),
-                )
-            print(f"[guardar_factura] Detalles insertados={len(carrito)}")
 
-    # Impuestos desde XML si se proporcionó; si no, usar totales básicos
-        impuestos_xml = _parse_impuestos_from_xml(xml_text)
-        if impuestos_xml:
-            for imp in impuestos_xml:
-                imp_id = _get_or_create_impuesto(cur, imp.get("tipo", "IVA"), float(imp.get("tasa", 0)))
-                cur.execute(
-                    """
-                    INSERT INTO FacturaImpuesto (idFactura, idImpuesto, baseGravable, valor)
-                    VALUES (%s, %s, %s, %s)
-                    ON CONFLICT (idFactura, idImpuesto) DO NOTHING
-                    """,
-                    (factura_id, imp_id, float(imp.get("base", 0)), float(imp.get("valor", 0))),
-                )
-            print(f"[guardar_factura] Impuestos XML insertados={len(impuestos_xml)}")
-        else:
-            imp_id = _get_or_create_impuesto(cur, "IVA", 19.0)
-            cur.execute(
-                """
-                INSERT INTO FacturaImpuesto (idFactura, idImpuesto, baseGravable, valor)
-                VALUES (%s, %s, %s, %s)
-                ON CONFLICT (idFactura, idImpuesto) DO NOTHING
-                """,
-                (factura_id, imp_id, float(subtotal), float(impuesto)),
-            )
-            print("[guardar_factura] Impuesto básico insertado")
-        conn.commit()
-        print("[guardar_factura] Commit OK")
-        return factura_id
-    except Exception as e:
-        print(f"[guardar_factura] ERROR {e}")
-        try:
-            conn.rollback()
-            print("[guardar_factura] Rollback ejecutado")
-        except Exception:
-            pass
-        return None
-    finally:
-        cur.close()
-        conn.close()
+def _insertar_impuestos_bulk(cur, factura_id: int, impuestos: List[Dict], pendientes: Optional[List] = None):
+    """Enlaza FacturaImpuesto en una sola sentencia.
 
+    Si todos los Impuesto están en caché es un INSERT multi-fila directo; si no, la
+    misma sentencia resuelve/crea los Impuesto y devuelve sus ids para la caché.
+    """
+    filas = [
+        (factura_id, imp.get("tipo", "IVA"), float(imp.get("tasa", 0)), float(imp.get("base", 0)), float(imp.get("valor", 0)))
+        for imp in impuestos
+    ]
+    cached_ids = [impuestos_cache.lookup(catalogo.clave_impuesto(tipo, tasa)) for _, tipo, tasa, _, _ in filas]
+    if all(i is not None and i is not MISS for i in cached_ids):
+        execute_values(
+            cur,
+            """
+            INSERT INTO FacturaImpuesto (idFactura, idImpuesto, baseGravable, valor) VALUES %s
+            ON CONFLICT (idFactura, idImpuesto) DO NOTHING
+            """,
+            [(f[0], imp_id, f[3], f[4]) for f, imp_id in zip(filas, cached_ids)],
+            page_size=len(filas),
+        )
+        return
+    resueltos = execute_values(
+        cur,
+        """
+        WITH entrada (idFactura, tipo, tasa, base, valor) AS (VALUES %s),
+        nuevos AS (
+            INSERT INTO Impuesto (tipo, tasa)
+            SELECT DISTINCT e.tipo, e.tasa FROM entrada e
+            WHERE NOT EXISTS (SELECT 1 FROM Impuesto i WHERE i.tipo = e.tipo AND i.tasa = e.tasa)
+            RETURNING id, tipo, tasa
+        ),
+        ids AS (
+            SELECT MIN(id) AS id, tipo, tasa FROM (
+                SELECT id, tipo, tasa FROM nuevos
+                UNION ALL
+                SELECT i.id, i.tipo, i.tasa FROM Impuesto i JOIN entrada e ON i.tipo = e.tipo AND i.tasa = e.tasa
+            ) t
+            GROUP BY tipo, tasa
+        ),
+        enlace AS (
+            INSERT INTO FacturaImpuesto (idFactura, idImpuesto, baseGravable, valor)
+            SELECT e.idFactura, ids.id, e.base, e.valor
+            FROM entrada e JOIN ids ON ids.tipo = e.tipo AND ids.tasa = e.tasa
+            ON CONFLICT (idFactura, idImpuesto) DO NOTHING
+        )
+        SELECT id, tipo, tasa FROM ids
+        """,
+        filas,
+        template="(%s, %s::varchar, %s::numeric(5,2), %s::numeric, %s::numeric)",
+        page_size=len(filas),
+        fetch=True,
+    )
+    for imp_id, tipo, tasa in resueltos:
+        catalogo.registrar(pendientes, impuestos_cache, catalogo.clave_impuesto(tipo, tasa), imp_id)
 
-def guardar_documento_factura(*, factura_id: Optional[int], xml_path: Optional[str], pdf_path: Optional[str], uuid: str):
-    """Guarda/actualiza en FacturaDocumento respetando el tipo real de la columna `pdf`.
 
-    Si existe registro por uuid → update con solo las columnas provistas.
-    Si no existe → insert (requiere `factura_id`).
-    No se asume tipo; se consulta el tipo de `pdf` (BYTEA o TEXT) y se envía el valor adecuado.
+def guardar_factura(*, folio: int, cliente_nombre: str, cliente_nit: str, cliente_email: str, comprobante: Optional[Comprobante] = None, xml_text: Optional[str] = None, bulk: Optional[bool] = None):
+    """Inserta en el esquema existente y retorna el id de Factura.
+
+    No altera tablas; usa tablas: Factura, Receptor, FacturaReceptor, DetalleFactura, Impuesto, FacturaImpuesto.
+    Totales, líneas e impuestos salen de `comprobante` (los mismos del XML y el PDF); aquí no se recalculan.
+    Sin comprobante (p. ej. un XML leído de disco) se reconstruye una vez desde `xml_text`.
+    En modo bulk (`FACTURA_BULK_INSERT`, por defecto activo) el número de viajes a la BD
+    no depende del tamaño del carrito: productos e impuestos se resuelven con una sola
+    sentencia y todas las líneas de detalle se insertan en un único INSERT multi-fila.
     """
-    conn = get_connection()
-    if conn is None:
-        return None
+    usar_bulk = FACTURA_BULK_INSERT if bulk is None else bulk
+    if comprobante is None:
+        if not xml_text:
+            raise ValueError("guardar_factura requiere comprobante o xml_text")
+        comprobante = Comprobante.desde_xml(xml_text)
+    subtotal, impuesto, total = comprobante.subtotal, comprobante.impuesto, comprobante.total
+    lineas = comprobante.lineas
+    impuestos = comprobante.impuestos()
+    # ids de catálogo resueltos en esta transacción; se publican en caché tras el commit
+    pendientes: List = []
+    with pooled_connection() as conn:
+        if conn is None:
+            print("[guardar_factura] Sin conexión BD")
+            return None
+        cur = conn.cursor()
+        print(f"[guardar_factura] Iniciando folio={folio} subtotal={subtotal} impuesto={impuesto} total={total}")
+        try:
 
-    xml_text = None
-    pdf_bytes = None
-    b64_text = None
+            # Receptor
+            id_receptor = _get_or_create_receptor(cur, cliente_nit, cliente_nombre, cliente_email, pendientes=pendientes)
+            print(f"[guardar_factura] id_receptor={id_receptor}")
+
+            if usar_bulk:
+                factura_id = _insertar_cabecera_bulk(cur, folio, subtotal, impuesto, total, id_receptor)
+                print(f"[guardar_factura] factura_id={factura_id}")
+                if lineas:
+                    _insertar_detalles_bulk(cur, factura_id, lineas, pendientes=pendientes)
+                    print(f"[guardar_factura] Detalles insertados={len(lineas)} (bulk)")
+                _insertar_impuestos_bulk(cur, factura_id, impuestos, pendientes=pendientes)
+                print(f"[guardar_factura] Impuestos insertados={len(impuestos)} (bulk)")
+            else:
+                # Cabecera factura
+                cur.execute(
+                    """
+                    INSERT INTO Factura (
+                        folio, prefijo, tipoComprobante, fecha, hora, fechaVencimiento,
+                        subtotal, impuesto, total, montoLetra, estado, idEmisor, idResolucion
+                    ) VALUES (
+                        %s, 'FAC', '01', CURRENT_DATE, CURRENT_TIME, CURRENT_DATE,
+                        %s, %s, %s, %s, 'EMITIDA', NULL, NULL
+                    ) RETURNING id
+                    """,
+                    (int(folio), float(subtotal), float(impuesto), float(total), numero_a_letras(total)),
+                )
+                factura_id = cur.fetchone()[0]
+                print(f"[guardar_factura] factura_id={factura_id}")
 
-    print(f"[guardar_documento_factura] Iniciando para uuid={uuid} factura_id={factura_id}")
-    print(f"[guardar_documento_factura] Rutas: xml_path={xml_path} pdf_path={pdf_path}")
+                # Relación Factura-Receptor
+                cur.execute(
+                    "INSERT INTO FacturaReceptor (idFactura, idReceptor) VALUES (%s, %s) ON CONFLICT DO NOTHING",
+                    (factura_id, id_receptor),
+                )
 
-    try:
-        if xml_path and os.path.exists(xml_path):
-            with open(xml_path, "r", encoding="utf-8") as f:
-                xml_text = f.read()
-            print(f"[guardar_documento_factura] XML leído, tamaño={len(xml_text)} bytes")
-        else:
-            print("[guardar_documento_factura] XML no encontrado o ruta vacía")
-    except Exception as e:
-        print(f"[guardar_documento_factura] Error leyendo XML: {e}")
-        xml_text = None
+                # Detalle (si hay líneas)
+                for linea in lineas:
+                    id_prod = _get_or_create_producto(cur, linea.descripcion, linea.precio, pendientes=pendientes)
+                    cur.execute(
+                        """
+                        INSERT INTO DetalleFactura (idFactura, idProducto, cantidad, precioUnitario, subtotalLinea, impuestoLinea)
+                        VALUES (%s, %s, %s, %s, %s, %s)
+                        """,
+                        (factura_id, id_prod, int(linea.cantidad), linea.precio, linea.importe, linea.impuesto),
+                    )
+                if lineas:
+                    print(f"[guardar_factura] Detalles insertados={len(lineas)}")
+
+                for imp in impuestos:
+                    imp_id = _get_or_create_impuesto(cur, imp["tipo"], float(imp["tasa"]), pendientes=pendientes)
+                    cur.execute(
+                        """
+                        INSERT INTO FacturaImpuesto (idFactura, idImpuesto, baseGravable, valor)
+                        VALUES (%s, %s, %s, %s)
+                        ON CONFLICT (idFactura, idImpuesto) DO NOTHING
+                        """,
+                        (factura_id, imp_id, imp["base"], imp["valor"]),
+                    )
+                print(f"[guardar_factura] Impuestos insertados={len(impuestos)}")
+            conn.commit()
+            catalogo.publicar(pendientes)
+            print("[guardar_factura] Commit OK")
+            return factura_id
+        except Exception as e:
+            print(f"[guardar_factura] ERROR {e}")
+            try:
+                conn.rollback()
+                print("[guardar_factura] Rollback ejecutado")
+            except Exception:
+                pass
+            catalogo.descartar(pendientes)
+            return None
+        finally:
+            cur.close()
 
-    try:
-        if pdf_path and os.path.exists(pdf_path):
-            with open(pdf_path, "rb") as f:
-                pdf_bytes = f.read()
-            b64_text = base64.b64encode(pdf_bytes).decode("ascii")
-            print(f"[guardar_documento_factura] PDF leído, tamaño={len(pdf_bytes)} bytes / base64 len={len(b64_text)}")
-        else:
-            print("[guardar_documento_factura] PDF no encontrado o ruta vacía")
-    except Exception as e:
-        print(f"[guardar_documento_factura] Error leyendo PDF: {e}")
-        pdf_bytes = None
-        b64_text = None
 
-    cur = conn.cursor()
+def _upsert_documento(cur, factura_id: Optional[int], uuid: str, xml_text: Optional[str], pdf_cols: Dict[str, object]) -> int:
+    """Upsert nativo en un solo viaje: INSERT ... ON CONFLICT (uuid) DO UPDATE ... RETURNING.
 
-    # Detectar tipo real de columna pdf
+    El XML no provisto (None) conserva su valor actual; si llega un PDF, sus
+    columnas (`pdf_cols`, ver `models.documento.columnas_pdf`) se reemplazan todas.
+    Seguro ante regeneraciones concurrentes del mismo documento.
+    """
+    cols = ["idFactura", "uuid", "xml", *pdf_cols]
+    sets = [
+        "idFactura = COALESCE(FacturaDocumento.idFactura, EXCLUDED.idFactura)",
+        "xml = COALESCE(EXCLUDED.xml, FacturaDocumento.xml)",
+        *(f"{c} = EXCLUDED.{c}" for c in pdf_cols),
+    ]
     cur.execute(
-        """
-        SELECT data_type
-        FROM information_schema.columns
-        WHERE table_schema='public' AND table_name='facturadocumento' AND column_name='pdf'
-        """
+        f"""
+        INSERT INTO FacturaDocumento ({', '.join(cols)})
+        VALUES ({', '.join(['%s'] * len(cols))})
+        ON CONFLICT (uuid) DO UPDATE SET {', '.join(sets)}
+        RETURNING id, (xmax = 0) AS insertado, length(xml)
+        """,
+        (factura_id, uuid, xml_text, *pdf_cols.values()),
     )
-    row_type = cur.fetchone()
-    pdf_is_bytea = bool(row_type and row_type[0].lower() == 'bytea')
+    doc_id, insertado, xml_len = cur.fetchone()
+    accion = "INSERT" if insertado else "UPDATE"
+    print(f"[guardar_documento_factura] {accion} (ON CONFLICT) id={doc_id} xml_len={xml_len} columnas_pdf={list(pdf_cols)}")
+    return doc_id
+
 
-    # Guardar bytes solo si la columna es BYTEA; si no, dejamos NULL y usamos base64doc
-    pdf_value = pdf_bytes if pdf_is_bytea else None
+def _upsert_documento_legacy(cur, factura_id: Optional[int], uuid: str, xml_text: Optional[str], pdf_cols: Dict[str, object]):
+    """Upsert en varios viajes para esquemas sin restricción única en `uuid`.
 
+    Retorna el id del documento, o None si no quedó guardado.
+    """
     # Upsert por uuid con SQL dinámico sin COALESCE de tipos distintos
     # Upsert simplificado: si existe actualiza, si no existe inserta SIEMPRE al menos uuid
+    # Un error aquí no debe abortar la transacción: la verificación de abajo la sigue usando
+    cur.execute("SAVEPOINT upsert_legacy")
     try:
         cur.execute("SELECT id FROM FacturaDocumento WHERE uuid=%s LIMIT 1", (uuid,))
         row = cur.fetchone()
@@ -291,12 +371,9 @@ def guardar_documento_factura(*, factura_id: Optional[int], xml_path: Optional[s
             if xml_text is not None:
                 sets.append("xml=%s")
                 params.append(xml_text)
-            if b64_text is not None:
-                sets.append("base64doc=%s")
-                params.append(b64_text)
-            if pdf_value is not None:
-                sets.append("pdf=%s")
-                params.append(pdf_value)
+            for col, value in pdf_cols.items():
+                sets.append(f"{col}=%s")
+                params.append(value)
             if sets:
                 sql = "UPDATE FacturaDocumento SET " + ", ".join(sets) + " WHERE uuid=%s"
                 params.append(uuid)
@@ -317,35 +394,105 @@ def guardar_documento_factura(*, factura_id: Optional[int], xml_path: Optional[s
                 cols.append("xml")
                 vals.append(xml_text)
                 placeholders.append("%s")
-            if b64_text is not None:
-                cols.append("base64doc")
-                vals.append(b64_text)
-                placeholders.append("%s")
-            if pdf_value is not None:
-                cols.append("pdf")
-                vals.append(pdf_value)
-                placeholders.append("%s")
+            for col, value in pdf_cols.items():
+                if value is not None:
+                    cols.append(col)
+                    vals.append(value)
+                    placeholders.append("%s")
             sql = f"INSERT INTO FacturaDocumento ({', '.join(cols)}) VALUES ({', '.join(placeholders)})"
             cur.execute(sql, tuple(vals))
             print(f"[guardar_documento_factura] INSERT ejecutado columnas={cols}")
+        cur.execute("RELEASE SAVEPOINT upsert_legacy")
     except Exception as e:
+        cur.execute("ROLLBACK TO SAVEPOINT upsert_legacy")
         print(f"[guardar_documento_factura] ERROR upsert {e}")
 
     # Verificación post-operación; segundo intento mínimo si no existe
     cur.execute("SELECT id, length(xml), length(base64doc), CASE WHEN pdf IS NULL THEN 0 ELSE 1 END FROM FacturaDocumento WHERE uuid=%s LIMIT 1", (uuid,))
     ver_row = cur.fetchone()
     if not ver_row:
+        cur.execute("SAVEPOINT upsert_legacy")
         try:
-            cur.execute("INSERT INTO FacturaDocumento (uuid) VALUES (%s) ON CONFLICT DO NOTHING", (uuid,))
+            cur.execute("INSERT INTO FacturaDocumento (uuid) VALUES (%s) ON CONFLICT DO NOTHING RETURNING id", (uuid,))
+            row = cur.fetchone()
+            cur.execute("RELEASE SAVEPOINT upsert_legacy")
             print("[guardar_documento_factura] Segundo intento inserción mínima ejecutado")
+            return row[0] if row else None
         except Exception as e:
+            cur.execute("ROLLBACK TO SAVEPOINT upsert_legacy")
             print(f"[guardar_documento_factura] ERROR segundo intento {e}")
-    else:
-        print(f"[guardar_documento_factura] Verificación OK id={ver_row[0]} xml_len={ver_row[1]} b64_len={ver_row[2]} tiene_pdf={bool(ver_row[3])}")
-
-    conn.commit()
-    cur.close()
-    conn.close()
-    print("[guardar_documento_factura] Commit realizado y conexión cerrada")
-    return True
+            return None
+    print(f"[guardar_documento_factura] Verificación OK id={ver_row[0]} xml_len={ver_row[1]} b64_len={ver_row[2]} tiene_pdf={bool(ver_row[3])}")
+    return ver_row[0]
+
+
+def guardar_documento_factura(*, factura_id: Optional[int], xml_path: Optional[str], pdf_path: Optional[str], uuid: str):
+    """Guarda/actualiza en FacturaDocumento respetando el tipo real de la columna `pdf`.
+
+    Si existe registro por uuid → update con solo las columnas provistas.
+    Si no existe → insert (requiere `factura_id`).
+    Con la restricción única en `uuid` (migración 001) es un solo INSERT ... ON CONFLICT.
+    Retorna el id del documento (None sin conexión BD).
+    El formato del PDF (bytes en `pdf_blob` o el anterior base64doc/pdf) lo decide
+    `models.documento.columnas_pdf` según DOCUMENT_STORAGE_CONFIG y el esquema.
+    """
+    with pooled_connection() as conn:
+        if conn is None:
+            return None
+
+        xml_text = None
+        pdf_bytes = None
+
+        print(f"[guardar_documento_factura] Iniciando para uuid={uuid} factura_id={factura_id}")
+        print(f"[guardar_documento_factura] Rutas: xml_path={xml_path} pdf_path={pdf_path}")
+
+        try:
+            if xml_path and os.path.exists(xml_path):
+                with open(xml_path, "r", encoding="utf-8") as f:
+                    xml_text = f.read()
+                print(f"[guardar_documento_factura] XML leído, tamaño={len(xml_text)} bytes")
+            else:
+                print("[guardar_documento_factura] XML no encontrado o ruta vacía")
+        except Exception as e:
+            print(f"[guardar_documento_factura] Error leyendo XML: {e}")
+            xml_text = None
+
+        try:
+            if pdf_path and os.path.exists(pdf_path):
+                with open(pdf_path, "rb") as f:
+                    pdf_bytes = f.read()
+                print(f"[guardar_documento_factura] PDF leído, tamaño={len(pdf_bytes)} bytes")
+            else:
+                print("[guardar_documento_factura] PDF no encontrado o ruta vacía")
+        except Exception as e:
+            print(f"[guardar_documento_factura] Error leyendo PDF: {e}")
+            pdf_bytes = None
+
+        cur = conn.cursor()
+
+        # Columnas PDF según el formato de almacenamiento (nada si no llegó PDF)
+        pdf_cols = columnas_pdf(pdf_bytes) if pdf_bytes is not None else {}
+
+        doc_id = None
+        legacy = not schema_registry.is_unique("facturadocumento", ["uuid"])
+        if not legacy:
+            # Savepoint: si la restricción ya no existe (registro de esquema viejo) el error
+            # no aborta la transacción y se sigue por el camino sin ON CONFLICT
+            cur.execute("SAVEPOINT upsert_documento")
+            try:
+                doc_id = _upsert_documento(cur, factura_id, uuid, xml_text, pdf_cols)
+                cur.execute("RELEASE SAVEPOINT upsert_documento")
+            except psycopg2.Error as e:
+                cur.execute("ROLLBACK TO SAVEPOINT upsert_documento")
+                print(f"[guardar_documento_factura] ON CONFLICT falló ({str(e).strip()}); se usa SELECT + UPDATE/INSERT")
+                schema_registry.reload()
+                legacy = True
+        if legacy:
+            # Sin restricción única en uuid (migración no aplicada): SELECT + UPDATE/INSERT
+            doc_id = _upsert_documento_legacy(cur, factura_id, uuid, xml_text, pdf_cols)
+
+        conn.commit()
+        cur.close()
+    print("[guardar_documento_factura] Commit realizado y conexión devuelta al pool")
+    return doc_id
 
@@ -0,0 +1,262 @@
+"""
+Asignador de folios de factura.
+
+Los folios salen de una secuencia PostgreSQL (`FOLIO_CONFIG["sequence"]`), de modo
+que son únicos entre hilos y entre procesos (varios workers de gunicorn). Cada
+proceso reserva bloques de `block_size` folios con un solo viaje a la BD y los
+entrega desde memoria; el camino rápido es un `deque.popleft()`, atómico en
+CPython, así que no toma locks.
+
+`folio.txt` queda como espejo local de la marca de agua (escrito en segundo plano
+con reemplazo atómico) y solo se usa para asignar si la BD no está disponible. Toda
+lectura-escritura del archivo se hace bajo un lock del sistema operativo
+(`folio.txt.lock`), así dos workers sin BD no entregan el mismo bloque.
+"""
+import os
+import threading
+from collections import deque
+from contextlib import contextmanager
+from typing import Dict, List, Optional
+
+from psycopg2 import sql
+
+from config.settings import FOLIO_CONFIG
+from database.connection import pooled_connection
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+
+def _read_state_file(path: str) -> int:
+    try:
+        if os.path.exists(path):
+            with open(path, "r", encoding="utf-8") as f:
+                return int((f.read() or "0").strip() or 0)
+    except Exception:
+        pass
+    return 0
+
+
+def _write_state_file(path: str, value: int):
+    """Escribe la marca de agua de forma atómica (archivo temporal + fsync + rename)."""
+    tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        f.write(str(value))
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+
+
+@contextmanager
+def _state_file_lock(path: str):
+    """Lock exclusivo entre procesos sobre `folio.txt` (archivo `.lock` al lado; espera a obtenerlo)."""
+    with open(f"{path}.lock", "a+b") as lock:
+        if fcntl is not None:
+            fcntl.flock(lock.fileno(), fcntl.LOCK_EX)
+        else:
+            lock.seek(0)
+            msvcrt.locking(lock.fileno(), msvcrt.LK_LOCK, 1)
+        try:
+            yield
+        finally:
+            if fcntl is not None:
+                fcntl.flock(lock.fileno(), fcntl.LOCK_UN)
+            else:
+                lock.seek(0)
+                msvcrt.locking(lock.fileno(), msvcrt.LK_UNLCK, 1)
+
+
+class _HighWaterMarkWriter:
+    """Persiste la última marca de agua en un hilo aparte para no bloquear la petición."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._value = 0
+        self._lock = threading.Lock()
+        self._event = threading.Event()
+        self._thread = None
+
+    def update(self, value: int):
+        with self._lock:
+            if value <= self._value:
+                return
+            self._value = value
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="folio-hwm", daemon=True)
+                self._thread.start()
+        self._event.set()
+
+    def _run(self):
+        written = 0
+        while True:
+            self._event.wait()
+            self._event.clear()
+            with self._lock:
+                value = self._value
+            if value <= written:
+                continue
+            try:
+                with _state_file_lock(self.path):
+                    # Otro proceso pudo haber avanzado el archivo (p. ej. asignando sin BD)
+                    if value > _read_state_file(self.path):
+                        _write_state_file(self.path, value)
+                written = value
+            except Exception as e:
+                print(f"[folio] No se pudo persistir marca de agua: {e}")
+
+
+class FolioAllocator:
+    """Entrega folios únicos desde una secuencia de BD reservando bloques en memoria."""
+
+    def __init__(self, sequence: str, block_size: int = 1, state_file: Optional[str] = None):
+        self.sequence = sequence
+        self.block_size = max(1, int(block_size))
+        self.state_file = state_file
+        self._free = deque()
+        self._refill_lock = threading.Lock()
+        self._sequence_ready = False
+        # Mayor folio entregado sin BD; la secuencia debe avanzar por encima al reconectar
+        self._offline_hwm = 0
+        self._hwm = 0
+        self._hwm_writer = _HighWaterMarkWriter(state_file) if state_file else None
+        self._stats = {"allocated": 0, "db_blocks": 0, "offline": 0}
+
+    def allocate(self) -> int:
+        """Devuelve el próximo folio."""
+        while True:
+            try:
+                folio = self._free.popleft()
+                self._stats["allocated"] += 1
+                return folio
+            except IndexError:
+                pass
+            with self._refill_lock:
+                if not self._free:
+                    self._free.extend(self._reserve_block())
+
+    def _reserve_block(self) -> List[int]:
+        folios = self._reserve_from_db()
+        if folios:
+            self._stats["db_blocks"] += 1
+        else:
+            folios = self._reserve_offline()
+            self._stats["offline"] += 1
+        self._hwm = max(self._hwm, folios[-1])
+        if self._hwm_writer:
+            self._hwm_writer.update(self._hwm)
+        return folios
+
+    def _ensure_sequence(self, cur):
+        """Crea la secuencia (sembrada con MAX(folio) y `folio.txt`) y la adelanta si hubo folios sin BD.
+
+        Se ejecuta bajo un advisory lock para que un solo proceso la inicialice.
+        Nunca se usa `setval` sobre una secuencia en uso: para adelantarla se
+        consumen valores, así no puede retroceder aunque otros procesos asignen.
+        """
+        cur.execute("SELECT pg_advisory_xact_lock(hashtext(%s))", (self.sequence,))
+        cur.execute("SELECT to_regclass(%s)", (self.sequence,))
+        if cur.fetchone()[0] is None:
+            cur.execute("SELECT COALESCE(MAX(folio), 0) FROM Factura")
+            start = max(int(cur.fetchone()[0] or 0), _read_state_file(self.state_file) if self.state_file else 0)
+            cur.execute(sql.SQL("CREATE SEQUENCE {} MINVALUE 1").format(sql.Identifier(self.sequence)))
+            if start > 0:
+                cur.execute("SELECT setval(%s, %s, true)", (self.sequence, start))
+            print(f"[folio] Secuencia {self.sequence} creada (último folio={start})")
+        if self._offline_hwm:
+            cur.execute(
+                sql.SQL("SELECT last_value, is_called FROM {}").format(sql.Identifier(self.sequence))
+            )
+            last_value, is_called = cur.fetchone()
+            current = last_value if is_called else last_value - 1
+            if self._offline_hwm > current:
+                cur.execute(
+                    "SELECT nextval(%s) FROM generate_series(1, %s)",
+                    (self.sequence, self._offline_hwm - current),
+                )
+            self._offline_hwm = 0
+
+    def _reserve_from_db(self) -> List[int]:
+        try:
+            with pooled_connection() as conn:
+                if conn is None:
+                    return []
+                cur = conn.cursor()
+                if not self._sequence_ready or self._offline_hwm:
+                    self._ensure_sequence(cur)
+                    conn.commit()
+                    self._sequence_ready = True
+                cur.execute("SELECT nextval(%s) FROM generate_series(1, %s)", (self.sequence, self.block_size))
+                folios = sorted(int(r[0]) for r in cur.fetchall())
+                conn.commit()
+                cur.close()
+                return folios
+        except Exception as e:
+            print(f"[folio] No se pudo reservar bloque en BD: {e}")
+            return []
+
+    def _reserve_offline(self) -> List[int]:
+        """Modo degradado sin BD: continúa desde `folio.txt` y lo persiste antes de entregar.
+
+        La lectura y la escritura del archivo van bajo `_state_file_lock`: otro worker
+        sin BD espera y continúa desde el bloque que este acaba de persistir.
+        """
+        folios = None
+        if self.state_file:
+            try:
+                with _state_file_lock(self.state_file):
+                    folios = self._offline_block(_read_state_file(self.state_file))
+                    _write_state_file(self.state_file, folios[-1])
+            except Exception as e:
+                print(f"[folio] No se pudo persistir folio sin BD: {e}")
+        if folios is None:
+            folios = self._offline_block(0)
+        self._offline_hwm = folios[-1]
+        print(f"[folio] BD no disponible, folios {folios[0]}-{folios[-1]} asignados desde archivo")
+        return folios
+
+    def _offline_block(self, persisted: int) -> List[int]:
+        base = max(self._hwm, persisted)
+        return list(range(base + 1, base + 1 + self.block_size))
+
+    def detect_gaps(self, limit: int = 100) -> Dict:
+        """Rangos de folios sin factura y folios duplicados en la tabla Factura."""
+        with pooled_connection() as conn:
+            if conn is None:
+                return {"huecos": [], "duplicados": [], "disponible": False}
+            cur = conn.cursor()
+            cur.execute(
+                """
+                SELECT prev + 1 AS desde, folio - 1 AS hasta
+                FROM (SELECT folio, LAG(folio) OVER (ORDER BY folio) AS prev FROM Factura) t
+                WHERE folio - prev > 1
+                ORDER BY desde
+                LIMIT %s
+                """,
+                (int(limit),),
+            )
+            huecos = [{"desde": r[0], "hasta": r[1]} for r in cur.fetchall()]
+            cur.execute(
+                "SELECT folio, COUNT(*) FROM Factura GROUP BY folio HAVING COUNT(*) > 1 ORDER BY folio LIMIT %s",
+                (int(limit),),
+            )
+            duplicados = [{"folio": r[0], "veces": r[1]} for r in cur.fetchall()]
+            cur.close()
+        return {"huecos": huecos, "duplicados": duplicados, "disponible": True}
+
+    def stats(self) -> Dict:
+        return {
+            "sequence": self.sequence,
+            "block_size": self.block_size,
+            "reservados_en_memoria": len(self._free),
+            **self._stats,
+        }
+
+
+folio_allocator = FolioAllocator(
+    sequence=FOLIO_CONFIG["sequence"],
+    block_size=FOLIO_CONFIG["block_size"],
+    state_file=FOLIO_CONFIG["state_file"],
+)
@@ -0,0 +1,167 @@
+"""
+Listado de facturas desde la BD (Factura + receptor + FacturaDocumento).
+
+- Paginación por clave (keyset): cada página pide `id < antes_de` ordenado por id
+  descendente, así el costo no crece con el número de páginas ni de facturas.
+- Filtros por rango de fecha, rango de folio y por cliente (NIT exacto o prefijo del nombre).
+- Proyección: solo se seleccionan (y se unen) las tablas de los campos pedidos.
+- `iterar_facturas` recorre el resultado con un cursor del lado del servidor para
+  exportaciones en streaming sin cargar todo en memoria.
+"""
+from datetime import date, datetime, time
+from decimal import Decimal
+from typing import Dict, Iterator, List, Optional, Sequence, Tuple
+
+from database.connection import pooled_connection
+
+# campo → (expresión SQL, alias de la unión que necesita o None)
+CAMPOS: Dict[str, Tuple[str, Optional[str]]] = {
+    "id": ("f.id", None),
+    "folio": ("f.folio", None),
+    "uuid": ("COALESCE(d.uuid, f.prefijo || '-' || f.folio)", "d"),
+    "fecha": ("f.fecha", None),
+    "hora": ("f.hora", None),
+    "subtotal": ("f.subtotal", None),
+    "impuesto": ("f.impuesto", None),
+    "total": ("f.total", None),
+    "estado": ("f.estado", None),
+    "cliente_nit": ("r.nit", "r"),
+    "cliente_nombre": ("r.nombre", "r"),
+    "cliente_email": ("r.email", "r"),
+    "tiene_xml": ("d.xml IS NOT NULL", "d"),
+}
+CAMPOS_DEFECTO = ("id", "folio", "uuid", "fecha", "total", "estado", "cliente_nit", "cliente_nombre")
+
+_JOINS = {
+    "r": """
+        LEFT JOIN LATERAL (
+            SELECT re.nit, re.nombre, re.email
+            FROM FacturaReceptor fr JOIN Receptor re ON re.id = fr.idReceptor
+            WHERE fr.idFactura = f.id
+            LIMIT 1
+        ) r ON true""",
+    "d": """
+        LEFT JOIN LATERAL (
+            SELECT fd.uuid, fd.xml
+            FROM FacturaDocumento fd
+            WHERE fd.idFactura = f.id
+            ORDER BY fd.id DESC
+            LIMIT 1
+        ) d ON true""",
+}
+
+LIMITE_MAXIMO = 500
+
+
+def validar_campos(campos: Optional[Sequence[str]]) -> List[str]:
+    """Normaliza la proyección pedida; lanza ValueError con campos desconocidos."""
+    pedidos = [c.strip() for c in campos or () if c and c.strip()]
+    if not pedidos:
+        return list(CAMPOS_DEFECTO)
+    desconocidos = [c for c in pedidos if c not in CAMPOS]
+    if desconocidos:
+        raise ValueError(f"Campos desconocidos: {', '.join(desconocidos)}")
+    return pedidos
+
+
+def _consulta(campos: List[str], *, antes_de: Optional[int], desde: Optional[date], hasta: Optional[date],
+              cliente: Optional[str], folio_desde: Optional[int] = None, folio_hasta: Optional[int] = None,
+              ascendente: bool = False) -> Tuple[str, List]:
+    # `id` siempre se selecciona: es la clave de la paginación
+    select = ["f.id"] + [CAMPOS[c][0] for c in campos if c != "id"]
+    joins = {CAMPOS[c][1] for c in campos if CAMPOS[c][1]}
+    where, params = [], []
+    if antes_de is not None:
+        where.append("f.id < %s")
+        params.append(antes_de)
+    if desde is not None:
+        where.append("f.fecha >= %s")
+        params.append(desde)
+    if hasta is not None:
+        where.append("f.fecha <= %s")
+        params.append(hasta)
+    if folio_desde is not None:
+        where.append("f.folio >= %s")
+        params.append(folio_desde)
+    if folio_hasta is not None:
+        where.append("f.folio <= %s")
+        params.append(folio_hasta)
+    if cliente:
+        joins.add("r")
+        where.append("(r.nit = %s OR r.nombre ILIKE %s)")
+        params.extend([cliente, cliente.replace("%", r"\%").replace("_", r"\_") + "%"])
+    sql = f"SELECT {', '.join(select)} FROM Factura f"
+    for alias in ("r", "d"):
+        if alias in joins:
+            sql += _JOINS[alias]
+    if where:
+        sql += " WHERE " + " AND ".join(where)
+    sql += " ORDER BY f.id ASC" if ascendente else " ORDER BY f.id DESC"
+    return sql, params
+
+
+def _valor_json(value):
+    if isinstance(value, Decimal):
+        return float(value)
+    if isinstance(value, (date, datetime, time)):
+        return value.isoformat()
+    return value
+
+
+def _fila(campos: List[str], row) -> Dict:
+    valores = dict(zip(["id"] + [c for c in campos if c != "id"], row))
+    return {c: _valor_json(valores[c]) for c in campos}
+
+
+def listar_facturas(*, campos: Optional[Sequence[str]] = None, limite: int = 50, antes_de: Optional[int] = None,
+                    desde: Optional[date] = None, hasta: Optional[date] = None,
+                    cliente: Optional[str] = None) -> Optional[Dict]:
+    """Una página de facturas (más recientes primero). None si no hay conexión BD.
+
+    Retorna {"facturas": [...], "siguiente": id para `antes_de` o None si es la última página}.
+    """
+    campos = validar_campos(campos)
+    limite = max(1, min(int(limite), LIMITE_MAXIMO))
+    sql, params = _consulta(campos, antes_de=antes_de, desde=desde, hasta=hasta, cliente=cliente)
+    with pooled_connection() as conn:
+        if conn is None:
+            return None
+        cur = conn.cursor()
+        # Una fila de más indica si hay página siguiente
+        cur.execute(sql + " LIMIT %s", (*params, limite + 1))
+        rows = cur.fetchall()
+        cur.close()
+        conn.rollback()
+    hay_mas = len(rows) > limite
+    rows = rows[:limite]
+    return {
+        "facturas": [_fila(campos, r) for r in rows],
+        "siguiente": rows[-1][0] if hay_mas else None,
+    }
+
+
+def iterar_facturas(*, campos: Optional[Sequence[str]] = None, antes_de: Optional[int] = None,
+                    desde: Optional[date] = None, hasta: Optional[date] = None,
+                    cliente: Optional[str] = None, folio_desde: Optional[int] = None,
+                    folio_hasta: Optional[int] = None, ascendente: bool = False,
+                    lote: int = 1000) -> Iterator[Dict]:
+    """Recorre todas las facturas que cumplen los filtros con un cursor del lado del servidor.
+
+    Con `ascendente=True` el orden es por id creciente (el de emisión), útil para exportar.
+    Lanza ConnectionError sin conexión BD (al pedir la primera fila).
+    """
+    campos = validar_campos(campos)
+    sql, params = _consulta(campos, antes_de=antes_de, desde=desde, hasta=hasta, cliente=cliente,
+                            folio_desde=folio_desde, folio_hasta=folio_hasta, ascendente=ascendente)
+    with pooled_connection() as conn:
+        if conn is None:
+            raise ConnectionError("Sin conexión BD")
+        cur = conn.cursor(name="listado_facturas")
+        cur.itersize = lote
+        try:
+            cur.execute(sql, params)
+            for row in cur:
+                yield _fila(campos, row)
+        finally:
+            cur.close()
+            conn.rollback()
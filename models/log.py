@@ -2,6 +2,9 @@
 Modelo para la tabla de logs en la base de datos.
 Almacena registros de eventos de la aplicación.
 """
+import psycopg2
+from psycopg2.extras import execute_values
+
 
 class Log:
     """Representa un registro de log en la base de datos."""
@@ -34,12 +37,16 @@ class Log:
                     module VARCHAR(255),
                     error_details TEXT,
                     timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                    spool_id VARCHAR(40)
                 );
+                ALTER TABLE logs ADD COLUMN IF NOT EXISTS spool_id VARCHAR(40);
                 
-                CREATE INDEX IF NOT EXISTS idx_logs_level ON logs(level);
-                CREATE INDEX IF NOT EXISTS idx_logs_timestamp ON logs(timestamp);
-                CREATE INDEX IF NOT EXISTS idx_logs_module ON logs(module);
+                CREATE INDEX IF NOT EXISTS idx_logs_ts_id ON logs(timestamp DESC, id DESC);
+                CREATE INDEX IF NOT EXISTS idx_logs_level_ts ON logs(level, timestamp DESC, id DESC);
+                CREATE INDEX IF NOT EXISTS idx_logs_module_ts ON logs(module, timestamp DESC, id DESC);
+                CREATE INDEX IF NOT EXISTS idx_logs_level_module_ts ON logs(level, module, timestamp DESC, id DESC);
+                CREATE UNIQUE INDEX IF NOT EXISTS idx_logs_spool_id ON logs(spool_id);
             """)
             conn.commit()
             print("[+] Tabla 'logs' creada o verificada exitosamente")
@@ -79,6 +86,51 @@ class Log:
             conn.rollback()
             return None
     
+    @staticmethod
+    def insert_many(conn, rows, spool_ids=None):
+        """
+        Inserta varios logs con un solo INSERT multi-fila y un commit.
+
+        Args:
+            conn: Conexión a la base de datos
+            rows: Tuplas (level, message, module, error_details, timestamp)
+            spool_ids: Clave del spool de cada fila (opcional); las que ya existen
+                se omiten (requiere el índice único idx_logs_spool_id)
+
+        Returns:
+            int: Filas procesadas, incluidas las omitidas por repetidas (0 si PostgreSQL
+            rechaza los datos: DataError/IntegrityError)
+
+        Raises:
+            psycopg2.Error: Cualquier otro error (timeouts, bloqueos, réplica de solo
+            lectura, disco lleno...): es pasajero y el lote debe reintentarse
+        """
+        if not rows:
+            return 0
+        try:
+            cur = conn.cursor()
+            if spool_ids:
+                execute_values(cur, """
+                    INSERT INTO logs (level, message, module, error_details, timestamp, spool_id)
+                    VALUES %s
+                    ON CONFLICT (spool_id) DO NOTHING
+                """, [(*row, clave) for row, clave in zip(rows, spool_ids)], page_size=max(100, len(rows)))
+            else:
+                execute_values(cur, """
+                    INSERT INTO logs (level, message, module, error_details, timestamp)
+                    VALUES %s
+                """, rows, page_size=max(100, len(rows)))
+            conn.commit()
+            cur.close()
+            return len(rows)
+        except (psycopg2.DataError, psycopg2.IntegrityError) as e:
+            print(f"[-] Error al insertar lote de logs: {e}")
+            conn.rollback()
+            return 0
+        except Exception:
+            conn.rollback()
+            raise
+
     @staticmethod
     def get_logs(conn, limit=100, level=None, module=None):
         """
@@ -107,7 +159,7 @@ class Log:
                 query += " AND module = %s"
                 params.append(module)
             
-            query += " ORDER BY timestamp DESC LIMIT %s;"
+            query += " ORDER BY timestamp DESC, id DESC LIMIT %s;"
             params.append(limit)
             
             cur.execute(query, params)
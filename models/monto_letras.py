@@ -0,0 +1,90 @@
+"""
+Monto en letras para la factura ("montoletra" del XML y `Factura.montoLetra`).
+
+- Las palabras de 0 a 999 se calculan una vez al importar, en forma completa
+  ("VEINTIUNO") y apocopada ("VEINTIUN", la que va delante de MIL, MILLONES o PESOS).
+- Miles, millones y billones se componen a partir de esas tablas; el resultado por
+  cantidad de pesos queda en una caché LRU acotada (`CACHE_MAX`), así los totales
+  repetidos no se vuelven a componer.
+- Los centavos se redondean a dos cifras (mitad hacia arriba) y se escriben en número:
+  "CIENTO DOS MIL OCHOCIENTOS CUARENTA Y UN PESOS CON 22 CENTAVOS".
+"""
+from decimal import ROUND_HALF_UP
+from functools import lru_cache
+from typing import List
+
+from models.comprobante import CENTAVOS, a_decimal
+
+CACHE_MAX = 8192
+MILLON = 10 ** 6
+BILLON = 10 ** 12
+
+_UNIDADES = ["CERO", "UNO", "DOS", "TRES", "CUATRO", "CINCO", "SEIS", "SIETE", "OCHO", "NUEVE"]
+_ESPECIALES = ["DIEZ", "ONCE", "DOCE", "TRECE", "CATORCE", "QUINCE", "DIECISEIS", "DIECISIETE", "DIECIOCHO", "DIECINUEVE"]
+_VEINTES = ["VEINTE", "VEINTIUNO", "VEINTIDOS", "VEINTITRES", "VEINTICUATRO", "VEINTICINCO", "VEINTISEIS", "VEINTISIETE", "VEINTIOCHO", "VEINTINUEVE"]
+_DECENAS = ["", "", "", "TREINTA", "CUARENTA", "CINCUENTA", "SESENTA", "SETENTA", "OCHENTA", "NOVENTA"]
+_CENTENAS = ["", "CIENTO", "DOSCIENTOS", "TRESCIENTOS", "CUATROCIENTOS", "QUINIENTOS", "SEISCIENTOS", "SETECIENTOS", "OCHOCIENTOS", "NOVECIENTOS"]
+
+
+def _menor_que_cien(n: int) -> str:
+    if n < 10:
+        return _UNIDADES[n]
+    if n < 20:
+        return _ESPECIALES[n - 10]
+    if n < 30:
+        return _VEINTES[n - 20]
+    d, u = divmod(n, 10)
+    return _DECENAS[d] if u == 0 else f"{_DECENAS[d]} Y {_UNIDADES[u]}"
+
+
+def _menor_que_mil(n: int) -> str:
+    if n < 100:
+        return _menor_que_cien(n)
+    if n == 100:
+        return "CIEN"
+    c, resto = divmod(n, 100)
+    return _CENTENAS[c] if resto == 0 else f"{_CENTENAS[c]} {_menor_que_cien(resto)}"
+
+
+# Tablas 0-999: forma completa y apocopada ("UNO" final -> "UN")
+LETRAS: List[str] = [_menor_que_mil(n) for n in range(1000)]
+_APOCOPADAS: List[str] = [p[:-1] if p.endswith("UNO") else p for p in LETRAS]
+
+
+def _entero(n: int) -> str:
+    """Palabras de un entero positivo en forma apocopada (va delante de un sustantivo)."""
+    if n < 1000:
+        return _APOCOPADAS[n]
+    if n < MILLON:
+        miles, resto = divmod(n, 1000)
+        izq = "MIL" if miles == 1 else f"{_APOCOPADAS[miles]} MIL"
+    elif n < BILLON:
+        millones, resto = divmod(n, MILLON)
+        izq = "UN MILLON" if millones == 1 else f"{_entero(millones)} MILLONES"
+    else:
+        billones, resto = divmod(n, BILLON)
+        izq = "UN BILLON" if billones == 1 else f"{_entero(billones)} BILLONES"
+    return izq if resto == 0 else f"{izq} {_entero(resto)}"
+
+
+@lru_cache(maxsize=CACHE_MAX)
+def _pesos(n: int) -> str:
+    if n == 0:
+        return "CERO PESOS"
+    if n == 1:
+        return "UN PESO"
+    # Millones exactos llevan "DE": "DOS MILLONES DE PESOS"
+    return f"{_entero(n)} DE PESOS" if n % MILLON == 0 else f"{_entero(n)} PESOS"
+
+
+def numero_a_letras(monto) -> str:
+    """Convierte un monto (int, float, str o Decimal) a letras en español.
+
+    Lanza ValueError si supera 999.999 billones.
+    """
+    valor = a_decimal(monto).quantize(CENTAVOS, rounding=ROUND_HALF_UP)
+    pesos, centavos = divmod(int(abs(valor) * 100), 100)
+    if pesos >= 1000 * BILLON:
+        raise ValueError(f"Monto fuera de rango: {monto}")
+    signo = "MENOS " if valor < 0 else ""
+    return f"{signo}{_pesos(pesos)} CON {centavos:02d} CENTAVOS"
@@ -1,11 +1,18 @@
-from flask import Blueprint, request, jsonify, send_file
+from flask import Blueprint, Response, request, jsonify, send_file
 from datetime import datetime
+from typing import Iterator
+import itertools
+import json
 import os
-from services.xml_generator import generar_xml_base
-from services.file_manager import save_xml
-from services.pdf_generator import generar_pdf_desde_xml
-from models.factura import guardar_factura, obtener_proximo_folio, guardar_documento_factura
-from config.settings import PENDIENTES_BASE, STATIC_PDFS
+import psycopg2
+from services.xml_generator import serializar_xml
+from services.file_manager import save_xml, buscar_documento
+from services.pdf_service import pdf_service
+from services.pdf_cache import pdf_cache
+from models.factura import guardar_factura, obtener_proximo_folio
+from models.comprobante import Comprobante
+from services.document_queue import document_queue
+from config.settings import PENDIENTES_BASE, STATIC_PDFS, PDF_CONFIG
 from services.logger import db_logger
 import time
 
@@ -31,14 +38,6 @@ def log_event(uuid: str | None, phase: str, message: str, data: dict | None = No
 
 factura_bp = Blueprint("factura", __name__)
 
-# Importar logger
-db_logger = None
-try:
-    from services.logger import DatabaseLogger
-    db_logger = DatabaseLogger(use_postgres=True)
-except Exception as e:
-    print(f"[-] Error al importar logger: {e}")
-
 
 @factura_bp.route("/generar-xml", methods=["POST"])
 def generar_xml():
@@ -59,38 +58,50 @@ def generar_xml():
         if not cliente.get("nombre") or not cliente.get("nit"):
             log_event(None, "VALIDACION", "Datos cliente incompletos", {"cliente": cliente}, level="WARNING")
             return jsonify({"status": "error", "message": "Datos de cliente incompletos"}), 400
-        
+
+        # Totales calculados una sola vez; XML, PDF y BD usan los mismos.
+        # Se valida antes de pedir folio: un carrito rechazado no consume número
+        try:
+            comprobante = Comprobante.desde_carrito(None, cliente, carrito)
+        except (KeyError, TypeError, ArithmeticError) as e_calc:
+            log_event(None, "VALIDACION", f"Carrito inválido: {e_calc}", level="WARNING")
+            return jsonify({"status": "error", "message": "Carrito inválido"}), 400
+
         # Obtener próximo folio secuencial
         folio = obtener_proximo_folio()
         factura_id = f"FAC-{folio}"
+        comprobante.asignar_uuid(factura_id)
         log_event(factura_id, "FOLIO_ASIGNADO", "Folio calculado", {"folio": folio})
 
         # Generar y guardar XML en pendientes/base
         try:
-            xml_base = generar_xml_base(factura_id, cliente, carrito)
+            xml_base = serializar_xml(comprobante)
             xml_file = save_xml(xml_base, f"{factura_id}.xml", folder="base")
             log_event(factura_id, "XML_GENERADO", "XML generado y almacenado", {"xml_file": xml_file, "xml_len": len(xml_base)})
         except Exception as e_xml:
             log_event(factura_id, "ERROR", f"Fallo generando XML: {e_xml}", level="ERROR")
             return jsonify({"status": "error", "message": "Error generando XML"}), 500
 
-        # Generar y guardar PDF inmediatamente en static/pdfs
-        pdf_path = os.path.join(STATIC_PDFS, f"{factura_id}.pdf")
-        try:
-            generar_pdf_desde_xml(xml_base, pdf_path)
-            log_event(factura_id, "PDF_GENERADO", "PDF generado exitosamente", {"pdf_path": pdf_path})
-        except PermissionError:
-            alt_path = os.path.join(STATIC_PDFS, f"{factura_id}_copy.pdf")
-            generar_pdf_desde_xml(xml_base, alt_path)
-            pdf_path = alt_path
-            log_event(factura_id, "PDF_GENERADO", "PDF bloqueado, generado copia", {"pdf_path": pdf_path}, level="WARNING")
-        except Exception as e_pdf:
-            log_event(factura_id, "ERROR", f"Fallo generando PDF: {e_pdf}", level="ERROR")
-
-        # Calcular totales
-        subtotal = sum(item["precio"] * item["cantidad"] for item in carrito)
-        impuesto = int(subtotal * 0.19)
-        total = subtotal + impuesto
+        # Generar y guardar PDF inmediatamente (almacén por hash o static/pdfs), salvo en modo diferido
+        if PDF_CONFIG["lazy"]:
+            pdf_path = None
+            log_event(factura_id, "PDF_DIFERIDO", "PDF se generará en la primera descarga", {})
+        else:
+            pdf_path = os.path.join(STATIC_PDFS, f"{factura_id}.pdf")
+            try:
+                pdf_path, _ = pdf_service.generar_pdf(comprobante, pdf_path, uuid=factura_id)
+                log_event(factura_id, "PDF_GENERADO", "PDF generado exitosamente", {"pdf_path": pdf_path})
+            except PermissionError:
+                alt_path = os.path.join(STATIC_PDFS, f"{factura_id}_copy.pdf")
+                pdf_service.generar_pdf(comprobante, alt_path)
+                pdf_path = alt_path
+                log_event(factura_id, "PDF_GENERADO", "PDF bloqueado, generado copia", {"pdf_path": pdf_path}, level="WARNING")
+            except Exception as e_pdf:
+                log_event(factura_id, "ERROR", f"Fallo generando PDF: {e_pdf}", level="ERROR")
+
+        subtotal = float(comprobante.subtotal)
+        impuesto = float(comprobante.impuesto)
+        total = float(comprobante.total)
         
         # Guardar factura en BD (cabecera, receptor, detalle, impuestos)
         factura_db_id = guardar_factura(
@@ -98,32 +109,27 @@ def generar_xml():
             cliente_nombre=cliente.get("nombre", ""),
             cliente_nit=cliente.get("nit", ""),
             cliente_email=cliente.get("email", ""),
-            subtotal=subtotal,
-            impuesto=impuesto,
-            total=total,
-            carrito=carrito,
-            xml_text=xml_base
+            comprobante=comprobante
         )
         if factura_db_id:
             log_event(factura_id, "FACTURA_DB", "Factura insertada en BD", {"factura_db_id": factura_db_id})
         else:
             log_event(factura_id, "ERROR", "No se insertó factura en BD", level="ERROR")
         
-        # Guardar documento (XML y PDF) en BD
+        # Guardar documento (XML y PDF) en BD fuera de la petición
         if factura_db_id:
             try:
-                guardar_documento_factura(
+                modo = document_queue.submit(
                     factura_id=factura_db_id,
                     xml_path=xml_file,
                     pdf_path=pdf_path,
                     uuid=factura_id
                 )
-                log_event(factura_id, "DOCUMENTO_DB", "Documento almacenado (XML/PDF)")
+                log_event(factura_id, "DOCUMENTO_DB", "Documento enviado a persistencia (XML/PDF)", {"modo": modo})
             except Exception as e_doc:
                 log_event(factura_id, "ERROR", f"Fallo guardando documento: {e_doc}", level="ERROR")
 
-        if db_logger:
-            db_logger.info(f"XML generado para factura {factura_id} (folio {folio}).", module="factura_routes")
+        db_logger.info(f"XML generado para factura {factura_id} (folio {folio}).", module="factura_routes")
         
         log_event(factura_id, "FINALIZADO", "Proceso completado", {"total": total})
         return jsonify({
@@ -156,129 +162,250 @@ def cancelar_carrito():
     return jsonify({"status": "success", "message": "Cancelación registrada"})
 
 
+def _responder_pdf(factura_id: str, path: str | None = None, data: bytes | None = None):
+    """Envía el PDF como archivo, o en Base64 dentro de JSON si se pidió `?formato=base64`."""
+    if request.args.get("formato") == "base64":
+        import base64
+        if data is None:
+            with open(path, "rb") as f:
+                data = f.read()
+        return jsonify({
+            "status": "success",
+            "factura_id": factura_id,
+            "base64": base64.b64encode(data).decode("ascii")
+        })
+    import io
+    return send_file(
+        path if data is None else io.BytesIO(data),
+        mimetype='application/pdf',
+        as_attachment=True,
+        download_name=f"{factura_id}.pdf"
+    )
+
+
+def _respuesta_sin_pdf(factura_id: str, txt_path: str):
+    """Fallback a TXT como último recurso; si tampoco existe, 404."""
+    if os.path.exists(txt_path):
+        return send_file(
+            txt_path,
+            mimetype='text/plain',
+            as_attachment=True,
+            download_name=f"{factura_id}.txt"
+        )
+    return jsonify({"status": "error", "message": "Archivo no encontrado"}), 404
+
+
+def _pdf_bajo_demanda(factura_id: str) -> bytes | None:
+    """Bytes del PDF para la caché: el ya guardado si existe, si no se renderiza desde el XML (disco o BD)."""
+    from models.documento import cargar_documento
+
+    guardado = buscar_documento(factura_id, "pdf")
+    if guardado:
+        with open(guardado, "rb") as f:
+            return f.read()
+    xml_text = None
+    xml_disk = buscar_documento(factura_id, "xml")
+    if xml_disk:
+        with open(xml_disk, "r", encoding="utf-8") as f:
+            xml_text = f.read()
+    else:
+        resultado = cargar_documento(factura_id)
+        if resultado:
+            xml_text, pdf_bytes = resultado
+            if pdf_bytes:
+                return pdf_bytes
+    if not xml_text:
+        return None
+    log_event(factura_id, "PDF_GENERADO", "PDF renderizado bajo demanda", {"modo": "diferido"})
+    return pdf_service.render(xml_text)
+
+
 @factura_bp.route("/descargar-pdf/<factura_id>", methods=["GET"])
 def descargar_pdf(factura_id):
-    """Descarga el PDF de una factura desde archivos o BD"""
+    """Descarga el PDF de una factura desde archivos o BD (`?formato=base64` para JSON)"""
     try:
-        import base64
-        import io
-        from database.connection import get_connection
+        from models.documento import cargar_documento
         from config.settings import PENDIENTES_BASE
-        from models.factura import guardar_documento_factura
         
-        # Primero buscar en archivos
+        # Primero buscar en archivos (almacén por hash, luego static/pdfs)
         pdf_path = os.path.join(STATIC_PDFS, f"{factura_id}.pdf")
         txt_path = os.path.join(PENDIENTES_BASE, f"{factura_id}.txt")
+
+        # Modo diferido: caché de PDFs renderizados, un solo render por factura a la vez
+        if PDF_CONFIG["lazy"]:
+            pdf_bytes = pdf_cache.get_or_render(factura_id, lambda: _pdf_bajo_demanda(factura_id))
+            if pdf_bytes:
+                return _responder_pdf(factura_id, data=pdf_bytes)
+            return _respuesta_sin_pdf(factura_id, txt_path)
         
-        if os.path.exists(pdf_path):
-            return send_file(
-                pdf_path,
-                mimetype='application/pdf',
-                as_attachment=True,
-                download_name=f"{factura_id}.pdf"
-            )
+        encontrado = buscar_documento(factura_id, "pdf")
+        if encontrado:
+            return _responder_pdf(factura_id, path=encontrado)
         
         # Si no está en archivos, buscar/generar en BD
         try:
-            conn = get_connection()
-            cur = conn.cursor()
-            
-            cur.execute("""
-                SELECT xml, pdf, base64doc FROM FacturaDocumento 
-                WHERE uuid = %s
-                LIMIT 1
-            """, (factura_id,))
-            
-            resultado = cur.fetchone()
-            cur.close()
-            conn.close()
-            
+            resultado = cargar_documento(factura_id)
             if resultado:
-                xml_text, pdf_bytes, pdf_b64text = resultado
+                xml_text, pdf_bytes = resultado
                 if pdf_bytes:
-                    return send_file(
-                        io.BytesIO(pdf_bytes),
-                        mimetype='application/pdf',
-                        as_attachment=True,
-                        download_name=f"{factura_id}.pdf"
-                    )
-                if pdf_b64text:
-                    try:
-                        pdf_bytes_dec = base64.b64decode(pdf_b64text)
-                        return send_file(
-                            io.BytesIO(pdf_bytes_dec),
-                            mimetype='application/pdf',
-                            as_attachment=True,
-                            download_name=f"{factura_id}.pdf"
-                        )
-                    except Exception:
-                        pass
+                    return _responder_pdf(factura_id, data=pdf_bytes)
                 # Generar PDF desde XML si existe
                 if xml_text:
-                    generado_path, generado_b64 = generar_pdf_desde_xml(xml_text, pdf_path)
-                    # Guardar en BD
-                    guardar_documento_factura(
+                    generado_path, _ = pdf_service.generar_pdf(xml_text, pdf_path, uuid=factura_id)
+                    # Guardar en BD (en segundo plano)
+                    document_queue.submit(
                         factura_id=None,
                         xml_path=None,
                         pdf_path=generado_path,
                         uuid=factura_id
                     )
-                    return send_file(
-                        generado_path,
-                        mimetype='application/pdf',
-                        as_attachment=True,
-                        download_name=f"{factura_id}.pdf"
-                    )
+                    return _responder_pdf(factura_id, path=generado_path)
         except Exception as e:
             print(f"[-] Error al obtener PDF de BD: {e}")
         
         # Intentar generar desde XML en disco
-        xml_disk = os.path.join(PENDIENTES_BASE, f"{factura_id}.xml")
-        if os.path.exists(xml_disk):
+        xml_disk = buscar_documento(factura_id, "xml")
+        if xml_disk:
             try:
                 with open(xml_disk, "r", encoding="utf-8") as f:
                     xml_text = f.read()
-                generado_path, _ = generar_pdf_desde_xml(xml_text, pdf_path)
-                return send_file(
-                    generado_path,
-                    mimetype='application/pdf',
-                    as_attachment=True,
-                    download_name=f"{factura_id}.pdf"
-                )
+                generado_path, _ = pdf_service.generar_pdf(xml_text, pdf_path, uuid=factura_id)
+                return _responder_pdf(factura_id, path=generado_path)
             except Exception as e:
                 print(f"[-] Error al generar PDF desde XML en disco: {e}")
 
-        # Fallback a TXT como último recurso
-        if os.path.exists(txt_path):
-            return send_file(
-                txt_path,
-                mimetype='text/plain',
-                as_attachment=True,
-                download_name=f"{factura_id}.txt"
-            )
-        
-        return jsonify({"status": "error", "message": "Archivo no encontrado"}), 404
+        return _respuesta_sin_pdf(factura_id, txt_path)
             
     except Exception as e:
-        if db_logger:
-            db_logger.error(f"Error al descargar PDF {factura_id}: {e}", module="factura_routes", exc_info=True)
+        db_logger.error(f"Error al descargar PDF {factura_id}: {e}", module="factura_routes", exc_info=True)
         return jsonify({"status": "error", "message": str(e)}), 500
 
 
 @factura_bp.route("/api/facturas", methods=["GET"])
 def listar_facturas():
-    """Lista todas las facturas generadas"""
+    """Lista facturas desde la BD, más recientes primero.
+
+    Parámetros: `limit`, `antes_de` (cursor `siguiente` de la página anterior),
+    `desde`/`hasta` (YYYY-MM-DD), `cliente` (NIT o inicio del nombre),
+    `campos` (lista separada por comas) y `formato=ndjson` para exportar todo en streaming.
+    """
     try:
-        facturas = []
-        for archivo in os.listdir(PENDIENTES_BASE):
-            if archivo.startswith("FAC-"):
-                facturas.append({
-                    "nombre": archivo,
-                    "ruta": os.path.join(PENDIENTES_BASE, archivo)
-                })
-        
-        return jsonify({"status": "success", "facturas": facturas})
+        from models.listado_facturas import listar_facturas as listar_facturas_db, iterar_facturas, validar_campos
+
+        try:
+            campos = validar_campos(request.args.get("campos", "").split(","))
+            limite = _arg_entero("limit", 50)
+            antes_de = request.args.get("antes_de", type=int)
+            desde = request.args.get("desde")
+            hasta = request.args.get("hasta")
+            desde = datetime.strptime(desde, "%Y-%m-%d").date() if desde else None
+            hasta = datetime.strptime(hasta, "%Y-%m-%d").date() if hasta else None
+        except ValueError as e:
+            return jsonify({"status": "error", "message": str(e)}), 400
+        filtros = {"campos": campos, "antes_de": antes_de, "desde": desde, "hasta": hasta, "cliente": request.args.get("cliente")}
+
+        if request.args.get("formato") == "ndjson":
+            try:
+                filas = _iniciar(iterar_facturas(**filtros))
+            except (ConnectionError, psycopg2.Error) as e:
+                return jsonify({"status": "error", "message": str(e)}), 503
+
+            def generar():
+                for fila in filas:
+                    yield json.dumps(fila, ensure_ascii=False) + "\n"
+            return Response(generar(), mimetype="application/x-ndjson")
+
+        pagina = listar_facturas_db(limite=limite, **filtros)
+        if pagina is None:
+            return jsonify({"status": "error", "message": "Sin conexión BD"}), 503
+        return jsonify({"status": "success", "count": len(pagina["facturas"]), **pagina})
+    except Exception as e:
+        return jsonify({"status": "error", "message": str(e)}), 500
+
+
+def _arg_entero(nombre: str, defecto: int) -> int:
+    """Parámetro entero del query string. Lanza ValueError (respuesta 400) si no lo es."""
+    valor = request.args.get(nombre)
+    if valor is None or valor == "":
+        return defecto
+    try:
+        return int(valor)
+    except ValueError:
+        raise ValueError(f"{nombre} debe ser un número entero: {valor!r}")
+
+
+def _iniciar(filas: Iterator) -> Iterator:
+    """Pide la primera fila antes de responder: un error de BD sale aquí y no a mitad del streaming."""
+    primera = next(filas, None)
+    return filas if primera is None else itertools.chain([primera], filas)
+
+
+def _parametros_exportacion() -> dict:
+    """Parámetros de /api/facturas/exportar desde el query string y, en POST, el cuerpo JSON."""
+    params = request.args.to_dict()
+    uuids = [u for u in params.pop("uuids", "").split(",") if u.strip()]
+    cuerpo = request.get_json(silent=True) if request.method == "POST" else None
+    if isinstance(cuerpo, dict):
+        uuids.extend(cuerpo.get("uuids") or [])
+        params.update({k: str(v) for k, v in cuerpo.items() if k != "uuids" and v is not None})
+    params["uuids"] = list(dict.fromkeys(str(u).strip() for u in uuids if str(u).strip()))
+    return params
+
+
+@factura_bp.route("/api/facturas/exportar", methods=["GET", "POST"])
+def exportar_facturas():
+    """Exporta varias facturas en un ZIP (un PDF por factura) o en un solo PDF.
+
+    Selección (una de): `uuids` (separados por coma, o lista JSON en POST),
+    `folio_desde`/`folio_hasta`, o `desde`/`hasta` (YYYY-MM-DD).
+    `formato=zip` (por defecto) o `formato=pdf`. La respuesta se envía en streaming.
+    """
+    try:
+        from models.listado_facturas import iterar_facturas
+        from services.exportador import exportar_pdf, exportar_zip
+
+        params = _parametros_exportacion()
+        formato = params.get("formato", "zip")
+        if formato not in ("zip", "pdf"):
+            return jsonify({"status": "error", "message": "formato debe ser zip o pdf"}), 400
+        try:
+            folio_desde = int(params["folio_desde"]) if params.get("folio_desde") else None
+            folio_hasta = int(params["folio_hasta"]) if params.get("folio_hasta") else None
+            desde = datetime.strptime(params["desde"], "%Y-%m-%d").date() if params.get("desde") else None
+            hasta = datetime.strptime(params["hasta"], "%Y-%m-%d").date() if params.get("hasta") else None
+        except ValueError as e:
+            return jsonify({"status": "error", "message": str(e)}), 400
+
+        if params["uuids"]:
+            uuids = params["uuids"]
+            seleccion = f"{len(uuids)} uuids"
+        elif any(v is not None for v in (folio_desde, folio_hasta, desde, hasta)):
+            filtros = {"folio_desde": folio_desde, "folio_hasta": folio_hasta, "desde": desde, "hasta": hasta}
+            try:
+                filas = _iniciar(iterar_facturas(campos=["uuid"], ascendente=True, **filtros))
+            except (ConnectionError, psycopg2.Error) as e:
+                return jsonify({"status": "error", "message": str(e)}), 503
+            uuids = (f["uuid"] for f in filas if f["uuid"])
+            seleccion = ", ".join(f"{k}={v}" for k, v in filtros.items() if v is not None)
+        else:
+            return jsonify({"status": "error", "message": "Indique uuids, folio_desde/folio_hasta o desde/hasta"}), 400
+
+        log_event(None, "EXPORTACION", f"Exportación {formato} de facturas", {"seleccion": seleccion})
+        nombre = f"facturas_{datetime.now().strftime('%Y%m%d_%H%M%S')}.{formato}"
+        if formato == "pdf":
+            try:
+                bloques, faltantes = exportar_pdf(uuids)
+            except ValueError as e:
+                return jsonify({"status": "error", "message": str(e)}), 400
+            if bloques is None:
+                return jsonify({"status": "error", "message": "Ninguna factura con documento", "faltantes": faltantes}), 404
+            headers = {"Content-Disposition": f"attachment; filename={nombre}", "X-Facturas-Faltantes": str(len(faltantes))}
+            return Response(bloques, mimetype="application/pdf", headers=headers)
+
+        headers = {"Content-Disposition": f"attachment; filename={nombre}"}
+        return Response(exportar_zip(uuids), mimetype="application/zip", headers=headers)
     except Exception as e:
+        db_logger.error(f"Error en exportación de facturas: {e}", module="factura_routes", exc_info=True)
         return jsonify({"status": "error", "message": str(e)}), 500
 
 
@@ -286,52 +413,218 @@ def listar_facturas():
 def debug_documentos():
     """Devuelve conteos y últimos documentos para diagnóstico."""
     try:
-        from database.connection import get_connection
-        conn = get_connection()
-        if not conn:
-            return jsonify({"status": "error", "message": "Sin conexión BD"}), 500
-        cur = conn.cursor()
-        cur.execute("SELECT COUNT(*) FROM Factura")
-        c_fact = cur.fetchone()[0]
-        cur.execute("SELECT COUNT(*) FROM facturadocumento")
-        c_docs = cur.fetchone()[0]
-        cur.execute("SELECT id, uuid, idFactura, length(base64doc) AS len_b64, CASE WHEN pdf IS NULL THEN 0 ELSE 1 END AS tiene_pdf FROM facturadocumento ORDER BY id DESC LIMIT 10")
-        rows = cur.fetchall()
-        cur.close(); conn.close()
+        from database.connection import pooled_connection
+        from database.schema import schema_registry
+        with pooled_connection() as conn:
+            if not conn:
+                return jsonify({"status": "error", "message": "Sin conexión BD"}), 500
+            cur = conn.cursor()
+            cur.execute("SELECT COUNT(*) FROM Factura")
+            c_fact = cur.fetchone()[0]
+            cur.execute("SELECT COUNT(*) FROM facturadocumento")
+            c_docs = cur.fetchone()[0]
+            tiene_blob = schema_registry.has_column("facturadocumento", "pdf_blob")
+            blob_cols = "pdf_codec, pdf_len, octet_length(pdf_blob)" if tiene_blob else "NULL, NULL, NULL"
+            cur.execute(f"SELECT id, uuid, idFactura, length(base64doc) AS len_b64, CASE WHEN pdf IS NULL THEN 0 ELSE 1 END AS tiene_pdf, {blob_cols} FROM facturadocumento ORDER BY id DESC LIMIT 10")
+            rows = cur.fetchall()
+            cur.close()
         return jsonify({
             "status": "success",
             "facturas": c_fact,
             "documentos": c_docs,
             "ultimos": [
-                {"id": r[0], "uuid": r[1], "idFactura": r[2], "lenBase64": r[3], "pdfGuardado": bool(r[4])} for r in rows
+                {
+                    "id": r[0], "uuid": r[1], "idFactura": r[2], "lenBase64": r[3],
+                    "pdfGuardado": bool(r[4]) or r[7] is not None,
+                    "codec": r[5], "lenPdf": r[6], "lenAlmacenado": r[7]
+                } for r in rows
             ]
         })
     except Exception as e:
         return jsonify({"status": "error", "message": str(e)}), 500
 
 
+@factura_bp.route("/api/documentos/cola", methods=["GET"])
+def estado_cola_documentos():
+    """Estado de la cola de persistencia de documentos: pendientes, en proceso y fallidos."""
+    return jsonify({"status": "success", "cola": document_queue.status()})
+
+
+@factura_bp.route("/api/documentos/cola/reintentar", methods=["POST"])
+def reintentar_documentos_fallidos():
+    """Reencola los documentos cuya persistencia agotó los reintentos."""
+    reencolados = document_queue.retry_failed()
+    return jsonify({"status": "success", "reencolados": reencolados})
+
+
+@factura_bp.route("/api/debug/esquema", methods=["GET"])
+def debug_esquema():
+    """Capacidades del esquema cacheadas (columnas, índices, únicos). `?recargar=1` fuerza la introspección."""
+    from database.schema import schema_registry
+    if request.args.get("recargar") == "1":
+        schema_registry.reload()
+    else:
+        schema_registry.load()
+    return jsonify({"status": "success", "esquema": schema_registry.snapshot()})
+
+
+@factura_bp.route("/api/debug/pool", methods=["GET"])
+def debug_pool():
+    """Métricas del pool de conexiones PostgreSQL."""
+    from database.connection import pool_stats
+    return jsonify({"status": "success", "pool": pool_stats()})
+
+
+@factura_bp.route("/api/debug/cache", methods=["GET"])
+def debug_cache():
+    """Aciertos/fallos de la caché de ids de catálogo (Producto, Impuesto, Receptor)."""
+    from models import catalogo
+    return jsonify({"status": "success", "cache": catalogo.stats()})
+
+
+@factura_bp.route("/api/debug/pdf", methods=["GET"])
+def debug_pdf():
+    """Estado del pool de renderizado de PDF (procesos, cupos, fallbacks y timeouts)."""
+    return jsonify({"status": "success", "pdf": pdf_service.stats(), "cache": pdf_cache.stats(), "diferido": PDF_CONFIG["lazy"]})
+
+
+@factura_bp.route("/api/debug/logs", methods=["GET"])
+def debug_logs():
+    """Cola de envío de logs a PostgreSQL/Mongo (en cola, enviados, descartados, pendientes en spool) y estado de cada backend."""
+    from services.log_registry import log_registry
+    from services.log_shipper import log_shipper
+    from services.log_tail import log_tails
+    return jsonify({
+        "status": "success",
+        "envio": log_shipper.stats(),
+        "backends": log_registry.estado(),
+        "stream": {category: tail.stats() for category, tail in log_tails.items()},
+    })
+
+
+@factura_bp.route("/api/debug/folios", methods=["GET"])
+def debug_folios():
+    """Estado del asignador de folios y huecos/duplicados en la tabla Factura."""
+    try:
+        from models.folio import folio_allocator
+        try:
+            limit = _arg_entero("limit", 100)
+        except ValueError as e:
+            return jsonify({"status": "error", "message": str(e)}), 400
+        return jsonify({"status": "success", "asignador": folio_allocator.stats(), **folio_allocator.detect_gaps(limit)})
+    except Exception as e:
+        return jsonify({"status": "error", "message": str(e)}), 500
+
+
+def _filtros_logs(con_uuid: bool = True) -> dict:
+    """Filtros comunes de /api/logs/*: `limit`, `level`, `module`, `uuid`, `antes_de` y `error=1`."""
+    filtros = {
+        "limite": _arg_entero("limit", 50),
+        "level": request.args.get("level"),
+        "module": request.args.get("module"),
+        "antes_de": request.args.get("antes_de"),
+        # El traceback solo se lee de la BD si se pide
+        "con_error": request.args.get("error", "0").lower() in ("1", "true", "si"),
+    }
+    if con_uuid:
+        filtros["uuid"] = request.args.get("uuid")
+    return filtros
+
+
+def _pagina_logs(buscar, con_uuid: bool = True, **kwargs):
+    try:
+        pagina = buscar(**kwargs, **_filtros_logs(con_uuid))
+    except ValueError as e:
+        return jsonify({"status": "error", "message": str(e)}), 400
+    if pagina is None:
+        return jsonify({"status": "error", "message": "Backend de logs no disponible"}), 503
+    return jsonify({"status": "success", "count": len(pagina["logs"]), **pagina})
+
+
 @factura_bp.route("/api/logs/mongo", methods=["GET"])
 def listar_logs_mongo():
-    """Lista últimos logs almacenados en MongoDB."""
+    """Lista logs de MongoDB (facturación), más recientes primero; `siguiente` va en `antes_de`."""
     try:
-        limit = int(request.args.get("limit", 50))
-        level = request.args.get("level")
-        module = request.args.get("module")
-        logs = db_logger.get_mongo_logs(limit=limit, level=level, module=module, category="facturacion")
-        return jsonify({"status": "success", "count": len(logs), "logs": logs})
+        return _pagina_logs(db_logger.buscar_logs_mongo, category="facturacion")
     except Exception as e:
         return jsonify({"status": "error", "message": str(e)}), 500
 
 
 @factura_bp.route("/api/logs/sistema", methods=["GET"])
 def listar_logs_sistema():
-    """Lista logs de la colección de sistema."""
+    """Lista logs de la colección de sistema (mismos parámetros que /api/logs/mongo)."""
+    try:
+        return _pagina_logs(db_logger.buscar_logs_mongo, category="sistema")
+    except Exception as e:
+        return jsonify({"status": "error", "message": str(e)}), 500
+
+
+@factura_bp.route("/api/logs/postgres", methods=["GET"])
+def listar_logs_postgres():
+    """Lista logs de la tabla `logs` de PostgreSQL (mismos parámetros, sin `uuid`)."""
+    try:
+        return _pagina_logs(db_logger.buscar_logs_postgres, con_uuid=False)
+    except Exception as e:
+        return jsonify({"status": "error", "message": str(e)}), 500
+
+
+@factura_bp.route("/api/logs/stream", methods=["GET"])
+def stream_logs():
+    """Eventos nuevos de logs Mongo en vivo (Server-Sent Events, o NDJSON con `formato=ndjson`).
+
+    Parámetros: `categoria` (facturacion|sistema), `level`, `module`, `uuid`. Todos los
+    clientes comparten un cursor tailable por colección (ver services/log_tail.py).
+    """
+    from config.settings import LOG_TAIL_CONFIG
+    from services.log_tail import SinCupo, log_tails
+
+    categoria = request.args.get("categoria", "facturacion")
+    formato = request.args.get("formato", "sse")
+    if categoria not in log_tails or formato not in ("sse", "ndjson"):
+        return jsonify({"status": "error", "message": "categoria: facturacion|sistema; formato: sse|ndjson"}), 400
+    if not db_logger.use_mongo:
+        return jsonify({"status": "error", "message": "MongoDB no disponible"}), 503
+    tail = log_tails[categoria]
+    try:
+        suscripcion = tail.suscribir(
+            level=request.args.get("level"), module=request.args.get("module"), uuid=request.args.get("uuid")
+        )
+    except SinCupo as e:
+        return jsonify({"status": "error", "message": str(e)}), 503
+
+    sse = formato == "sse"
+
+    def generar():
+        try:
+            if sse:
+                yield "retry: 3000\n\n"
+            while True:
+                evento = suscripcion.siguiente(LOG_TAIL_CONFIG["latido"])
+                if evento is None:
+                    # Latido: mantiene la conexión y detecta clientes que se fueron
+                    yield ": ping\n\n" if sse else "\n"
+                    continue
+                linea = json.dumps(evento, ensure_ascii=False, default=lambda v: v.isoformat() if isinstance(v, datetime) else str(v))
+                yield f"data: {linea}\n\n" if sse else linea + "\n"
+        finally:
+            tail.cancelar(suscripcion)
+
+    return Response(
+        generar(),
+        mimetype="text/event-stream" if sse else "application/x-ndjson",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+@factura_bp.route("/api/logs/factura/<uuid>", methods=["GET"])
+def linea_de_tiempo_factura(uuid):
+    """Todas las fases registradas de una factura, en orden cronológico (`error=1` incluye tracebacks)."""
     try:
-        limit = int(request.args.get("limit", 50))
-        level = request.args.get("level")
-        module = request.args.get("module")
-        logs = db_logger.get_mongo_logs(limit=limit, level=level, module=module, category="sistema")
-        return jsonify({"status": "success", "count": len(logs), "logs": logs})
+        con_error = request.args.get("error", "0").lower() in ("1", "true", "si")
+        eventos = db_logger.linea_de_tiempo(uuid, con_error=con_error)
+        if eventos is None:
+            return jsonify({"status": "error", "message": "Backend de logs no disponible"}), 503
+        return jsonify({"status": "success", "uuid": uuid, "count": len(eventos), "eventos": eventos})
     except Exception as e:
         return jsonify({"status": "error", "message": str(e)}), 500
 
@@ -0,0 +1,264 @@
+"""
+Regeneración masiva de PDFs (p. ej. tras cambiar la plantilla).
+
+Fuentes, en este orden:
+1. `FacturaDocumento.xml`, leído con un cursor del lado del servidor por orden de id.
+2. XML en disco (`pendientes/base` y el almacén por hash) cuya factura no tiene XML
+   en la BD (las que sí lo tienen ya se regeneraron en la fase 1). Si no hay fila en
+   FacturaDocumento solo se regenera el archivo.
+
+Cada lote se renderiza en un pool de procesos mientras se escribe el anterior; el
+resultado se guarda como en /generar-xml (almacén por hash o static/pdfs) y en la BD
+con un upsert por lote. Tras cada commit se actualiza el checkpoint
+(`BACKFILL_CHECKPOINT`), así una ejecución interrumpida continúa donde quedó.
+
+Uso:
+    python -m services.backfill_pdf [--reiniciar] [--fuente todas|bd|disco] [--workers N] [--lote N]
+"""
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from psycopg2.extras import execute_batch
+
+from config.settings import BACKFILL_CONFIG, PENDIENTES_BASE, STATIC_PDFS
+from database.connection import pooled_connection
+from database.schema import schema_registry
+from models.documento import columnas_pdf
+from services.blob_store import blob_store, blob_store_activo
+from services.pdf_cache import pdf_cache
+from services.pdf_generator import guardar_pdf, render_documento
+from services.pdf_service import _init_worker
+
+MAX_FALLIDOS = 100
+
+# (clave de checkpoint, uuid, xml, tiene fila en FacturaDocumento)
+Fila = Tuple[object, str, str, bool]
+
+
+def _estado_inicial() -> Dict:
+    return {"fase": "bd", "ultimo_id": 0, "ultimo_uuid": "", "procesados": 0, "errores": 0, "fallidos": []}
+
+
+class PdfBackfill:
+    """Regenera los PDF de todas las facturas con XML, por lotes y con checkpoint."""
+
+    def __init__(self, workers: int = 2, batch_size: int = 100, checkpoint_path: Optional[str] = None):
+        self.workers = max(1, int(workers))
+        self.batch_size = max(1, int(batch_size))
+        self.checkpoint_path = checkpoint_path or BACKFILL_CONFIG["checkpoint"]
+        self.estado = _estado_inicial()
+        self._t0 = 0.0
+        self._procesados_sesion = 0
+        self._bytes_sesion = 0
+
+    # ---------- checkpoint ----------
+    def _cargar_checkpoint(self):
+        try:
+            with open(self.checkpoint_path, "r", encoding="utf-8") as f:
+                self.estado = {**_estado_inicial(), **json.load(f)}
+            print(f"[backfill] Reanudando desde checkpoint: fase={self.estado['fase']} "
+                  f"id>{self.estado['ultimo_id']} uuid>{self.estado['ultimo_uuid']!r} procesados={self.estado['procesados']}")
+        except FileNotFoundError:
+            self.estado = _estado_inicial()
+
+    def _guardar_checkpoint(self):
+        os.makedirs(os.path.dirname(self.checkpoint_path), exist_ok=True)
+        tmp = f"{self.checkpoint_path}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(self.estado, f)
+        os.replace(tmp, self.checkpoint_path)
+
+    # ---------- fuentes ----------
+    def _lotes_bd(self) -> Iterator[Tuple[int, List[Fila]]]:
+        with pooled_connection() as conn:
+            if conn is None:
+                raise RuntimeError("Sin conexión BD")
+            cur = conn.cursor(name="backfill_pdf")
+            cur.itersize = self.batch_size
+            try:
+                cur.execute(
+                    """
+                    SELECT id, uuid, xml FROM FacturaDocumento
+                    WHERE id > %s AND xml IS NOT NULL AND uuid IS NOT NULL
+                    ORDER BY id
+                    """,
+                    (self.estado["ultimo_id"],),
+                )
+                while True:
+                    filas = cur.fetchmany(self.batch_size)
+                    if not filas:
+                        return
+                    yield filas[-1][0], [(id_, uuid, xml_text, True) for id_, uuid, xml_text in filas]
+            finally:
+                cur.close()
+                conn.rollback()
+
+    def _documentos_en_bd(self, uuids: List[str]) -> Dict[str, bool]:
+        """{uuid: tiene_xml} de las filas de FacturaDocumento del lote."""
+        with pooled_connection() as conn:
+            if conn is None:
+                return {}
+            cur = conn.cursor()
+            cur.execute("SELECT uuid, xml IS NOT NULL FROM FacturaDocumento WHERE uuid = ANY(%s)", (uuids,))
+            encontrados = dict(cur.fetchall())
+            cur.close()
+            conn.rollback()
+        return encontrados
+
+    def _lotes_disco(self) -> Iterator[Tuple[str, List[Fila]]]:
+        rutas: Dict[str, Optional[str]] = {}
+        if os.path.isdir(PENDIENTES_BASE):
+            for entry in os.scandir(PENDIENTES_BASE):
+                stem, ext = os.path.splitext(entry.name)
+                if ext.lower() == ".xml" and entry.is_file():
+                    rutas[stem] = entry.path
+        if blob_store_activo():
+            for uuid in blob_store.uuids("xml"):
+                rutas[uuid] = None
+        pendientes = sorted(u for u in rutas if u > self.estado["ultimo_uuid"])
+        for i in range(0, len(pendientes), self.batch_size):
+            lote = pendientes[i:i + self.batch_size]
+            en_bd = self._documentos_en_bd(lote)
+            filas = []
+            for uuid in lote:
+                if en_bd.get(uuid):
+                    continue
+                if rutas[uuid] is None:
+                    data = blob_store.read(uuid, "xml")
+                else:
+                    with open(rutas[uuid], "rb") as f:
+                        data = f.read()
+                if data:
+                    filas.append((uuid, uuid, data.decode("utf-8"), uuid in en_bd))
+            yield lote[-1], filas
+
+    # ---------- escritura ----------
+    def _upsert_lote(self, resultados: List[Tuple[str, Optional[str], bytes]]):
+        """Guarda los PDF de un lote en FacturaDocumento con una sola transacción."""
+        cols = list(columnas_pdf(resultados[0][2]))
+        if schema_registry.is_unique("facturadocumento", ["uuid"]):
+            sets = ", ".join(["xml = COALESCE(FacturaDocumento.xml, EXCLUDED.xml)", *(f"{c} = EXCLUDED.{c}" for c in cols)])
+            sql = (
+                f"INSERT INTO FacturaDocumento (uuid, xml, {', '.join(cols)}) "
+                f"VALUES ({', '.join(['%s'] * (len(cols) + 2))}) "
+                f"ON CONFLICT (uuid) DO UPDATE SET {sets}"
+            )
+            params = [(uuid, xml_text, *columnas_pdf(pdf).values()) for uuid, xml_text, pdf in resultados]
+        else:
+            # Sin restricción única en uuid (migración 001 no aplicada)
+            sql = f"UPDATE FacturaDocumento SET xml = COALESCE(xml, %s), {', '.join(f'{c} = %s' for c in cols)} WHERE uuid = %s"
+            params = [(xml_text, *columnas_pdf(pdf).values(), uuid) for uuid, xml_text, pdf in resultados]
+        with pooled_connection() as conn:
+            if conn is None:
+                raise RuntimeError("Sin conexión BD")
+            cur = conn.cursor()
+            try:
+                execute_batch(cur, sql, params, page_size=len(params))
+                conn.commit()
+            except Exception:
+                conn.rollback()
+                raise
+            finally:
+                cur.close()
+
+    def _escribir(self, fase: str, marca, filas: List[Fila], futuros):
+        resultados = []
+        n = 0
+        for (_, uuid, xml_text, en_bd), futuro in zip(filas, futuros):
+            try:
+                pdf_bytes = futuro.result()
+            except Exception as e:
+                self.estado["errores"] += 1
+                if len(self.estado["fallidos"]) < MAX_FALLIDOS:
+                    self.estado["fallidos"].append(uuid)
+                print(f"[backfill] Error renderizando {uuid}: {e}")
+                continue
+            guardar_pdf(pdf_bytes, os.path.join(STATIC_PDFS, f"{uuid}.pdf"), uuid)
+            pdf_cache.invalidate(uuid)
+            # XML de disco sin factura en la BD: solo se regenera el archivo, no se crean filas huérfanas.
+            # Si la fila existe sin XML, el upsert también lo completa.
+            if en_bd:
+                resultados.append((uuid, xml_text if fase == "disco" else None, pdf_bytes))
+            self._bytes_sesion += len(pdf_bytes)
+            n += 1
+        if resultados:
+            self._upsert_lote(resultados)
+        self.estado["ultimo_id" if fase == "bd" else "ultimo_uuid"] = marca
+        self.estado["procesados"] += n
+        self._procesados_sesion += n
+        self._guardar_checkpoint()
+        transcurrido = max(time.perf_counter() - self._t0, 1e-9)
+        print(f"[backfill] {fase}: {self._procesados_sesion} PDFs en {transcurrido:.1f}s "
+              f"({self._procesados_sesion / transcurrido:.1f} PDF/s), errores={self.estado['errores']}, último={marca}")
+
+    def _procesar(self, pool: ProcessPoolExecutor, fase: str, lotes: Iterator[Tuple[object, List[Fila]]]):
+        # El lote siguiente se renderiza mientras se escribe el anterior
+        en_vuelo = None
+        for marca, filas in lotes:
+            futuros = [pool.submit(render_documento, fila[2]) for fila in filas]
+            if en_vuelo:
+                self._escribir(fase, *en_vuelo)
+            en_vuelo = (marca, filas, futuros)
+        if en_vuelo:
+            self._escribir(fase, *en_vuelo)
+
+    # ---------- API ----------
+    def run(self, reiniciar: bool = False, fuentes: Tuple[str, ...] = ("bd", "disco")) -> Dict:
+        if reiniciar:
+            self.estado = _estado_inicial()
+        else:
+            self._cargar_checkpoint()
+        if self.estado["fase"] == "terminado":
+            print("[backfill] El checkpoint indica que ya terminó; use --reiniciar para regenerar de nuevo")
+            return self.estado
+
+        self._t0 = time.perf_counter()
+        self._procesados_sesion = 0
+        self._bytes_sesion = 0
+        print(f"[backfill] Iniciando: {self.workers} procesos, lotes de {self.batch_size}, fuentes={','.join(fuentes)}")
+        with ProcessPoolExecutor(max_workers=self.workers, initializer=_init_worker) as pool:
+            try:
+                if self.estado["fase"] == "bd":
+                    if "bd" in fuentes:
+                        self._procesar(pool, "bd", self._lotes_bd())
+                    self.estado["fase"] = "disco"
+                    self._guardar_checkpoint()
+                if self.estado["fase"] == "disco":
+                    if "disco" in fuentes:
+                        self._procesar(pool, "disco", self._lotes_disco())
+                    self.estado["fase"] = "terminado"
+                    self._guardar_checkpoint()
+            except KeyboardInterrupt:
+                pool.shutdown(wait=False, cancel_futures=True)
+                print(f"[backfill] Interrumpido; se reanuda desde fase={self.estado['fase']} "
+                      f"id>{self.estado['ultimo_id']} uuid>{self.estado['ultimo_uuid']!r}")
+                raise
+
+        transcurrido = max(time.perf_counter() - self._t0, 1e-9)
+        n = self._procesados_sesion
+        print(f"[backfill] Terminado: {n} PDFs en {transcurrido:.1f}s ({n / transcurrido:.1f} PDF/s, "
+              f"{(self._bytes_sesion / n / 1024) if n else 0:.1f} KB/PDF), total acumulado={self.estado['procesados']}, "
+              f"errores={self.estado['errores']}")
+        if self.estado["fallidos"]:
+            print(f"[backfill] Fallidos (primeros {MAX_FALLIDOS}): {', '.join(self.estado['fallidos'])}")
+        return self.estado
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--reiniciar", action="store_true", help="ignora el checkpoint y empieza desde cero")
+    parser.add_argument("--fuente", choices=("todas", "bd", "disco"), default="todas")
+    parser.add_argument("--workers", type=int, default=BACKFILL_CONFIG["workers"])
+    parser.add_argument("--lote", type=int, default=BACKFILL_CONFIG["batch_size"])
+    args = parser.parse_args()
+
+    fuentes = ("bd", "disco") if args.fuente == "todas" else (args.fuente,)
+    try:
+        PdfBackfill(args.workers, args.lote).run(reiniciar=args.reiniciar, fuentes=fuentes)
+    except KeyboardInterrupt:
+        raise SystemExit(130)
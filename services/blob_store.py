@@ -0,0 +1,228 @@
+"""
+Almacén de documentos (XML/PDF) direccionado por contenido.
+
+- Cada blob se guarda una sola vez bajo su SHA-256, en directorios de dos niveles
+  (`objects/ab/cd/<sha256>`), así ningún directorio crece con el número de facturas.
+- Escritura atómica: archivo temporal en el mismo directorio + fsync + rename.
+- Deduplicación: si el hash ya existe no se vuelve a escribir.
+- Índice por uuid de factura: `refs/<tipo>/<xx>/<uuid>` contiene el hash vigente.
+- `gc()` elimina los objetos que ya no referencia ningún uuid.
+
+Importar archivos existentes: python -m services.blob_store --importar
+Recolectar huérfanos:         python -m services.blob_store --gc
+"""
+import hashlib
+import os
+import re
+import threading
+import time
+from typing import Dict, Iterator, Optional, Set, Tuple
+
+from config.settings import BLOB_STORE_CONFIG
+
+_UUID_RE = re.compile(r"^[A-Za-z0-9._-]+$")
+TIPOS = ("xml", "pdf")
+
+
+def _write_atomic(path: str, data: bytes):
+    tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(tmp, "wb") as f:
+        f.write(data)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+
+
+class BlobStore:
+    """Objetos por hash con índice por uuid y recolección de huérfanos."""
+
+    def __init__(self, root: str, gc_grace: float = 3600.0):
+        self.root = root
+        self.objects_dir = os.path.join(root, "objects")
+        self.refs_dir = os.path.join(root, "refs")
+        # Objetos más nuevos que esto no se recolectan (pueden estar por enlazarse)
+        self.gc_grace = float(gc_grace)
+        self._stats = {"puts": 0, "dedup": 0, "bytes_escritos": 0}
+        self._lock = threading.Lock()
+
+    # ---------- rutas ----------
+    def object_path(self, digest: str) -> str:
+        return os.path.join(self.objects_dir, digest[:2], digest[2:4], digest)
+
+    def _ref_path(self, uuid: str, tipo: str) -> str:
+        if tipo not in TIPOS:
+            raise ValueError(f"Tipo de documento no soportado: {tipo}")
+        if not _UUID_RE.match(uuid or ""):
+            raise ValueError(f"uuid de factura inválido: {uuid!r}")
+        shard = hashlib.md5(uuid.encode("utf-8")).hexdigest()[:2]
+        return os.path.join(self.refs_dir, tipo, shard, uuid)
+
+    # ---------- escritura ----------
+    def put(self, data: bytes) -> str:
+        """Guarda el contenido (si no existía) y retorna su SHA-256."""
+        digest = hashlib.sha256(data).hexdigest()
+        path = self.object_path(digest)
+        try:
+            # Renueva el mtime: `gc()` respeta `gc_grace` y no lo borra antes del `link`
+            os.utime(path)
+            with self._lock:
+                self._stats["dedup"] += 1
+            return digest
+        except FileNotFoundError:
+            pass
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        _write_atomic(path, data)
+        with self._lock:
+            self._stats["puts"] += 1
+            self._stats["bytes_escritos"] += len(data)
+        return digest
+
+    def link(self, uuid: str, tipo: str, digest: str):
+        """Apunta el documento `tipo` de la factura `uuid` al objeto `digest`."""
+        ref = self._ref_path(uuid, tipo)
+        os.makedirs(os.path.dirname(ref), exist_ok=True)
+        _write_atomic(ref, digest.encode("ascii"))
+
+    def save(self, uuid: str, tipo: str, data: bytes) -> str:
+        """Guarda y enlaza el documento. Retorna la ruta del objeto en disco."""
+        digest = self.put(data)
+        self.link(uuid, tipo, digest)
+        return self.object_path(digest)
+
+    # ---------- lectura ----------
+    def digest_for(self, uuid: str, tipo: str) -> Optional[str]:
+        try:
+            with open(self._ref_path(uuid, tipo), "r", encoding="ascii") as f:
+                return f.read().strip() or None
+        except (FileNotFoundError, ValueError):
+            return None
+
+    def path_for(self, uuid: str, tipo: str) -> Optional[str]:
+        """Ruta del documento de la factura, o None si no está en el almacén."""
+        digest = self.digest_for(uuid, tipo)
+        if not digest:
+            return None
+        path = self.object_path(digest)
+        return path if os.path.exists(path) else None
+
+    def read(self, uuid: str, tipo: str) -> Optional[bytes]:
+        path = self.path_for(uuid, tipo)
+        if path is None:
+            return None
+        with open(path, "rb") as f:
+            return f.read()
+
+    def unlink(self, uuid: str, tipo: str):
+        """Quita la referencia; el objeto se elimina en el próximo `gc()` si nadie más lo usa."""
+        try:
+            os.remove(self._ref_path(uuid, tipo))
+        except FileNotFoundError:
+            pass
+
+    def uuids(self, tipo: str) -> Iterator[str]:
+        """uuids con referencia de ese tipo (sin orden)."""
+        base = os.path.join(self.refs_dir, tipo)
+        if not os.path.isdir(base):
+            return
+        for shard in os.scandir(base):
+            if shard.is_dir():
+                for entry in os.scandir(shard.path):
+                    if not entry.name.endswith(".tmp"):
+                        yield entry.name
+
+    # ---------- mantenimiento ----------
+    def _iter_refs(self) -> Iterator[Tuple[str, str, str]]:
+        for tipo in TIPOS:
+            base = os.path.join(self.refs_dir, tipo)
+            if not os.path.isdir(base):
+                continue
+            for shard in os.scandir(base):
+                if not shard.is_dir():
+                    continue
+                for entry in os.scandir(shard.path):
+                    if entry.name.endswith(".tmp"):
+                        continue
+                    with open(entry.path, "r", encoding="ascii") as f:
+                        yield tipo, entry.name, f.read().strip()
+
+    def gc(self, dry_run: bool = False) -> Dict:
+        """Elimina objetos sin referencias y temporales abandonados más viejos que `gc_grace`."""
+        vivos: Set[str] = {digest for _, _, digest in self._iter_refs()}
+        limite = time.time() - self.gc_grace
+        eliminados, liberados, revisados = 0, 0, 0
+        if os.path.isdir(self.objects_dir):
+            for dirpath, _, files in os.walk(self.objects_dir):
+                for name in files:
+                    revisados += 1
+                    path = os.path.join(dirpath, name)
+                    if name in vivos:
+                        continue
+                    try:
+                        st = os.stat(path)
+                    except FileNotFoundError:
+                        continue
+                    if st.st_mtime > limite:
+                        continue
+                    if not dry_run:
+                        os.remove(path)
+                    eliminados += 1
+                    liberados += st.st_size
+        resultado = {"revisados": revisados, "referenciados": len(vivos), "eliminados": eliminados, "bytes_liberados": liberados}
+        print(f"[blob_store] GC{' (simulado)' if dry_run else ''}: {resultado}")
+        return resultado
+
+    def import_file(self, uuid: str, tipo: str, path: str) -> str:
+        with open(path, "rb") as f:
+            return self.save(uuid, tipo, f.read())
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return dict(self._stats)
+
+
+blob_store = BlobStore(BLOB_STORE_CONFIG["root"], gc_grace=BLOB_STORE_CONFIG["gc_grace_seconds"])
+
+
+def blob_store_activo() -> bool:
+    return BLOB_STORE_CONFIG["enabled"]
+
+
+def importar_directorios():
+    """Copia al almacén los XML/PDF sueltos de `pendientes/base` y `static/pdfs`.
+
+    Las variantes `_copy.pdf` se importan como el PDF de su factura (gana la más reciente).
+    """
+    from config.settings import PENDIENTES_BASE, STATIC_PDFS
+
+    archivos = []
+    for folder in (PENDIENTES_BASE, STATIC_PDFS):
+        if not os.path.isdir(folder):
+            continue
+        for entry in os.scandir(folder):
+            stem, ext = os.path.splitext(entry.name)
+            tipo = ext.lower().lstrip(".")
+            if tipo not in TIPOS or not entry.is_file():
+                continue
+            if stem.endswith("_copy"):
+                stem = stem[: -len("_copy")]
+            archivos.append((entry.stat().st_mtime, stem, tipo, entry.path))
+    importados = 0
+    for _, uuid, tipo, path in sorted(archivos):
+        try:
+            blob_store.import_file(uuid, tipo, path)
+            importados += 1
+        except ValueError as e:
+            print(f"[blob_store] Omitido {path}: {e}")
+    print(f"[blob_store] Importados {importados} archivos ({blob_store.stats()})")
+    return importados
+
+
+if __name__ == "__main__":
+    import sys
+
+    if "--importar" in sys.argv:
+        importar_directorios()
+    elif "--gc" in sys.argv:
+        blob_store.gc(dry_run="--simular" in sys.argv)
+    else:
+        print("Uso: python -m services.blob_store [--importar | --gc [--simular]]")
@@ -0,0 +1,351 @@
+"""
+Cola en segundo plano para guardar documentos (XML/PDF) en FacturaDocumento.
+
+La ruta `/generar-xml` responde en cuanto existe la fila de Factura; el documento
+se persiste después en un pool de hilos:
+
+- Backlog acotado (`max_backlog`): si la cola está llena el trabajo se ejecuta en
+  línea, como antes, en lugar de perderse.
+- Cada trabajo se escribe antes en un spool en disco, así sobrevive a un reinicio.
+  Cada proceso usa su propio subdirectorio de `spool_dir/pendientes` y mantiene un
+  lock sobre él; al arrancar reclama (con un rename atómico) los trabajos de los
+  subdirectorios cuyo dueño ya terminó, y solo esos se reencolan.
+- Reintentos con backoff exponencial; tras `max_retries` el trabajo pasa a
+  `spool_dir/fallidos` y puede reintentarse con `retry_failed()`.
+"""
+import json
+import os
+import queue
+import threading
+import time
+import uuid as uuid_lib
+from typing import Dict, List, Optional
+
+from config.settings import DOCUMENT_QUEUE_CONFIG
+from models.factura import guardar_documento_factura
+from services.logger import logger
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+_LOCK = ".lock"
+
+
+def _bloquear(archivo) -> bool:
+    """Lock exclusivo sin espera; False si otro proceso lo tiene."""
+    try:
+        if fcntl is not None:
+            fcntl.flock(archivo.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+        else:
+            archivo.seek(0)
+            msvcrt.locking(archivo.fileno(), msvcrt.LK_NBLCK, 1)
+        return True
+    except OSError:
+        return False
+
+
+class DocumentPersistenceQueue:
+    """Pool de hilos con backlog acotado, reintentos y spool durable."""
+
+    def __init__(self, spool_dir: str, workers: int = 2, max_backlog: int = 200,
+                 max_retries: int = 5, retry_backoff: float = 2.0):
+        self.pending_root = os.path.join(spool_dir, "pendientes")
+        # Subdirectorio de este proceso dentro de `pending_root` (se crea en `start()`)
+        self.pending_dir: Optional[str] = None
+        self._spool_lock = None
+        self.failed_dir = os.path.join(spool_dir, "fallidos")
+        self.workers = max(1, int(workers))
+        self.max_retries = max(0, int(max_retries))
+        self.retry_backoff = float(retry_backoff)
+        self._queue: "queue.Queue[Dict]" = queue.Queue(maxsize=max(1, int(max_backlog)))
+        self._lock = threading.Lock()
+        self._started = False
+        self._scheduled = 0
+        self._in_progress = 0
+        self._stats = {"submitted": 0, "completed": 0, "retried": 0, "failed": 0, "inline": 0}
+
+    # ---------- ciclo de vida ----------
+    def start(self):
+        """Arranca los hilos (una sola vez) y reencola lo que dejaron procesos terminados."""
+        with self._lock:
+            if self._started:
+                return
+            self._started = True
+            os.makedirs(self.failed_dir, exist_ok=True)
+            self._abrir_spool_propio()
+        for i in range(self.workers):
+            threading.Thread(target=self._worker, name=f"doc-persist-{i}", daemon=True).start()
+        jobs = self._reclamar_pendientes()
+        recuperados = 0
+        for i, job in enumerate(jobs):
+            if not self._enqueue(job):
+                # Backlog lleno: el resto sigue en el spool y se encola en cuanto haya lugar
+                restantes = jobs[i:]
+                logger.warning(
+                    f"[DocQueue] Backlog lleno al recuperar el spool: {len(restantes)} documentos "
+                    f"pendientes se encolarán cuando haya lugar"
+                )
+                threading.Thread(
+                    target=self._requeue_blocking, args=(restantes,), name="doc-persist-recovery", daemon=True
+                ).start()
+                break
+            recuperados += 1
+        if recuperados:
+            logger.info(f"[DocQueue] {recuperados} documentos pendientes recuperados del spool")
+
+    def _abrir_spool_propio(self):
+        """Crea el subdirectorio de este proceso y toma su lock mientras el proceso viva."""
+        while True:
+            path = os.path.join(self.pending_root, f"{os.getpid()}-{uuid_lib.uuid4().hex[:8]}")
+            os.makedirs(path)
+            lock = open(os.path.join(path, _LOCK), "a+b")
+            if _bloquear(lock):
+                self.pending_dir, self._spool_lock = path, lock
+                return
+            # Otro proceso lo tomó por abandonado antes de que se bloqueara: se usa otro nombre
+            lock.close()
+
+    def _reclamar_pendientes(self) -> List[Dict]:
+        """Mueve a este proceso los trabajos de subdirectorios sin dueño vivo.
+
+        Si el lock de un subdirectorio se puede tomar, el proceso que lo creó terminó.
+        El rename es atómico: si dos procesos arrancan a la vez, cada trabajo lo reclama
+        uno solo. Los `.json` sueltos en `pendientes` (spool anterior) también se reclaman.
+        """
+        jobs: List[Dict] = []
+        for entry in sorted(os.scandir(self.pending_root), key=lambda e: e.name):
+            if entry.path == self.pending_dir:
+                continue
+            lock = None
+            if entry.is_dir():
+                lock = open(os.path.join(entry.path, _LOCK), "a+b")
+                if not _bloquear(lock):
+                    lock.close()
+                    continue
+                try:
+                    origenes = [os.path.join(entry.path, n) for n in sorted(os.listdir(entry.path))]
+                except FileNotFoundError:
+                    origenes = []
+            else:
+                origenes = [entry.path]
+            for origen in origenes:
+                if not origen.endswith(".json"):
+                    continue
+                destino = os.path.join(self.pending_dir, os.path.basename(origen))
+                try:
+                    os.rename(origen, destino)
+                except FileNotFoundError:
+                    continue  # Lo reclamó otro proceso
+                job = self._read_job(destino)
+                if job is not None:
+                    jobs.append(job)
+            if lock is not None:
+                lock.close()
+                # Si no se puede borrar (otro proceso lo está revisando), lo hará el próximo arranque
+                try:
+                    os.remove(os.path.join(entry.path, _LOCK))
+                    os.rmdir(entry.path)
+                except OSError:
+                    pass
+        return jobs
+
+    def _requeue_blocking(self, jobs: List[Dict]):
+        for job in jobs:
+            # Espera a que los workers liberen lugar en la cola
+            self._queue.put(job)
+
+    # ---------- spool ----------
+    def _job_path(self, job: Dict, folder: Optional[str] = None) -> str:
+        return os.path.join(folder or self.pending_dir, f"{job['uuid']}-{job['job_id']}.json")
+
+    def _write_job(self, job: Dict, folder: Optional[str] = None):
+        path = self._job_path(job, folder)
+        tmp = path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(job, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, path)
+
+    @staticmethod
+    def _read_job(path: str) -> Optional[Dict]:
+        if not path.endswith(".json"):
+            return None
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except Exception as e:
+            logger.warning(f"[DocQueue] Trabajo ilegible en spool {path}: {e}")
+            return None
+
+    def _remove_job(self, job: Dict):
+        try:
+            os.remove(self._job_path(job))
+        except FileNotFoundError:
+            pass
+
+    # ---------- encolado ----------
+    def submit(self, *, factura_id: Optional[int], xml_path: Optional[str], pdf_path: Optional[str], uuid: str) -> str:
+        """Encola el guardado del documento. Retorna "encolado" o "sincrono" si el backlog estaba lleno."""
+        self.start()
+        job = {
+            "job_id": uuid_lib.uuid4().hex[:12],
+            "factura_id": factura_id,
+            "xml_path": xml_path,
+            "pdf_path": pdf_path,
+            "uuid": uuid,
+            "attempts": 0,
+            "created": time.time(),
+        }
+        with self._lock:
+            self._stats["submitted"] += 1
+        self._write_job(job)
+        if self._enqueue(job):
+            return "encolado"
+        # Backlog lleno: se aplica contrapresión ejecutando en el hilo de la petición
+        with self._lock:
+            self._stats["inline"] += 1
+        self._process(job)
+        return "sincrono"
+
+    def _enqueue(self, job: Dict) -> bool:
+        try:
+            self._queue.put_nowait(job)
+            return True
+        except queue.Full:
+            return False
+
+    def _schedule_retry(self, job: Dict):
+        delay = self.retry_backoff * (2 ** (job["attempts"] - 1))
+
+        def requeue():
+            with self._lock:
+                self._scheduled -= 1
+            # Con la cola llena se espera: el trabajo ya está en el spool
+            self._queue.put(job)
+
+        with self._lock:
+            self._scheduled += 1
+            self._stats["retried"] += 1
+        timer = threading.Timer(delay, requeue)
+        timer.daemon = True
+        timer.start()
+
+    # ---------- ejecución ----------
+    def _worker(self):
+        while True:
+            job = self._queue.get()
+            try:
+                self._process(job)
+            finally:
+                self._queue.task_done()
+
+    def _process(self, job: Dict):
+        with self._lock:
+            self._in_progress += 1
+        try:
+            job["attempts"] += 1
+            error = None
+            try:
+                ok = guardar_documento_factura(
+                    factura_id=job["factura_id"],
+                    xml_path=job["xml_path"],
+                    pdf_path=job["pdf_path"],
+                    uuid=job["uuid"],
+                )
+                if not ok:
+                    error = "sin conexión BD"
+            except Exception as e:
+                error = str(e)
+
+            if error is None:
+                self._remove_job(job)
+                with self._lock:
+                    self._stats["completed"] += 1
+                return
+
+            job["last_error"] = error
+            if job["attempts"] <= self.max_retries:
+                self._write_job(job)
+                logger.warning(f"[DocQueue] {job['uuid']} intento {job['attempts']} falló: {error}")
+                self._schedule_retry(job)
+            else:
+                self._write_job(job, self.failed_dir)
+                self._remove_job(job)
+                with self._lock:
+                    self._stats["failed"] += 1
+                logger.error(f"[DocQueue] {job['uuid']} falló tras {job['attempts']} intentos: {error}")
+        finally:
+            with self._lock:
+                self._in_progress -= 1
+
+    # ---------- consulta ----------
+    def failed_jobs(self, limit: int = 50) -> List[Dict]:
+        if not os.path.isdir(self.failed_dir):
+            return []
+        jobs = []
+        for name in sorted(os.listdir(self.failed_dir))[:limit]:
+            job = self._read_job(os.path.join(self.failed_dir, name))
+            if job is not None:
+                jobs.append(job)
+        return jobs
+
+    def _contar_pendientes(self) -> int:
+        """Trabajos en el spool de todos los procesos."""
+        if not os.path.isdir(self.pending_root):
+            return 0
+        total = 0
+        for dirpath, _, files in os.walk(self.pending_root):
+            total += sum(1 for name in files if name.endswith(".json"))
+        return total
+
+    def retry_failed(self) -> int:
+        """Reencola los trabajos fallidos. Retorna cuántos se reencolaron."""
+        self.start()
+        count = 0
+        for job in self.failed_jobs(limit=10_000):
+            # El rename reclama el trabajo: dos reintentos simultáneos no lo encolan dos veces
+            try:
+                os.rename(self._job_path(job, self.failed_dir), self._job_path(job))
+            except FileNotFoundError:
+                continue
+            job["attempts"] = 0
+            job.pop("last_error", None)
+            self._write_job(job)
+            with self._lock:
+                self._stats["failed"] = max(0, self._stats["failed"] - 1)
+            count += 1
+            if not self._enqueue(job):
+                # Backlog lleno: igual que `submit`, se ejecuta en el hilo de la petición
+                with self._lock:
+                    self._stats["inline"] += 1
+                self._process(job)
+        return count
+
+    def status(self) -> Dict:
+        with self._lock:
+            info = {
+                "en_cola": self._queue.qsize(),
+                "reintentos_programados": self._scheduled,
+                "en_proceso": self._in_progress,
+                "backlog_max": self._queue.maxsize,
+                **self._stats,
+            }
+        info["pendientes_spool"] = self._contar_pendientes()
+        info["fallidos_detalle"] = [
+            {"uuid": j.get("uuid"), "intentos": j.get("attempts"), "error": j.get("last_error")}
+            for j in self.failed_jobs()
+        ]
+        return info
+
+
+document_queue = DocumentPersistenceQueue(
+    spool_dir=DOCUMENT_QUEUE_CONFIG["spool_dir"],
+    workers=DOCUMENT_QUEUE_CONFIG["workers"],
+    max_backlog=DOCUMENT_QUEUE_CONFIG["max_backlog"],
+    max_retries=DOCUMENT_QUEUE_CONFIG["max_retries"],
+    retry_backoff=DOCUMENT_QUEUE_CONFIG["retry_backoff_seconds"],
+)
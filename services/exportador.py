@@ -0,0 +1,234 @@
+"""
+Exportación masiva de PDFs de facturas (/api/facturas/exportar).
+
+- Las facturas se resuelven por lotes: PDF ya guardado (almacén por hash o
+  static/pdfs), caché de renderizados en modo diferido y, para el resto, una sola
+  consulta a FacturaDocumento por lote.
+- Las que no tienen PDF se renderizan desde el XML en paralelo: varios hilos
+  alimentan el pool de procesos de `pdf_service`.
+- ZIP: se escribe en streaming, un PDF a la vez; en memoria solo vive el lote en
+  curso. Las facturas sin XML ni PDF se listan en `faltantes.txt`.
+- PDF concatenado: los mismos PDFs (guardados o renderizados en el pool) unidos
+  con `pypdf` en un solo documento, escrito en un archivo temporal y enviado por
+  bloques. Tiene tope de facturas (`EXPORT_PDF_MAX`) porque el documento se arma
+  completo antes de enviarlo. Sin `pypdf` se renderiza todo desde el XML en este
+  proceso (una factura por página, el QR incrustado una vez).
+"""
+import tempfile
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+from itertools import islice
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+from config.settings import EXPORT_CONFIG, PDF_CONFIG
+from models.documento import cargar_documentos
+from services.file_manager import buscar_documento
+from services.pdf_cache import pdf_cache
+from services.pdf_generator import _parse_xml, obtener_plantilla
+from services.pdf_service import pdf_service
+
+try:
+    from pypdf import PdfReader, PdfWriter
+except Exception:
+    PdfReader = PdfWriter = None  # Opcional: sin el paquete el PDF concatenado se renderiza desde el XML
+
+TAMANO_BLOQUE = 64 * 1024
+
+
+class _Salida:
+    """Destino de solo escritura para `zipfile`: acumula lo escrito hasta que se entrega."""
+
+    def __init__(self):
+        self._partes: List[bytes] = []
+
+    def write(self, data) -> int:
+        self._partes.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def vaciar(self) -> bytes:
+        data = b"".join(self._partes)
+        self._partes.clear()
+        return data
+
+
+def _lotes(uuids: Iterable[str], tamano: int) -> Iterator[List[str]]:
+    it = iter(uuids)
+    while True:
+        lote = list(islice(it, max(1, tamano)))
+        if not lote:
+            return
+        yield lote
+
+
+def _leer(path: str) -> bytes:
+    with open(path, "rb") as f:
+        return f.read()
+
+
+def _xml_lote(uuids: List[str], documentos: Optional[Dict] = None) -> Dict[str, str]:
+    """XML de cada factura del lote: disco/almacén primero, luego una consulta BD para el resto."""
+    xmls: Dict[str, str] = {}
+    consultar = []
+    for uuid in uuids:
+        path = buscar_documento(uuid, "xml")
+        if path:
+            xmls[uuid] = _leer(path).decode("utf-8")
+        else:
+            consultar.append(uuid)
+    if documentos is None and consultar:
+        documentos = cargar_documentos(consultar) or {}
+    for uuid in consultar:
+        xml_text = (documentos or {}).get(uuid, (None, None))[0]
+        if xml_text:
+            xmls[uuid] = xml_text
+    return xmls
+
+
+def _resolver_lote(uuids: List[str]) -> Tuple[Dict[str, bytes], Dict[str, str]]:
+    """Separa el lote en PDFs disponibles {uuid: bytes} y XML por renderizar {uuid: xml}."""
+    pdfs: Dict[str, bytes] = {}
+    consultar = []
+    for uuid in uuids:
+        path = buscar_documento(uuid, "pdf")
+        data = _leer(path) if path else None
+        if data is None and PDF_CONFIG["lazy"]:
+            data = pdf_cache.get(uuid)
+        if data is None:
+            consultar.append(uuid)
+        else:
+            pdfs[uuid] = data
+    if not consultar:
+        return pdfs, {}
+    documentos = cargar_documentos(consultar) or {}
+    sin_pdf = []
+    for uuid in consultar:
+        pdf_bytes = documentos.get(uuid, (None, None))[1]
+        if pdf_bytes:
+            pdfs[uuid] = pdf_bytes
+        else:
+            sin_pdf.append(uuid)
+    return pdfs, _xml_lote(sin_pdf, documentos)
+
+
+def _pdfs_en_orden(uuids: Iterable[str], hilos: ThreadPoolExecutor) -> Iterator[Tuple[str, Optional[bytes]]]:
+    """(uuid, PDF o None) en el orden recibido; por lote, lo guardado primero y el resto renderizado en el pool."""
+    for lote in _lotes(uuids, EXPORT_CONFIG["batch_size"]):
+        pdfs, xmls = _resolver_lote(lote)
+        renders = {uuid: hilos.submit(pdf_service.render, xml_text) for uuid, xml_text in xmls.items()}
+        for uuid in lote:
+            data = pdfs.pop(uuid, None)
+            if data is None and uuid in renders:
+                try:
+                    data = renders[uuid].result()
+                except Exception as e:
+                    print(f"[exportar] Error renderizando {uuid}: {e}")
+            yield uuid, data
+
+
+def _hilos_render() -> ThreadPoolExecutor:
+    return ThreadPoolExecutor(max_workers=max(1, EXPORT_CONFIG["render_threads"]))
+
+
+def exportar_zip(uuids: Iterable[str]) -> Iterator[bytes]:
+    """Genera el ZIP por bloques: `<uuid>.pdf` por factura, en el orden recibido."""
+    salida = _Salida()
+    faltantes: List[str] = []
+    total = 0
+    with _hilos_render() as hilos, zipfile.ZipFile(salida, "w", compression=zipfile.ZIP_STORED) as zf:
+        for uuid, data in _pdfs_en_orden(uuids, hilos):
+            if data is None:
+                faltantes.append(uuid)
+                continue
+            zf.writestr(f"{uuid}.pdf", data)
+            total += 1
+            yield salida.vaciar()
+        if faltantes:
+            zf.writestr("faltantes.txt", "\n".join(faltantes) + "\n")
+    print(f"[exportar] ZIP con {total} PDFs ({len(faltantes)} faltantes)")
+    yield salida.vaciar()
+
+
+def exportar_pdf(uuids: Iterable[str]) -> Tuple[Optional[Iterator[bytes]], List[str]]:
+    """Arma un solo PDF con las facturas en orden y retorna (bloques, uuids sin PDF ni XML).
+
+    Los bloques son None si ninguna factura tiene documento. Lanza ValueError si la
+    selección supera `EXPORT_PDF_MAX` facturas.
+    """
+    if PdfWriter is None:
+        return _exportar_pdf_desde_xml(uuids)
+    maximo = EXPORT_CONFIG["max_pdf_facturas"]
+    writer = PdfWriter()
+    faltantes: List[str] = []
+    total = 0
+    with _hilos_render() as hilos:
+        for uuid, data in _pdfs_en_orden(uuids, hilos):
+            if data is None:
+                faltantes.append(uuid)
+                continue
+            try:
+                writer.append(PdfReader(BytesIO(data)))
+            except Exception as e:
+                print(f"[exportar] PDF inválido para {uuid}: {e}")
+                faltantes.append(uuid)
+                continue
+            total += 1
+            if total > maximo:
+                raise ValueError(f"Más de {maximo} facturas para un PDF; use formato=zip")
+    if not total:
+        return None, faltantes
+    archivo = tempfile.SpooledTemporaryFile(max_size=8 * 1024 * 1024)
+    try:
+        writer.write(archivo)
+        archivo.seek(0)
+    except Exception:
+        archivo.close()
+        raise
+    finally:
+        writer.close()
+    print(f"[exportar] PDF con {total} facturas ({len(faltantes)} faltantes)")
+    return _bloques(archivo), faltantes
+
+
+def _exportar_pdf_desde_xml(uuids: Iterable[str]) -> Tuple[Optional[Iterator[bytes]], List[str]]:
+    """Sin `pypdf`: renderiza todas las facturas desde su XML en un solo documento."""
+    maximo = EXPORT_CONFIG["max_pdf_facturas"]
+    datos, faltantes = [], []
+    for lote in _lotes(uuids, EXPORT_CONFIG["batch_size"]):
+        xmls = _xml_lote(lote)
+        for uuid in lote:
+            if uuid not in xmls:
+                faltantes.append(uuid)
+                continue
+            try:
+                datos.append(_parse_xml(xmls[uuid]))
+            except Exception as e:
+                print(f"[exportar] XML inválido para {uuid}: {e}")
+                faltantes.append(uuid)
+                continue
+            if len(datos) > maximo:
+                raise ValueError(f"Más de {maximo} facturas para un PDF; use formato=zip")
+
+    if not datos:
+        return None, faltantes
+    archivo = tempfile.SpooledTemporaryFile(max_size=8 * 1024 * 1024)
+    try:
+        obtener_plantilla().render_lote(datos, archivo)
+        archivo.seek(0)
+    except Exception:
+        archivo.close()
+        raise
+    print(f"[exportar] PDF con {len(datos)} facturas ({len(faltantes)} faltantes)")
+    return _bloques(archivo), faltantes
+
+
+def _bloques(archivo) -> Iterator[bytes]:
+    with archivo:
+        while True:
+            data = archivo.read(TAMANO_BLOQUE)
+            if not data:
+                return
+            yield data
@@ -1,7 +1,13 @@
 import os
-from config.settings import PENDIENTES_BASE, PENDIENTES_DIAN, ERROR_DIR
+from config.settings import PENDIENTES_BASE, PENDIENTES_DIAN, ERROR_DIR, STATIC_PDFS
+from services.blob_store import blob_store, blob_store_activo
 
 def save_xml(content, filename, folder="base"):
+    # El XML base de la factura va al almacén por hash, indexado por uuid (nombre sin extensión)
+    if folder == "base" and blob_store_activo():
+        uuid = os.path.splitext(filename)[0]
+        return blob_store.save(uuid, "xml", content.encode("utf-8"))
+
     if folder == "base":
         path = os.path.join(PENDIENTES_BASE, filename)
     elif folder == "xmldian":
@@ -14,3 +20,12 @@ def save_xml(content, filename, folder="base"):
         f.write(content)
         f.flush()
     return path
+
+
+def buscar_documento(uuid, tipo):
+    """Ruta del XML/PDF de la factura: primero el almacén por hash, luego las carpetas anteriores."""
+    path = blob_store.path_for(uuid, tipo)
+    if path:
+        return path
+    legacy = os.path.join(PENDIENTES_BASE if tipo == "xml" else STATIC_PDFS, f"{uuid}.{tipo}")
+    return legacy if os.path.exists(legacy) else None
@@ -0,0 +1,264 @@
+"""
+Recursos de logging compartidos por proceso: un solo `MongoClient` para todos los
+`DatabaseLogger` (en la práctica, la instancia global `services.logger.db_logger`).
+
+- El cliente Mongo (con su propio pool de conexiones) se crea la primera vez que
+  se necesita y se comparte entre todos los módulos; tras un fork se crea otro.
+- Colecciones capped e índices se crean una vez por despliegue: un documento
+  marcador (`MONGO_CONFIG["collection_meta"]`) guarda la versión del esquema y,
+  si ya está al día, al arrancar no se llama a `list_collection_names` ni a
+  `create_index`. Para agregar un índice: sumarlo a `INDICES` y subir
+  `ESQUEMA_VERSION`; los que dejan de usarse van a `INDICES_OBSOLETOS`.
+- PostgreSQL comparte el pool de `database.connection` y el envío por lotes de
+  `services.log_shipper`.
+- Arranque diferido (`LOG_BACKENDS_INIT=diferido`): `iniciar()` conecta ambos
+  backends en un hilo, así la app atiende mientras tanto; los logs esperan en el
+  buffer del envío por lotes.
+- Un circuit breaker por backend: tras `LOG_BREAKER_FAILURES` fallos seguidos deja
+  de intentarlo durante `LOG_BREAKER_COOLDOWN` segundos y luego prueba una vez.
+  Con el circuito abierto nadie paga el timeout de conexión.
+"""
+import logging
+import os
+import threading
+import time
+from datetime import datetime
+from typing import Dict, Optional, Tuple
+
+from config.settings import LOG_BACKENDS_CONFIG, MONGO_CONFIG
+from database.connection import pooled_connection
+
+try:
+    from pymongo import MongoClient
+    from pymongo.errors import CollectionInvalid
+except Exception:
+    MongoClient = CollectionInvalid = None  # Se manejará si falta dependencia
+
+logger = logging.getLogger("facturacion")
+
+ESQUEMA_VERSION = 3
+MARCADOR_ID = "logs"
+
+# (nombre, claves, opciones) para ambas colecciones. Siguen la forma de las consultas
+# de models.consulta_logs: filtros por igualdad y luego el orden (ts, _id) del cursor.
+# Sin índice TTL: MongoDB no lo admite en colecciones capped (la retención es por tamaño)
+INDICES = [
+    ("idx_ts_id", [("ts", -1), ("_id", -1)], {}),
+    ("idx_level_ts", [("level", 1), ("ts", -1), ("_id", -1)], {}),
+    ("idx_module_ts", [("module", 1), ("ts", -1), ("_id", -1)], {}),
+    ("idx_level_module_ts", [("level", 1), ("module", 1), ("ts", -1), ("_id", -1)], {}),
+    # Línea de tiempo de una factura
+    ("idx_uuid_ts", [("uuid", 1), ("ts", 1)], {}),
+]
+# Cubiertos por los anteriores (son prefijos) o TTL de colecciones creadas sin capped;
+# se borran al actualizar el esquema
+INDICES_OBSOLETOS = ["idx_level_module", "idx_uuid", "idx_ts_ttl"]
+
+
+class CircuitBreaker:
+    """Cerrado: se intenta siempre. Abierto: no se intenta hasta que pase la espera; luego una prueba."""
+
+    def __init__(self, nombre: str, umbral: int = 3, espera: float = 30.0):
+        self.nombre = nombre
+        self.umbral = max(1, int(umbral))
+        self.espera = max(0.0, float(espera))
+        self._lock = threading.Lock()
+        self._fallos = 0
+        self._abierto_hasta: Optional[float] = None
+        self._aperturas = 0
+
+    def permitir(self) -> bool:
+        with self._lock:
+            if self._abierto_hasta is None:
+                return True
+            if time.monotonic() < self._abierto_hasta:
+                return False
+            # Semiabierto: un solo intento; los demás esperan otra ventana
+            self._abierto_hasta = time.monotonic() + self.espera
+            return True
+
+    def abierto(self) -> bool:
+        with self._lock:
+            return self._abierto_hasta is not None
+
+    def exito(self):
+        with self._lock:
+            cerrado = self._abierto_hasta is not None
+            self._fallos = 0
+            self._abierto_hasta = None
+        if cerrado:
+            logger.info(f"[LogRegistry] {self.nombre} disponible de nuevo")
+
+    def fallo(self):
+        with self._lock:
+            self._fallos += 1
+            if self._fallos < self.umbral and self._abierto_hasta is None:
+                return
+            abrir = self._abierto_hasta is None
+            self._abierto_hasta = time.monotonic() + self.espera
+            if abrir:
+                self._aperturas += 1
+        if abrir:
+            logger.warning(f"[LogRegistry] {self.nombre} no disponible; se reintenta en {self.espera:.0f}s")
+
+    def estado(self) -> Dict:
+        with self._lock:
+            restante = None if self._abierto_hasta is None else max(0.0, self._abierto_hasta - time.monotonic())
+            return {"abierto": restante is not None, "reintento_en_s": restante,
+                    "fallos_seguidos": self._fallos, "aperturas": self._aperturas}
+
+
+class LogRegistry:
+    """Recursos de logging compartidos por todo el proceso."""
+
+    def __init__(self, umbral: int = 3, espera: float = 30.0):
+        self._lock = threading.Lock()
+        self._pid: Optional[int] = None
+        self._client = None
+        self._colecciones: Tuple = (None, None)
+        self.breaker_pg = CircuitBreaker("PostgreSQL", umbral, espera)
+        self.breaker_mongo = CircuitBreaker("MongoDB", umbral, espera)
+        self._iniciado = False
+
+    # ---------- arranque ----------
+    def iniciar(self, diferido: bool = True):
+        """Conecta PostgreSQL y Mongo (en un hilo si `diferido`) y arranca el envío de logs."""
+        if self._iniciado:
+            return
+        self._iniciado = True
+        if diferido:
+            threading.Thread(target=self._conectar_backends, name="log-backends", daemon=True).start()
+        else:
+            self._conectar_backends()
+
+    def _conectar_backends(self):
+        from services.log_shipper import log_shipper
+        self.verificar_postgres()
+        if self.mongo_disponible() and self.breaker_mongo.permitir():
+            self.colecciones()
+        log_shipper.start()
+
+    def verificar_postgres(self) -> bool:
+        """Prueba una conexión del pool y actualiza el breaker de PostgreSQL."""
+        if not self.breaker_pg.permitir():
+            return False
+        try:
+            with pooled_connection() as conn:
+                ok = conn is not None
+        except Exception:
+            ok = False
+        if ok:
+            self.breaker_pg.exito()
+        else:
+            self.breaker_pg.fallo()
+        return ok
+
+    # ---------- MongoDB ----------
+    def mongo_disponible(self) -> bool:
+        """pymongo instalado (que el servidor responda lo indica el breaker)."""
+        return MongoClient is not None
+
+    def mongo_conectado(self) -> bool:
+        return self._pid == os.getpid() and self._client is not None
+
+    def colecciones(self, conectar: bool = True) -> Tuple:
+        """(facturacion, sistema); (None, None) si Mongo no está disponible.
+
+        Si no hay cliente y `conectar`, intenta conectar y anota el resultado en
+        `breaker_mongo` (quien llama consulta antes `breaker_mongo.permitir()`).
+        Con `conectar=False` nunca espera al servidor.
+        """
+        if self.mongo_conectado():
+            return self._colecciones
+        if not conectar or not self.mongo_disponible():
+            return None, None
+        with self._lock:
+            if self._pid != os.getpid():
+                # Proceso nuevo (o hijo de un fork): el cliente heredado no es utilizable
+                self._client = None
+                self._pid = os.getpid()
+            if self._client is None:
+                self._conectar()
+            return self._colecciones
+
+    def _conectar(self):
+        client = None
+        try:
+            client = MongoClient(
+                MONGO_CONFIG["uri"],
+                serverSelectionTimeoutMS=3000,
+                maxPoolSize=MONGO_CONFIG["max_pool_size"],
+            )
+            db = client[MONGO_CONFIG["database"]]
+            meta = db[MONGO_CONFIG["collection_meta"]]
+            marcador = meta.find_one({"_id": MARCADOR_ID}) or {}
+            if marcador.get("version", 0) < ESQUEMA_VERSION:
+                self._crear_esquema(db)
+                meta.update_one(
+                    {"_id": MARCADOR_ID},
+                    {"$set": {"version": ESQUEMA_VERSION, "actualizado": datetime.utcnow()}},
+                    upsert=True,
+                )
+            self._colecciones = (db[MONGO_CONFIG["collection_facturacion"]], db[MONGO_CONFIG["collection_sistema"]])
+            self._client = client
+            self.breaker_mongo.exito()
+            logger.info("[MongoLogger] Cliente Mongo compartido inicializado")
+        except Exception as e:
+            logger.warning(f"[MongoLogger] No se pudo inicializar MongoDB: {e}")
+            self.breaker_mongo.fallo()
+            self._colecciones = (None, None)
+            if client is not None:
+                client.close()
+
+    def _crear_esquema(self, db):
+        """Crea colecciones capped e índices (nivel/módulo/ts, uuid) si faltan; borra los obsoletos."""
+        names = db.list_collection_names()
+        cols = []
+        for name in (MONGO_CONFIG["collection_facturacion"], MONGO_CONFIG["collection_sistema"]):
+            if name not in names:
+                try:
+                    db.create_collection(name, capped=True, size=MONGO_CONFIG["max_size_bytes"], max=None)
+                except CollectionInvalid:
+                    pass  # Otro proceso la creó entre list_collection_names y create_collection
+            col = db[name]
+            if not col.options().get("capped"):
+                logger.warning(
+                    f"[MongoLogger] {name} no es capped: no rota por tamaño ni admite /api/logs/stream"
+                )
+            cols.append(col)
+
+        for col in cols:
+            existentes = set(col.index_information())
+            for nombre in INDICES_OBSOLETOS:
+                if nombre in existentes:
+                    try:
+                        col.drop_index(nombre)
+                    except Exception as e:
+                        logger.warning(f"[MongoLogger] No se pudo borrar índice {nombre} en {col.name}: {e}")
+            for nombre, claves, opciones in INDICES:
+                try:
+                    col.create_index(claves, name=nombre, background=True, **opciones)
+                except Exception as e:
+                    # Un índice rechazado no debe dejar sin logs Mongo al resto
+                    logger.warning(f"[MongoLogger] No se pudo crear índice {nombre} en {col.name}: {e}")
+        logger.info(f"[MongoLogger] Esquema de logs Mongo en versión {ESQUEMA_VERSION}")
+
+    def estado(self) -> Dict:
+        return {
+            "postgres": self.breaker_pg.estado(),
+            "mongo": {"instalado": self.mongo_disponible(), "conectado": self.mongo_conectado(),
+                      **self.breaker_mongo.estado()},
+        }
+
+    def close(self):
+        with self._lock:
+            if self._client is not None:
+                self._client.close()
+            self._client = None
+            self._colecciones = (None, None)
+
+
+log_registry = LogRegistry(
+    umbral=LOG_BACKENDS_CONFIG["breaker_failures"],
+    espera=LOG_BACKENDS_CONFIG["breaker_cooldown"],
+)
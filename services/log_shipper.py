@@ -0,0 +1,325 @@
+"""
+Envío de logs en segundo plano (PostgreSQL `logs` y colecciones Mongo).
+
+`DatabaseLogger` ya no escribe en la petición: deja cada registro en una cola en
+memoria y un hilo los envía por lotes.
+
+- Cola acotada (`LOG_QUEUE_MAX`). Con la cola llena, la política `drop` descarta el
+  registro y `block` espera hasta `LOG_BLOCK_TIMEOUT` antes de descartarlo. Los
+  descartes se cuentan en `stats()`; el archivo de log los conserva igual.
+- Un lote se envía al juntar `LOG_BATCH` registros o al pasar `LOG_FLUSH_SECONDS`
+  desde el primero. PostgreSQL recibe un INSERT multi-fila por lote; cada colección
+  Mongo recibe un `insert_many` por lote.
+- El timestamp se toma al registrar, no al enviar.
+- Cada lote pasa primero por el spool en disco de su backend (`services.log_spool`)
+  y se envía leyendo desde ahí. Si el backend no responde (o su circuit breaker está
+  abierto, ver `services.log_registry`), los registros esperan en el spool, también
+  entre reinicios, y se envían cuando vuelve. Sin spool (`LOG_SPOOL=0`, u otro
+  proceso lo tiene) esperan en memoria, hasta `LOG_BUFFER_MAX` por backend.
+  Un lote que el backend rechaza estando conectado (datos inválidos) se descarta
+  con una advertencia en el archivo de log.
+"""
+import atexit
+import logging
+import os
+import queue
+import threading
+import time
+from datetime import datetime
+from typing import Dict, List, Optional
+
+from config.settings import LOG_BACKENDS_CONFIG, LOG_SHIPPER_CONFIG
+from database.connection import pooled_connection
+from database.schema import schema_registry
+from models.log import Log
+from services.log_registry import log_registry
+from services.log_spool import BufferMemoria, abrir_flujo
+
+try:
+    from pymongo.errors import BulkWriteError, ConnectionFailure
+except Exception:
+    BulkWriteError = None
+    ConnectionFailure = OSError
+
+# Código de Mongo para clave duplicada: el documento ya estaba guardado (reenvío del spool)
+_DUPLICADO = 11000
+
+# Mismo logger de archivo que services.logger (sin importarlo: ese módulo depende de este)
+logger = logging.getLogger("facturacion")
+
+POSTGRES = "pg"
+MONGO = "mongo"
+
+
+class _Vaciar:
+    """Marca en la cola: el hilo envía lo acumulado y avisa."""
+
+    __slots__ = ("evento",)
+
+    def __init__(self):
+        self.evento = threading.Event()
+
+
+class LogShipper:
+    """Cola acotada + hilo que envía los logs por lotes."""
+
+    def __init__(self, max_queue: int = 10000, batch_size: int = 200, flush_interval: float = 0.5,
+                 policy: str = "drop", block_timeout: float = 0.05, buffer_max: int = 20000):
+        self.batch_size = max(1, int(batch_size))
+        self.flush_interval = max(0.01, float(flush_interval))
+        self.policy = policy if policy in ("drop", "block") else "drop"
+        self.block_timeout = max(0.0, float(block_timeout))
+        self._queue: "queue.Queue" = queue.Queue(maxsize=max(1, int(max_queue)))
+        self._lock = threading.Lock()
+        self._pid: Optional[int] = None
+        # Registros recibidos que su backend todavía no confirmó: spool o memoria por backend.
+        # Los abre el hilo de envío (solo él los toca)
+        self.buffer_max = max(1, int(buffer_max))
+        self._flujos: Optional[Dict] = None
+        self._stats = {"encolados": 0, "descartados": 0, "enviados_pg": 0, "enviados_mongo": 0,
+                       "lotes": 0, "errores": 0}
+        self._ultimo_aviso = 0.0
+
+    # ---------- ciclo de vida ----------
+    def start(self):
+        """Arranca el hilo de envío (una vez por proceso; tras un fork se vuelve a arrancar)."""
+        pid = os.getpid()
+        if self._pid == pid:
+            return
+        with self._lock:
+            if self._pid == pid:
+                return
+            if self._pid is not None:
+                # Proceso hijo: la cola heredada puede tener registros del padre y un lock tomado
+                self._queue = queue.Queue(maxsize=self._queue.maxsize)
+                # El spool del padre sigue siendo suyo (lock y archivos abiertos)
+                self._flujos = None
+            self._pid = pid
+            threading.Thread(target=self._run, name="log-shipper", daemon=True).start()
+
+    def flush(self, timeout: float = 5.0) -> bool:
+        """Envía lo que haya en la cola (o lo deja en el spool con fsync). False si no terminó en `timeout`."""
+        if self._pid != os.getpid():
+            return True
+        marca = _Vaciar()
+        try:
+            self._queue.put(marca, timeout=timeout)
+        except queue.Full:
+            return False
+        return marca.evento.wait(timeout)
+
+    # ---------- encolado ----------
+    def submit_postgres(self, level: str, message: str, module: Optional[str], error_details: Optional[str]):
+        self._submit((POSTGRES, None, (level, message, module, error_details, datetime.now())))
+
+    def submit_mongo(self, category: str, doc: Dict):
+        """`category`: "facturacion" o "sistema"; la colección se resuelve en el hilo de envío."""
+        self._submit((MONGO, category, doc))
+
+    def _submit(self, registro):
+        self.start()
+        try:
+            if self.policy == "block":
+                self._queue.put(registro, timeout=self.block_timeout)
+            else:
+                self._queue.put_nowait(registro)
+        except queue.Full:
+            with self._lock:
+                self._stats["descartados"] += 1
+                avisar = time.monotonic() - self._ultimo_aviso > 10
+                if avisar:
+                    self._ultimo_aviso = time.monotonic()
+            if avisar:
+                logger.warning(f"[LogShipper] Cola de logs llena ({self._queue.maxsize}); descartando registros")
+            return
+        with self._lock:
+            self._stats["encolados"] += 1
+
+    # ---------- envío ----------
+    def _run(self):
+        self._flujos = {
+            POSTGRES: abrir_flujo(POSTGRES, self.buffer_max),
+            MONGO: abrir_flujo(MONGO, self.buffer_max),
+        }
+        while True:
+            lote: List = []
+            marcas: List[_Vaciar] = []
+            # Con registros pendientes (también los del spool de una ejecución anterior)
+            # se despierta cada intervalo para reintentar
+            espera = self.flush_interval if any(f.pendientes() for f in self._flujos.values()) else None
+            try:
+                item = self._queue.get(timeout=espera)
+            except queue.Empty:
+                item = None
+            limite = time.monotonic() + self.flush_interval
+            while item is not None:
+                if isinstance(item, _Vaciar):
+                    marcas.append(item)
+                    break
+                lote.append(item)
+                if len(lote) >= self.batch_size:
+                    break
+                restante = limite - time.monotonic()
+                if restante <= 0:
+                    break
+                try:
+                    item = self._queue.get(timeout=restante)
+                except queue.Empty:
+                    break
+            try:
+                self._enviar(lote)
+            except Exception as e:
+                logger.warning(f"[LogShipper] Error inesperado enviando logs: {e}")
+            if marcas:
+                for flujo in self._flujos.values():
+                    try:
+                        flujo.sincronizar(forzar=True)
+                    except OSError as e:
+                        logger.warning(f"[LogSpool] fsync fallido: {e}")
+            for marca in marcas:
+                marca.evento.set()
+
+    def _guardar(self, destino: str, registros: List):
+        """Agrega al spool del backend; si el disco falla, ese backend sigue en memoria."""
+        flujo = self._flujos[destino]
+        try:
+            descartados = flujo.agregar(registros)
+        except OSError as e:
+            logger.warning(f"[LogSpool] No se pudo escribir el spool {destino}: {e}; pendientes en memoria")
+            # Lo ya escrito en disco se reenvía al reiniciar
+            flujo = self._flujos[destino] = BufferMemoria(self.buffer_max)
+            descartados = flujo.agregar(registros)
+        if descartados:
+            with self._lock:
+                self._stats["descartados"] += descartados
+
+    def _enviar(self, lote: List):
+        por_destino: Dict[str, List] = {POSTGRES: [], MONGO: []}
+        for destino, category, dato in lote:
+            por_destino[destino].append(dato if destino == POSTGRES else (category, dato))
+        for destino, registros in por_destino.items():
+            if registros:
+                self._guardar(destino, registros)
+        if lote:
+            with self._lock:
+                self._stats["lotes"] += 1
+        for flujo in self._flujos.values():
+            flujo.sincronizar()
+        if self._flujos[POSTGRES].pendientes():
+            self._drenar_postgres()
+        if self._flujos[MONGO].pendientes():
+            self._drenar_mongo()
+
+    def _drenar_postgres(self):
+        flujo = self._flujos[POSTGRES]
+        breaker = log_registry.breaker_pg
+        while flujo.pendientes() and breaker.permitir():
+            registros, marca = flujo.leer(self.batch_size)
+            if marca is None:
+                return
+            if not registros:
+                flujo.confirmar(marca)
+                continue
+            filas = [tuple(fila) for _, fila in registros]
+            # Con el índice único de spool_id, reenviar un lote ya guardado no duplica filas
+            claves = [clave for clave, _ in registros]
+            if claves[0] is None or not schema_registry.is_unique("logs", ["spool_id"]):
+                claves = None
+            insertadas = None
+            try:
+                with pooled_connection() as conn:
+                    if conn is not None:
+                        insertadas = Log.insert_many(conn, filas, claves)
+            except Exception as e:
+                logger.warning(f"[WARNING] No se pudo guardar lote de logs en PostgreSQL: {e}")
+            if insertadas is None:
+                # Sin conexión o error pasajero (timeout, bloqueo, solo lectura...): siguen pendientes
+                breaker.fallo()
+                return
+            breaker.exito()
+            flujo.confirmar(marca)
+            with self._lock:
+                if insertadas < len(filas):
+                    self._stats["errores"] += 1
+                else:
+                    self._stats["enviados_pg"] += insertadas
+            if insertadas < len(filas):
+                # Solo datos inválidos (DataError/IntegrityError): reintentarlos no sirve
+                logger.warning(f"[LogShipper] {len(filas)} logs rechazados por PostgreSQL; lote descartado")
+
+    def _drenar_mongo(self):
+        flujo = self._flujos[MONGO]
+        if not log_registry.mongo_disponible():
+            # Sin pymongo no hay a dónde enviarlos
+            while True:
+                _, marca = flujo.leer(self.batch_size)
+                if marca is None:
+                    return
+                flujo.confirmar(marca)
+        breaker = log_registry.breaker_mongo
+        while flujo.pendientes() and breaker.permitir():
+            fact, sistema = log_registry.colecciones()
+            if fact is None:
+                return
+            registros, marca = flujo.leer(self.batch_size)
+            if marca is None:
+                return
+            por_categoria: Dict[str, List[Dict]] = {}
+            for clave, (category, doc) in registros:
+                if clave is not None:
+                    # _id estable: reenviar un documento ya guardado da clave duplicada, no otro documento
+                    doc["_id"] = clave
+                por_categoria.setdefault(category, []).append(doc)
+            enviados = errores = 0
+            try:
+                for category, docs in por_categoria.items():
+                    collection = fact if category == "facturacion" else sistema
+                    try:
+                        collection.insert_many(docs, ordered=False)
+                        enviados += len(docs)
+                    except ConnectionFailure:
+                        raise
+                    except Exception as e:
+                        if BulkWriteError is not None and isinstance(e, BulkWriteError) and all(
+                            err.get("code") == _DUPLICADO for err in e.details.get("writeErrors", [])
+                        ):
+                            enviados += e.details.get("nInserted", 0)
+                            continue
+                        errores += 1
+                        logger.warning(f"[MongoLogger] Fallo insert_many Mongo ({len(docs)} docs): {e}")
+            except ConnectionFailure as e:
+                # El tramo se vuelve a enviar completo; lo que ya se había insertado da clave duplicada
+                logger.warning(f"[MongoLogger] Mongo no responde: {e}")
+                breaker.fallo()
+                return
+            breaker.exito()
+            flujo.confirmar(marca)
+            with self._lock:
+                self._stats["enviados_mongo"] += enviados
+                self._stats["errores"] += errores
+
+    # ---------- consulta ----------
+    def stats(self) -> Dict:
+        with self._lock:
+            return {
+                "en_cola": self._queue.qsize(),
+                "cola_max": self._queue.maxsize,
+                "politica": self.policy,
+                "lote_max": self.batch_size,
+                "intervalo_s": self.flush_interval,
+                **self._stats,
+                "pendientes": {d: f.estado() for d, f in (self._flujos or {}).items()},
+            }
+
+
+log_shipper = LogShipper(
+    max_queue=LOG_SHIPPER_CONFIG["max_queue"],
+    batch_size=LOG_SHIPPER_CONFIG["batch_size"],
+    flush_interval=LOG_SHIPPER_CONFIG["flush_interval"],
+    policy=LOG_SHIPPER_CONFIG["policy"],
+    block_timeout=LOG_SHIPPER_CONFIG["block_timeout"],
+    buffer_max=LOG_BACKENDS_CONFIG["buffer_max"],
+)
+
+# Al salir se envía lo pendiente (hilo daemon: sin esto se perdería la cola)
+atexit.register(log_shipper.flush, 5.0)
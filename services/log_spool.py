@@ -0,0 +1,331 @@
+"""
+Spool local (write-ahead) de los logs que van a PostgreSQL y Mongo.
+
+El hilo de `services.log_shipper` escribe cada lote aquí antes de enviarlo y envía
+leyendo desde aquí: un registro sale del spool solo cuando su backend lo confirma,
+así que una caída del backend (o de la app) no lo pierde.
+
+- Un spool por backend (`spool/logs/pg`, `spool/logs/mongo`) con segmentos JSONL
+  append-only que rotan al llegar a `LOG_SPOOL_SEGMENT_MB`. Cada lote es una sola
+  escritura; fsync como mucho cada `LOG_SPOOL_FSYNC_SECONDS`, al rotar y al vaciar.
+- `offsets.json` guarda, por segmento, hasta qué byte está confirmado; un segmento
+  cerrado y confirmado entero se borra. Tras un reinicio se reenvía desde el offset.
+  Cada registro lleva la clave `<segmento>:<offset>` (`logs.spool_id` y `_id` en
+  Mongo): reenviar lo que el backend ya había guardado no lo duplica.
+- Un solo proceso usa cada directorio (lock del sistema operativo); otro proceso de
+  la app, o un spool sin disco disponible, usa `BufferMemoria`.
+- Por encima de `LOG_SPOOL_MAX_MB` se descartan los segmentos más antiguos.
+"""
+import json
+import logging
+import os
+import time
+from collections import deque
+from datetime import date, datetime
+from itertools import islice
+from typing import Dict, List, Optional, Tuple
+
+from config.settings import LOG_SPOOL_CONFIG
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+logger = logging.getLogger("facturacion")
+
+EXTENSION = ".jsonl"
+_OFFSETS = "offsets.json"
+_LOCK = ".lock"
+
+
+class SpoolOcupado(Exception):
+    """Otro proceso tiene el lock del directorio."""
+
+
+def _a_json(obj):
+    if isinstance(obj, datetime):
+        return {"$date": obj.isoformat()}
+    if isinstance(obj, date):
+        return obj.isoformat()
+    return str(obj)
+
+
+def _de_json(d: Dict):
+    if len(d) == 1 and "$date" in d:
+        return datetime.fromisoformat(d["$date"])
+    return d
+
+
+def _bloquear(archivo) -> bool:
+    try:
+        if fcntl is not None:
+            fcntl.flock(archivo.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+        else:
+            archivo.seek(0)
+            msvcrt.locking(archivo.fileno(), msvcrt.LK_NBLCK, 1)
+        return True
+    except OSError:
+        return False
+
+
+class BufferMemoria:
+    """Pendientes en memoria, acotados (se descartan los más antiguos). Misma interfaz que el spool."""
+
+    def __init__(self, maximo: int = 20000):
+        self.maximo = max(1, int(maximo))
+        self._registros: deque = deque()
+
+    def agregar(self, registros: List) -> int:
+        """Retorna cuántos registros se descartaron para respetar el tope."""
+        self._registros.extend(registros)
+        sobran = max(0, len(self._registros) - self.maximo)
+        for _ in range(sobran):
+            self._registros.popleft()
+        return sobran
+
+    def leer(self, n: int) -> Tuple[List[Tuple[None, object]], Optional[int]]:
+        registros = [(None, r) for r in islice(self._registros, n)]
+        return registros, (len(registros) or None)
+
+    def confirmar(self, marca: int):
+        for _ in range(marca):
+            self._registros.popleft()
+
+    def pendientes(self) -> bool:
+        return bool(self._registros)
+
+    def sincronizar(self, forzar: bool = False):
+        pass
+
+    def estado(self) -> Dict:
+        return {"tipo": "memoria", "registros": len(self._registros), "maximo": self.maximo}
+
+    def cerrar(self):
+        pass
+
+
+class SpoolSegmentado:
+    """Segmentos JSONL append-only de un backend con offsets confirmados por segmento.
+
+    Lo usa un solo hilo (el de envío); no es seguro llamarlo desde varios a la vez.
+    """
+
+    def __init__(self, directorio: str, segmento_max: int = 16 * 1024 * 1024,
+                 fsync_intervalo: float = 1.0, max_bytes: int = 1024 * 1024 * 1024):
+        self.directorio = directorio
+        self.segmento_max = max(1024, int(segmento_max))
+        self.fsync_intervalo = max(0.0, float(fsync_intervalo))
+        self.max_bytes = max(self.segmento_max, int(max_bytes))
+        os.makedirs(directorio, exist_ok=True)
+        self._lock = open(os.path.join(directorio, _LOCK), "a+b")
+        if not _bloquear(self._lock):
+            self._lock.close()
+            raise SpoolOcupado(directorio)
+
+        self._segmentos: List[str] = sorted(f for f in os.listdir(directorio) if f.endswith(EXTENSION))
+        self._tamanos: Dict[str, int] = {s: os.path.getsize(self._ruta(s)) for s in self._segmentos}
+        self._offsets: Dict[str, int] = {
+            s: off for s, off in self._cargar_offsets().items() if s in self._tamanos
+        }
+        # Siempre se escribe en un segmento nuevo: el último de la ejecución anterior puede estar cortado
+        self._activo: Optional[str] = None
+        self._archivo = None
+        self._sucio = False
+        self._ultimo_fsync = time.monotonic()
+        self._lector: Optional[Tuple[str, object]] = None
+        self.fsyncs = 0
+        self.descartados = 0
+
+    def _ruta(self, nombre: str) -> str:
+        return os.path.join(self.directorio, nombre)
+
+    def _cargar_offsets(self) -> Dict[str, int]:
+        try:
+            with open(self._ruta(_OFFSETS), "r", encoding="utf-8") as f:
+                return {k: int(v) for k, v in json.load(f).items()}
+        except FileNotFoundError:
+            return {}
+        except (OSError, ValueError, AttributeError) as e:
+            # Sin offsets se reenvía todo: las claves evitan duplicados
+            logger.warning(f"[LogSpool] offsets ilegibles en {self.directorio}: {e}")
+            return {}
+
+    def _guardar_offsets(self):
+        tmp = self._ruta(_OFFSETS + ".tmp")
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(self._offsets, f)
+        os.replace(tmp, self._ruta(_OFFSETS))
+
+    # ---------- escritura ----------
+    def agregar(self, registros: List) -> int:
+        """Escribe los registros al final del segmento activo. Retorna cuántos se descartaron por el tope."""
+        datos = "".join(
+            json.dumps(r, ensure_ascii=False, separators=(",", ":"), default=_a_json) + "\n"
+            for r in registros
+        ).encode("utf-8")
+        if self._archivo is None:
+            self._abrir_segmento()
+        self._archivo.write(datos)
+        # Al sistema operativo en cada lote (la lectura lo ve); al disco según fsync_intervalo
+        self._archivo.flush()
+        self._tamanos[self._activo] += len(datos)
+        self._sucio = True
+        self.sincronizar()
+        if self._tamanos[self._activo] >= self.segmento_max:
+            self._rotar()
+            return self._recortar()
+        return 0
+
+    def _abrir_segmento(self):
+        ahora = int(time.time() * 1000)
+        if self._segmentos:
+            ahora = max(ahora, int(self._segmentos[-1][: -len(EXTENSION)]) + 1)
+        nombre = f"{ahora:013d}{EXTENSION}"
+        self._archivo = open(self._ruta(nombre), "ab")
+        self._activo = nombre
+        self._segmentos.append(nombre)
+        self._tamanos[nombre] = 0
+
+    def sincronizar(self, forzar: bool = False):
+        """fsync del segmento activo si pasó `fsync_intervalo` desde el anterior (o si `forzar`)."""
+        if not self._sucio or self._archivo is None:
+            return
+        if not forzar and time.monotonic() - self._ultimo_fsync < self.fsync_intervalo:
+            return
+        os.fsync(self._archivo.fileno())
+        self._sucio = False
+        self._ultimo_fsync = time.monotonic()
+        self.fsyncs += 1
+
+    def _rotar(self):
+        self.sincronizar(forzar=True)
+        self._archivo.close()
+        self._archivo = None
+        self._activo = None
+
+    def _recortar(self) -> int:
+        descartados = 0
+        while sum(self._tamanos.values()) > self.max_bytes and len(self._segmentos) > 1:
+            nombre = self._segmentos[0]
+            with open(self._ruta(nombre), "rb") as f:
+                f.seek(self._offsets.get(nombre, 0))
+                perdidos = sum(bloque.count(b"\n") for bloque in iter(lambda: f.read(1 << 20), b""))
+            descartados += perdidos
+            self._borrar(nombre)
+            logger.warning(f"[LogSpool] Spool {self.directorio} lleno: descartado {nombre} ({perdidos} registros)")
+        if descartados:
+            self.descartados += descartados
+            self._guardar_offsets()
+        return descartados
+
+    # ---------- lectura ----------
+    def leer(self, n: int) -> Tuple[List[Tuple[str, object]], Optional[Tuple[str, int]]]:
+        """Hasta `n` registros no confirmados del segmento más antiguo: ([(clave, registro)], marca).
+
+        La marca se pasa a `confirmar()` cuando el backend guardó el lote; sin
+        confirmar, la siguiente lectura vuelve a empezar en el mismo punto.
+        """
+        for nombre in list(self._segmentos):
+            inicio = self._offsets.get(nombre, 0)
+            tamano = self._tamanos[nombre]
+            if inicio >= tamano:
+                if nombre != self._activo:
+                    self._borrar(nombre)
+                    self._guardar_offsets()
+                    continue
+                return [], None
+            f = self._abrir_lector(nombre)
+            f.seek(inicio)
+            registros = []
+            pos = inicio
+            base = nombre[: -len(EXTENSION)]
+            while len(registros) < n and pos < tamano:
+                linea = f.readline(tamano - pos)
+                if not linea.endswith(b"\n"):
+                    # Línea cortada (la app terminó a mitad de escritura): se salta el resto
+                    logger.warning(f"[LogSpool] Registro incompleto al final de {nombre}; se omite")
+                    pos = tamano
+                    break
+                clave = f"{base}:{pos}"
+                pos += len(linea)
+                try:
+                    registros.append((clave, json.loads(linea, object_hook=_de_json)))
+                except ValueError:
+                    logger.warning(f"[LogSpool] Registro ilegible en {clave}; se omite")
+            return registros, (nombre, pos)
+        return [], None
+
+    def _abrir_lector(self, nombre: str):
+        if self._lector is not None and self._lector[0] == nombre:
+            return self._lector[1]
+        self._cerrar_lector()
+        f = open(self._ruta(nombre), "rb")
+        self._lector = (nombre, f)
+        return f
+
+    def _cerrar_lector(self):
+        if self._lector is not None:
+            self._lector[1].close()
+            self._lector = None
+
+    def confirmar(self, marca: Tuple[str, int]):
+        nombre, pos = marca
+        if nombre not in self._tamanos:
+            return
+        self._offsets[nombre] = pos
+        if nombre != self._activo and pos >= self._tamanos[nombre]:
+            self._borrar(nombre)
+        self._guardar_offsets()
+
+    def _borrar(self, nombre: str):
+        if self._lector is not None and self._lector[0] == nombre:
+            self._cerrar_lector()
+        try:
+            os.remove(self._ruta(nombre))
+        except OSError as e:
+            logger.warning(f"[LogSpool] No se pudo borrar {nombre}: {e}")
+        self._segmentos.remove(nombre)
+        self._tamanos.pop(nombre, None)
+        self._offsets.pop(nombre, None)
+
+    # ---------- estado ----------
+    def pendientes(self) -> bool:
+        return any(self._tamanos[s] > self._offsets.get(s, 0) for s in self._segmentos)
+
+    def estado(self) -> Dict:
+        # Se consulta desde otros hilos (stats): sin tocar las estructuras del hilo de envío
+        segmentos = list(self._segmentos)
+        return {
+            "tipo": "disco",
+            "directorio": self.directorio,
+            "segmentos": len(segmentos),
+            "bytes_pendientes": sum(max(0, self._tamanos.get(s, 0) - self._offsets.get(s, 0)) for s in segmentos),
+            "fsyncs": self.fsyncs,
+            "descartados": self.descartados,
+        }
+
+    def cerrar(self):
+        if self._archivo is not None:
+            self._rotar()
+        self._cerrar_lector()
+        self._lock.close()
+
+
+def abrir_flujo(nombre: str, buffer_max: int):
+    """Spool en disco de `nombre` ("pg" o "mongo"), o `BufferMemoria` si está desactivado u ocupado."""
+    if LOG_SPOOL_CONFIG["enabled"]:
+        directorio = os.path.join(LOG_SPOOL_CONFIG["dir"], nombre)
+        try:
+            return SpoolSegmentado(
+                directorio,
+                segmento_max=LOG_SPOOL_CONFIG["segment_bytes"],
+                fsync_intervalo=LOG_SPOOL_CONFIG["fsync_interval"],
+                max_bytes=LOG_SPOOL_CONFIG["max_bytes"],
+            )
+        except SpoolOcupado:
+            logger.info(f"[LogSpool] {directorio} en uso por otro proceso; pendientes en memoria")
+        except OSError as e:
+            logger.warning(f"[LogSpool] No se pudo abrir {directorio}: {e}; pendientes en memoria")
+    return BufferMemoria(buffer_max)
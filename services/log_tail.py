@@ -0,0 +1,189 @@
+"""
+Seguimiento en vivo de `logs_facturacion` y `logs_sistema` (GET /api/logs/stream).
+
+- Un solo cursor tailable (await-data) por colección capped, en un hilo, para todos
+  los clientes: cada evento nuevo se reparte a las suscripciones cuyo filtro
+  (level, module, uuid) coincide. Sustituye a N clientes consultando en bucle.
+- El hilo arranca con el primer suscriptor y termina cuando no queda ninguno.
+- Cada suscripción tiene una cola acotada (`LOG_TAIL_QUEUE`): un cliente lento
+  pierde sus eventos más antiguos (contados en `perdidos`), no frena a los demás.
+- El cursor se abre con `ts` mayor que el del último documento presente: solo se
+  envía lo que llega después.
+- Sin Mongo el hilo reintenta cada segundo (respetando `breaker_mongo`).
+"""
+import logging
+import queue
+import threading
+import time
+from typing import Dict, Optional, Set
+
+from config.settings import LOG_TAIL_CONFIG
+from models.consulta_logs import documento_api, proyeccion_mongo
+from services.log_registry import log_registry
+
+try:
+    from pymongo import CursorType
+except Exception:
+    CursorType = None  # Se manejará si falta dependencia
+
+logger = logging.getLogger("facturacion")
+
+FILTROS = ("level", "module", "uuid")
+
+
+class SinCupo(Exception):
+    """Se alcanzó `LOG_TAIL_MAX_CLIENTES`."""
+
+
+class Suscripcion:
+    """Eventos pendientes de un cliente con su filtro."""
+
+    def __init__(self, filtros: Dict[str, Optional[str]], cola_max: int = 1000):
+        self.filtros = {k: v for k, v in filtros.items() if k in FILTROS and v}
+        self._cola: "queue.Queue" = queue.Queue(maxsize=max(1, int(cola_max)))
+        self.perdidos = 0
+
+    def acepta(self, doc: Dict) -> bool:
+        return all(doc.get(k) == v for k, v in self.filtros.items())
+
+    def entregar(self, evento: Dict):
+        """No bloquea nunca: con la cola llena se descarta el evento más antiguo."""
+        while True:
+            try:
+                self._cola.put_nowait(evento)
+                return
+            except queue.Full:
+                try:
+                    self._cola.get_nowait()
+                    self.perdidos += 1
+                except queue.Empty:
+                    pass
+
+    def siguiente(self, timeout: float) -> Optional[Dict]:
+        """Próximo evento, o None si no llegó ninguno en `timeout` segundos."""
+        try:
+            return self._cola.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+
+class LogTail:
+    """Cursor tailable compartido sobre una colección de logs ("facturacion" o "sistema")."""
+
+    def __init__(self, category: str, max_await_ms: int = 1000, cola_max: int = 1000,
+                 max_suscriptores: int = 100):
+        self.category = category
+        self.max_await_ms = max(1, int(max_await_ms))
+        self.cola_max = cola_max
+        self.max_suscriptores = max(1, int(max_suscriptores))
+        self._lock = threading.Lock()
+        self._suscripciones: Set[Suscripcion] = set()
+        self._hilo: Optional[threading.Thread] = None
+        self._stats = {"eventos": 0, "entregados": 0, "cursores": 0}
+
+    # ---------- suscripciones ----------
+    def suscribir(self, **filtros) -> Suscripcion:
+        """Nueva suscripción (arranca el cursor si no estaba). Lanza SinCupo si no hay lugar."""
+        suscripcion = Suscripcion(filtros, self.cola_max)
+        with self._lock:
+            if len(self._suscripciones) >= self.max_suscriptores:
+                raise SinCupo(f"Máximo {self.max_suscriptores} clientes en /api/logs/stream")
+            self._suscripciones.add(suscripcion)
+            if self._hilo is None:
+                self._hilo = threading.Thread(target=self._run, name=f"log-tail-{self.category}", daemon=True)
+                self._hilo.start()
+        return suscripcion
+
+    def cancelar(self, suscripcion: Suscripcion):
+        with self._lock:
+            self._suscripciones.discard(suscripcion)
+
+    def _activo(self) -> bool:
+        with self._lock:
+            if self._hilo is not threading.current_thread():
+                # Otro hilo tomó el relevo (este ya se había dado por terminado)
+                return False
+            if self._suscripciones:
+                return True
+            # Sin clientes el hilo termina; el próximo suscriptor arranca otro
+            self._hilo = None
+            return False
+
+    # ---------- cursor ----------
+    def _coleccion(self):
+        conectar = log_registry.breaker_mongo.permitir()
+        fact, sistema = log_registry.colecciones(conectar)
+        return fact if self.category == "facturacion" else sistema
+
+    def _run(self):
+        while self._activo():
+            collection = self._coleccion()
+            if collection is None:
+                time.sleep(1)
+                continue
+            try:
+                self._seguir(collection)
+            except Exception as e:
+                logger.warning(f"[LogTail] Cursor de logs_{self.category} interrumpido: {e}")
+                time.sleep(1)
+
+    def _seguir(self, collection):
+        cursor = collection.find(
+            self._desde_ahora(collection), proyeccion_mongo(), cursor_type=CursorType.TAILABLE_AWAIT
+        ).max_await_time_ms(self.max_await_ms)
+        with self._lock:
+            self._stats["cursores"] += 1
+        try:
+            while cursor.alive and self._activo():
+                try:
+                    doc = cursor.next()
+                except StopIteration:
+                    # getMore sin datos tras max_await_ms
+                    continue
+                self._repartir(doc)
+        finally:
+            cursor.close()
+        if self._activo():
+            # Un cursor tailable sobre una colección vacía muere enseguida: se reabre
+            time.sleep(0.5)
+
+    @staticmethod
+    def _desde_ahora(collection) -> Dict:
+        """Filtro "posterior al último documento al abrir": la historia no se envía.
+
+        Por `ts` y no por `_id`: aunque ese documento salga de la colección capped, el
+        cursor sigue entregando lo nuevo.
+        """
+        ultimo = next(iter(collection.find({}, {"ts": 1}).sort("$natural", -1).limit(1)), None)
+        if ultimo is None or ultimo.get("ts") is None:
+            return {}
+        return {"ts": {"$gt": ultimo["ts"]}}
+
+    def _repartir(self, doc: Dict):
+        evento = documento_api(doc)
+        with self._lock:
+            destinos = [s for s in self._suscripciones if s.acepta(doc)]
+            self._stats["eventos"] += 1
+            self._stats["entregados"] += len(destinos)
+        for suscripcion in destinos:
+            suscripcion.entregar(evento)
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {
+                "suscriptores": len(self._suscripciones),
+                "activo": self._hilo is not None,
+                "perdidos": sum(s.perdidos for s in self._suscripciones),
+                **self._stats,
+            }
+
+
+log_tails: Dict[str, LogTail] = {
+    category: LogTail(
+        category,
+        max_await_ms=LOG_TAIL_CONFIG["max_await_ms"],
+        cola_max=LOG_TAIL_CONFIG["cola_max"],
+        max_suscriptores=LOG_TAIL_CONFIG["max_suscriptores"],
+    )
+    for category in ("facturacion", "sistema")
+}
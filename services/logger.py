@@ -4,14 +4,12 @@ import traceback
 import sys
 from datetime import datetime
 from typing import Optional, List, Dict
-from config.settings import LOG_FILE, MONGO_CONFIG
-from database.connection import get_connection
+from config.settings import LOG_FILE, LOG_SHIPPER_CONFIG
+from database.connection import pooled_connection
+from models import consulta_logs
 from models.log import Log
-
-try:
-    from pymongo import MongoClient, ASCENDING
-except Exception:
-    MongoClient = None  # Se manejará si falta dependencia
+from services.log_registry import log_registry
+from services.log_shipper import log_shipper
 
 # Configurar logging para soportar caracteres especiales en Windows
 sys.stdout.reconfigure(encoding='utf-8', errors='replace')
@@ -32,6 +30,12 @@ class DatabaseLogger:
     Logger que guarda los registros en:
     - Archivo (logs/facturacion.log)
     - PostgreSQL (tabla logs)
+    - MongoDB (colecciones capped de facturación y sistema)
+
+    El archivo se escribe en la llamada; PostgreSQL y Mongo se envían por lotes
+    en segundo plano (`services.log_shipper`) salvo con LOG_ASYNC=0. El cliente
+    Mongo es el compartido de `services.log_registry`: crear otra instancia no
+    abre conexiones nuevas.
     """
     
     def __init__(self, use_postgres=True, use_mongo=True):
@@ -41,74 +45,62 @@ class DatabaseLogger:
             use_postgres: Guardar en PostgreSQL
             use_mongo: Guardar en MongoDB (capped + TTL)
         """
-        self.conn_postgres = None
         self.use_postgres = use_postgres
-        self.use_mongo = use_mongo and MongoClient is not None
-        self._mongo_client: Optional[MongoClient] = None
-        self._mongo_collection_fact = None
-        self._mongo_collection_sys = None
-        if self.use_mongo:
-            self._init_mongo_collections()
-    
-    def get_postgres_connection(self):
-        """Obtiene una conexión a PostgreSQL."""
-        if self.use_postgres:
-            if self.conn_postgres is None:
-                self.conn_postgres = get_connection()
-            return self.conn_postgres
-        return None
+        self._use_mongo = use_mongo
+        self.asincrono = LOG_SHIPPER_CONFIG["enabled"]
     
     def _log_to_postgres(self, level, message, module=None, error_details=None):
-        """Guarda un log en PostgreSQL."""
-        try:
-            conn = self.get_postgres_connection()
-            if conn:
-                Log.insert(conn, level, message, module, error_details)
-        except Exception as e:
-            logger.warning(f"[WARNING] No se pudo guardar log en PostgreSQL: {e}")
+        """Guarda un log en PostgreSQL (conexión prestada por el pool)."""
+        if not self.use_postgres:
+            return
+        if self.asincrono:
+            log_shipper.submit_postgres(level, message, module, error_details)
+            return
+        # Modo síncrono: con el circuito abierto no se paga el timeout de conexión.
+        # Lo que no se guarda aquí pasa al spool del envío en segundo plano
+        guardado = False
+        if log_registry.breaker_pg.permitir():
+            try:
+                with pooled_connection() as conn:
+                    if conn:
+                        guardado = Log.insert(conn, level, message, module, error_details) is not None
+                        log_registry.breaker_pg.exito()
+                    else:
+                        log_registry.breaker_pg.fallo()
+            except Exception as e:
+                logger.warning(f"[WARNING] No se pudo guardar log en PostgreSQL: {e}")
+        if not guardado:
+            log_shipper.submit_postgres(level, message, module, error_details)
 
     # ---------- MongoDB ----------
-    def _init_mongo_collections(self):
-        """Crea colecciones capped (facturación y sistema) e índices TTL si no existen."""
-        try:
-            self._mongo_client = MongoClient(MONGO_CONFIG["uri"], serverSelectionTimeoutMS=3000)
-            db = self._mongo_client[MONGO_CONFIG["database"]]
-            names = db.list_collection_names()
-            fact_name = MONGO_CONFIG["collection_facturacion"]
-            sys_name = MONGO_CONFIG["collection_sistema"]
-
-            def ensure(name):
-                if name in names:
-                    return db[name]
-                return db.create_collection(name, capped=True, size=MONGO_CONFIG["max_size_bytes"], max=None)
+    @property
+    def use_mongo(self) -> bool:
+        return self._use_mongo and log_registry.mongo_disponible()
 
-            self._mongo_collection_fact = ensure(fact_name)
-            self._mongo_collection_sys = ensure(sys_name)
+    def _collection(self, category: str, conectar: bool = True):
+        fact, sistema = log_registry.colecciones(conectar)
+        return fact if category == "facturacion" else sistema
 
-            ttl_seconds = MONGO_CONFIG.get("ttl_seconds")
-            if ttl_seconds and ttl_seconds > 0:
-                for col in (self._mongo_collection_fact, self._mongo_collection_sys):
-                    col.create_index([("ts", ASCENDING)], expireAfterSeconds=ttl_seconds, name="idx_ts_ttl", background=True)
-            for col in (self._mongo_collection_fact, self._mongo_collection_sys):
-                col.create_index([("level", ASCENDING), ("module", ASCENDING)], name="idx_level_module", background=True)
-                col.create_index([("uuid", ASCENDING)], name="idx_uuid", background=True)
-            logger.info("[MongoLogger] Colecciones Mongo inicializadas correctamente")
-        except Exception as e:
-            logger.warning(f"[MongoLogger] No se pudo inicializar MongoDB: {e}")
-            self.use_mongo = False
-
-    def _insert_mongo(self, collection, doc: Dict):
-        try:
-            collection.insert_one(doc)
-        except Exception as e:
-            logger.warning(f"[MongoLogger] Fallo insert Mongo: {e}")
+    def _insert_mongo(self, category: str, doc: Dict):
+        if self.asincrono:
+            log_shipper.submit_mongo(category, doc)
+            return
+        collection = self._collection(category) if log_registry.breaker_mongo.permitir() else None
+        if collection is not None:
+            try:
+                collection.insert_one(doc)
+                log_registry.breaker_mongo.exito()
+                return
+            except Exception as e:
+                log_registry.breaker_mongo.fallo()
+                logger.warning(f"[MongoLogger] Fallo insert Mongo: {e}")
+        # Sin Mongo: al spool del envío en segundo plano (sin el _id que pudo agregar insert_one)
+        doc.pop("_id", None)
+        log_shipper.submit_mongo(category, doc)
 
     def _log_to_mongo(self, level: str, message: str, module: Optional[str], error_details: Optional[str], structured: Optional[Dict] = None, category: str = "facturacion"):
         if not self.use_mongo:
             return
-        collection = self._mongo_collection_fact if category == "facturacion" else self._mongo_collection_sys
-        if collection is None:
-            return
         try:
             doc = {
                 "ts": datetime.utcnow(),
@@ -122,7 +114,7 @@ class DatabaseLogger:
                 for k, v in structured.items():
                     if k not in doc:
                         doc[k] = v
-            self._insert_mongo(collection, doc)
+            self._insert_mongo(category, doc)
         except Exception as e:
             logger.warning(f"[MongoLogger] Fallo construcción log Mongo: {e}")
 
@@ -209,14 +201,27 @@ class DatabaseLogger:
         self._log_to_mongo("DEBUG", message, module, None, category="sistema")
     
     def close(self):
-        """Cierra la conexión a PostgreSQL."""
-        if self.conn_postgres:
-            self.conn_postgres.close()
-            self.conn_postgres = None
-        if self._mongo_client:
-            self._mongo_client.close()
-            self._mongo_client = None
+        """Envía los logs pendientes (el cliente Mongo y las conexiones PostgreSQL son compartidos)."""
+        if self.asincrono:
+            log_shipper.flush()
     
+    def buscar_logs_postgres(self, **filtros) -> Optional[Dict]:
+        """Una página de la tabla logs (ver `models.consulta_logs.buscar_postgres`). None sin PostgreSQL.
+
+        Un cursor `antes_de` inválido lanza ValueError.
+        """
+        if not self.use_postgres or log_registry.breaker_pg.abierto():
+            return None
+        try:
+            with pooled_connection() as conn:
+                if conn:
+                    return consulta_logs.buscar_postgres(conn, **filtros)
+        except ValueError:
+            raise
+        except Exception as e:
+            logger.error(f"Error al recuperar logs de PostgreSQL: {e}")
+        return None
+
     def get_postgres_logs(self, limit=50, level=None, module=None):
         """
         Obtiene logs de PostgreSQL.
@@ -224,47 +229,49 @@ class DatabaseLogger:
         Returns:
             list: Lista de logs de PostgreSQL
         """
+        pagina = self.buscar_logs_postgres(limite=limit, level=level, module=module)
+        return pagina["logs"] if pagina else []
+
+    def _coleccion_consulta(self, category: str):
+        if not self.use_mongo or log_registry.breaker_mongo.abierto():
+            return None
+        # Solo con el cliente ya conectado (lo conecta el arranque diferido o el envío de logs)
+        return self._collection(category, conectar=False)
+
+    def buscar_logs_mongo(self, category: str = "facturacion", **filtros) -> Optional[Dict]:
+        """Una página de logs Mongo (ver `models.consulta_logs.buscar_mongo`). None sin Mongo.
+
+        Un cursor `antes_de` inválido lanza ValueError.
+        """
+        collection = self._coleccion_consulta(category)
+        if collection is None:
+            return None
         try:
-            conn = self.get_postgres_connection()
-            if conn:
-                return Log.get_logs(conn, limit, level, module)
+            return consulta_logs.buscar_mongo(collection, **filtros)
+        except ValueError:
+            raise
         except Exception as e:
-            logger.error(f"Error al recuperar logs de PostgreSQL: {e}")
-        return []
+            logger.warning(f"[MongoLogger] No se pudo leer logs: {e}")
+            return None
 
-    def get_mongo_logs(self, limit: int = 50, level: Optional[str] = None, module: Optional[str] = None, category: str = "facturacion") -> List[Dict]:
-        """Recupera logs desde MongoDB (facturacion o sistema)."""
-        if not self.use_mongo:
-            return []
-        collection = self._mongo_collection_fact if category == "facturacion" else self._mongo_collection_sys
+    def linea_de_tiempo(self, uuid: str, con_error: bool = False) -> Optional[List[Dict]]:
+        """Fases registradas de una factura en orden cronológico. None sin Mongo."""
+        collection = self._coleccion_consulta("facturacion")
         if collection is None:
-            return []
-        query: Dict = {}
-        if level:
-            query["level"] = level
-        if module:
-            query["module"] = module
+            return None
         try:
-            cursor = collection.find(query).sort("ts", -1).limit(int(limit))
-            return [
-                {
-                    "ts": doc.get("ts"),
-                    "level": doc.get("level"),
-                    "module": doc.get("module"),
-                    "message": doc.get("message"),
-                    "error": doc.get("error"),
-                    "uuid": doc.get("uuid"),
-                    "phase": doc.get("phase"),
-                    "data": doc.get("data"),
-                }
-                for doc in cursor
-            ]
+            return consulta_logs.linea_de_tiempo(collection, uuid, con_error)
         except Exception as e:
-            logger.warning(f"[MongoLogger] No se pudo leer logs: {e}")
-            return []
+            logger.warning(f"[MongoLogger] No se pudo leer la línea de tiempo de {uuid}: {e}")
+            return None
+
+    def get_mongo_logs(self, limit: int = 50, level: Optional[str] = None, module: Optional[str] = None, category: str = "facturacion") -> List[Dict]:
+        """Recupera logs desde MongoDB (facturacion o sistema)."""
+        pagina = self.buscar_logs_mongo(category, limite=limit, level=level, module=module)
+        return pagina["logs"] if pagina else []
 
 
-# Instancia global del logger de base de datos
+# Instancia global del logger de base de datos: importarla en lugar de crear otra
 db_logger = DatabaseLogger(use_postgres=True, use_mongo=True)
 
 
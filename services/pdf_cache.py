@@ -0,0 +1,220 @@
+"""
+Caché de PDFs renderizados para el modo de renderizado diferido (`PDF_LAZY=1`).
+
+- Dos niveles LRU acotados por bytes: memoria (`memory_max_bytes`) y disco
+  (`disk_max_bytes`, en `cache_dir`). Un acierto en disco sube el PDF a memoria.
+- Escritura en disco atómica (temporal + rename); los archivos que otro proceso
+  ya borró simplemente cuentan como fallo.
+- Single-flight: si varias peticiones piden a la vez la misma factura, solo una
+  renderiza y las demás esperan su resultado.
+"""
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+from typing import Callable, Dict, Optional
+
+from config.settings import PDF_CACHE_CONFIG
+
+
+class _Flight:
+    __slots__ = ("event", "result", "error")
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.result: Optional[bytes] = None
+        self.error: Optional[BaseException] = None
+
+
+class RenderedPdfCache:
+    """LRU de PDFs en memoria + disco con renderizado único por clave."""
+
+    def __init__(self, cache_dir: str, memory_max_bytes: int, disk_max_bytes: int, wait_timeout: float = 60.0):
+        self.cache_dir = cache_dir
+        self.memory_max_bytes = max(0, int(memory_max_bytes))
+        self.disk_max_bytes = max(0, int(disk_max_bytes))
+        self.wait_timeout = float(wait_timeout)
+        self._lock = threading.Lock()
+        self._memory: "OrderedDict[str, bytes]" = OrderedDict()
+        self._memory_bytes = 0
+        # nombre de archivo → tamaño, en orden de uso (el primero es el menos reciente)
+        self._disk: "OrderedDict[str, int]" = OrderedDict()
+        self._disk_bytes = 0
+        self._inflight: Dict[str, _Flight] = {}
+        self._stats = {"hits_memoria": 0, "hits_disco": 0, "misses": 0, "renders": 0, "esperas": 0,
+                       "evictions_memoria": 0, "evictions_disco": 0}
+        self._load_disk_index()
+
+    # ---------- disco ----------
+    def _file_name(self, key: str) -> str:
+        return hashlib.sha256(key.encode("utf-8")).hexdigest() + ".pdf"
+
+    def _file_path(self, name: str) -> str:
+        return os.path.join(self.cache_dir, name[:2], name)
+
+    def _load_disk_index(self):
+        if self.disk_max_bytes == 0 or not os.path.isdir(self.cache_dir):
+            return
+        entries = []
+        for dirpath, _, files in os.walk(self.cache_dir):
+            for name in files:
+                if not name.endswith(".pdf"):
+                    continue
+                try:
+                    st = os.stat(os.path.join(dirpath, name))
+                except FileNotFoundError:
+                    continue
+                entries.append((st.st_mtime, name, st.st_size))
+        for _, name, size in sorted(entries):
+            self._disk[name] = size
+            self._disk_bytes += size
+        self._evict_disk()
+
+    def _read_disk(self, key: str) -> Optional[bytes]:
+        name = self._file_name(key)
+        with self._lock:
+            if name not in self._disk:
+                return None
+            self._disk.move_to_end(name)
+        path = self._file_path(name)
+        try:
+            with open(path, "rb") as f:
+                data = f.read()
+            os.utime(path)
+            return data
+        except FileNotFoundError:
+            with self._lock:
+                self._disk_bytes -= self._disk.pop(name, 0)
+            return None
+
+    def _write_disk(self, key: str, data: bytes):
+        if self.disk_max_bytes == 0 or len(data) > self.disk_max_bytes:
+            return
+        name = self._file_name(key)
+        path = self._file_path(name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp, "wb") as f:
+            f.write(data)
+        os.replace(tmp, path)
+        with self._lock:
+            self._disk_bytes += len(data) - self._disk.pop(name, 0)
+            self._disk[name] = len(data)
+        self._evict_disk()
+
+    def _evict_disk(self):
+        victims = []
+        with self._lock:
+            while self._disk_bytes > self.disk_max_bytes and self._disk:
+                name, size = self._disk.popitem(last=False)
+                self._disk_bytes -= size
+                self._stats["evictions_disco"] += 1
+                victims.append(name)
+        for name in victims:
+            try:
+                os.remove(self._file_path(name))
+            except FileNotFoundError:
+                pass
+
+    # ---------- memoria ----------
+    def _put_memory(self, key: str, data: bytes):
+        if len(data) > self.memory_max_bytes:
+            return
+        with self._lock:
+            old = self._memory.pop(key, None)
+            if old is not None:
+                self._memory_bytes -= len(old)
+            self._memory[key] = data
+            self._memory_bytes += len(data)
+            while self._memory_bytes > self.memory_max_bytes:
+                _, evicted = self._memory.popitem(last=False)
+                self._memory_bytes -= len(evicted)
+                self._stats["evictions_memoria"] += 1
+
+    # ---------- API ----------
+    def get(self, key: str) -> Optional[bytes]:
+        with self._lock:
+            data = self._memory.get(key)
+            if data is not None:
+                self._memory.move_to_end(key)
+                self._stats["hits_memoria"] += 1
+                return data
+        data = self._read_disk(key)
+        with self._lock:
+            self._stats["hits_disco" if data is not None else "misses"] += 1
+        if data is not None:
+            self._put_memory(key, data)
+        return data
+
+    def put(self, key: str, data: bytes):
+        self._put_memory(key, data)
+        self._write_disk(key, data)
+
+    def invalidate(self, key: str):
+        with self._lock:
+            data = self._memory.pop(key, None)
+            if data is not None:
+                self._memory_bytes -= len(data)
+            name = self._file_name(key)
+            size = self._disk.pop(name, None)
+            if size is not None:
+                self._disk_bytes -= size
+        if size is not None:
+            try:
+                os.remove(self._file_path(name))
+            except FileNotFoundError:
+                pass
+
+    def get_or_render(self, key: str, render: Callable[[], Optional[bytes]]) -> Optional[bytes]:
+        """PDF en caché o renderizado por `render()`; una sola ejecución por clave a la vez."""
+        data = self.get(key)
+        if data is not None:
+            return data
+        with self._lock:
+            flight = self._inflight.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._inflight[key] = _Flight()
+            else:
+                self._stats["esperas"] += 1
+        if not leader:
+            if not flight.event.wait(self.wait_timeout):
+                raise TimeoutError(f"Renderizado de {key} no terminó en {self.wait_timeout}s")
+            if flight.error is not None:
+                raise flight.error
+            return flight.result
+        try:
+            data = render()
+            with self._lock:
+                self._stats["renders"] += 1
+            if data is not None:
+                self.put(key, data)
+            flight.result = data
+            return data
+        except BaseException as e:
+            flight.error = e
+            raise
+        finally:
+            with self._lock:
+                self._inflight.pop(key, None)
+            flight.event.set()
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {
+                "memoria_entradas": len(self._memory),
+                "memoria_bytes": self._memory_bytes,
+                "memoria_max_bytes": self.memory_max_bytes,
+                "disco_entradas": len(self._disk),
+                "disco_bytes": self._disk_bytes,
+                "disco_max_bytes": self.disk_max_bytes,
+                "en_curso": len(self._inflight),
+                **self._stats,
+            }
+
+
+pdf_cache = RenderedPdfCache(
+    cache_dir=PDF_CACHE_CONFIG["dir"],
+    memory_max_bytes=PDF_CACHE_CONFIG["memory_max_bytes"],
+    disk_max_bytes=PDF_CACHE_CONFIG["disk_max_bytes"],
+)
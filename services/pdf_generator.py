@@ -1,14 +1,42 @@
 import os
 import base64
+import threading
 from io import BytesIO
 from xml.etree import ElementTree as ET
 
+from reportlab import rl_config
 from reportlab.lib.pagesizes import letter
 from reportlab.lib.units import mm
 from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
-from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer, Table, TableStyle, Image
+from reportlab.lib.utils import ImageReader
+from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer, Table, TableStyle, Image, PageBreak, Flowable
 from reportlab.lib import colors
 
+from config.settings import PDF_CONFIG
+from models.comprobante import Comprobante, a_decimal, impuesto_de
+from services.blob_store import blob_store, blob_store_activo
+
+# Streams binarios (Flate) en lugar de ASCII85: PDF ~20% más pequeño y sin el costo de codificar
+rl_config.useA85 = 0
+
+QR_PATH = os.path.join(os.path.dirname(os.path.dirname(__file__)), "static", "imagenes", "qr.png")
+
+MARGEN = 18*mm
+COL_WIDTHS_ITEMS = [80*mm, 20*mm, 30*mm, 30*mm]
+COL_WIDTHS_RESUMEN = [40*mm, 40*mm]
+
+ESTILO_ITEMS = TableStyle([
+	("BACKGROUND", (0, 0), (-1, 0), colors.lightgrey),
+	("GRID", (0, 0), (-1, -1), 0.25, colors.grey),
+	("ALIGN", (1, 1), (-1, -1), "RIGHT"),
+])
+ESTILO_RESUMEN = TableStyle([
+	("ALIGN", (1, 0), (-1, -1), "RIGHT"),
+	("FONTSIZE", (0, 0), (-1, -2), 10),
+	("FONTSIZE", (0, -1), (-1, -1), 12),
+	("FONTNAME", (0, -1), (0, -1), "Helvetica-Bold"),
+])
+
 
 def _parse_xml(xml_text: str):
 	root = ET.fromstring(xml_text)
@@ -17,6 +45,8 @@ def _parse_xml(xml_text: str):
 	data = {
 		"uuid": enc.findtext("llavecomprobante", default=""),
 		"cliente": enc.findtext("nombrereceptor", default="Cliente"),
+		"subtotal": enc.findtext("subtotal", default=""),
+		"totalimpuestos": enc.findtext("totalimpuestos", default=""),
 		"total": enc.findtext("total", default="0"),
 		"fecha": enc.findtext("fecha", default=""),
 		"items": [],
@@ -43,15 +73,46 @@ def _fmt_cop(valor: float | str) -> str:
 	return "$" + format(int(round(num)), ",").replace(',', '.')
 
 
-def generar_pdf_desde_xml(xml_text: str, output_path: str | None = None):
-	"""Genera un PDF simple desde el XML de factura.
+def _filas_items(data):
+	rows = [["Producto", "Cant.", "Valor", "Subtotal"]]
+	for it in data["items"]:
+		rows.append([
+			it["desc"],
+			it["cant"],
+			_fmt_cop(it["precio"]),
+			_fmt_cop(it["importe"]),
+		])
+	return rows
 
-	Retorna (pdf_path, pdf_base64)
-	"""
-	data = _parse_xml(xml_text)
 
+def _filas_resumen(data):
+	try:
+		total = float(data.get("total") or 0)
+		# si XML trae totales (los del comprobante), úsalos; si no, calcula desde items con la misma regla
+		if total <= 0 and data["items"]:
+			importes = [a_decimal(x.get("importe") or 0) for x in data["items"]]
+			subtotal = float(sum(importes))
+			iva = float(sum(impuesto_de(i) for i in importes))
+			total = subtotal + iva
+		else:
+			subtotal = float(data.get("baseimpuesto") or data.get("subtotal") or 0)
+			iva = float(data.get("totalimpuestos") or total - subtotal)
+	except Exception:
+		subtotal = 0
+		iva = 0
+		total = 0
+
+	return [
+		["Subtotal:", _fmt_cop(subtotal)],
+		["IVA (19%):", _fmt_cop(iva)],
+		["TOTAL:", _fmt_cop(total)],
+	]
+
+
+def _render_platypus(data) -> bytes:
+	"""Motor anterior: todo el documento (encabezado incluido) con flowables de platypus."""
 	buf = BytesIO()
-	doc = SimpleDocTemplate(buf, pagesize=letter, leftMargin=18*mm, rightMargin=18*mm, topMargin=18*mm, bottomMargin=18*mm)
+	doc = SimpleDocTemplate(buf, pagesize=letter, leftMargin=MARGEN, rightMargin=MARGEN, topMargin=MARGEN, bottomMargin=MARGEN)
 	styles = getSampleStyleSheet()
 	styles.add(ParagraphStyle(name="H1Center", parent=styles["Title"], alignment=1, fontSize=20))
 	styles.add(ParagraphStyle(name="Label", parent=styles["Normal"], fontName="Helvetica-Bold"))
@@ -59,10 +120,9 @@ def generar_pdf_desde_xml(xml_text: str, output_path: str | None = None):
 	story = []
 
 	# Encabezado con QR (si existe)
-	qr_path = os.path.join(os.path.dirname(os.path.dirname(__file__)), "static", "imagenes", "qr.png")
-	if os.path.exists(qr_path):
+	if os.path.exists(QR_PATH):
 		try:
-			qr_img = Image(qr_path, width=35*mm, height=35*mm)
+			qr_img = Image(QR_PATH, width=35*mm, height=35*mm)
 			qr_img.hAlign = 'RIGHT'
 			story.append(Paragraph("FACTURA DE COMPRA", styles["H1Center"]))
 			story.append(qr_img)
@@ -84,67 +144,215 @@ def generar_pdf_desde_xml(xml_text: str, output_path: str | None = None):
 	story.append(Paragraph(f"Email: {''}", styles["Normal"]))
 	story.append(Spacer(1, 14))
 
-	# Tabla de items
-	rows = [["Producto", "Cant.", "Valor", "Subtotal"]]
-	for it in data["items"]:
-		rows.append([
-			it["desc"],
-			it["cant"],
-			_fmt_cop(it["precio"]),
-			_fmt_cop(it["importe"]),
-		])
-
-	tbl = Table(rows, colWidths=[80*mm, 20*mm, 30*mm, 30*mm])
-	tbl.setStyle(TableStyle([
-		("BACKGROUND", (0, 0), (-1, 0), colors.lightgrey),
-		("GRID", (0, 0), (-1, -1), 0.25, colors.grey),
-		("ALIGN", (1, 1), (-1, -1), "RIGHT"),
-	]))
+	tbl = Table(_filas_items(data), colWidths=COL_WIDTHS_ITEMS)
+	tbl.setStyle(ESTILO_ITEMS)
 	story.append(tbl)
 	story.append(Spacer(1, 10))
 
-	# Resumen totales
-	try:
-		total = float(data.get("total") or 0)
-		# si XML trae totales, úsalos; si no, calcula desde items
-		if total <= 0 and data["items"]:
-			base = sum(float(x.get("importe", 0)) for x in data["items"])
-			iva = round(base * 0.19)
-			total = base + iva
-			subtotal = base
-		else:
-			subtotal = float(data.get("baseimpuesto") or data.get("subtotal") or 0)
-			iva = float(data.get("totalimpuestos") or total - subtotal)
-	except Exception:
-		subtotal = 0
-		iva = 0
-		total = 0
-
-	resumen = [
-		["Subtotal:", _fmt_cop(subtotal)],
-		["IVA (19%):", _fmt_cop(iva)],
-		["TOTAL:", _fmt_cop(total)],
-	]
-	rt = Table(resumen, colWidths=[40*mm, 40*mm])
-	rt.setStyle(TableStyle([
-		("ALIGN", (1, 0), (-1, -1), "RIGHT"),
-		("FONTSIZE", (0, 0), (-1, -2), 10),
-		("FONTSIZE", (0, -1), (-1, -1), 12),
-		("FONTNAME", (0, -1), (0, -1), "Helvetica-Bold"),
-	]))
+	rt = Table(_filas_resumen(data), colWidths=COL_WIDTHS_RESUMEN)
+	rt.setStyle(ESTILO_RESUMEN)
 	story.append(rt)
 
 	doc.build(story)
 
 	pdf_bytes = buf.getvalue()
 	buf.close()
+	return pdf_bytes
+
+
+class PlantillaFactura:
+	"""Partes fijas del PDF calculadas una vez por proceso.
+
+	El encabezado (título, QR y rótulos) se dibuja directo en el canvas al inicio de
+	cada factura; el QR se decodifica una sola vez por proceso y `drawImage` lo incrusta una
+	vez por documento. Por petición solo se maquetan las tablas de ítems y totales.
+	"""
+
+	# Alturas del bloque fijo, iguales a las del motor platypus
+	ALTO_TITULO = 22 + 6
+	ALTO_QR = 35*mm
+	ALTO_DATOS = 12 + 12 + 14 + 12 + 6 + 12 + 12 + 14
+
+	def __init__(self, qr_path: str = QR_PATH):
+		self.width, self.height = letter
+		# Borde superior del área útil (margen + padding del frame)
+		self.top = self.height - MARGEN - 6
+		self.qr_reader = None
+		if os.path.exists(qr_path):
+			try:
+				self.qr_reader = ImageReader(qr_path)
+				# Fuerza la decodificación aquí: ImageReader guarda los píxeles para los siguientes documentos
+				self.qr_reader.getRGBData()
+			except Exception as e:
+				print(f"[pdf] No se pudo cargar el QR {qr_path}: {e}")
+				self.qr_reader = None
+		alto_qr = self.ALTO_QR if self.qr_reader is not None else 0
+		self.alto_encabezado = self.ALTO_TITULO + alto_qr + 8 + self.ALTO_DATOS
+
+	def _dibujar_qr(self, canvas, x, y):
+		# drawImage registra la imagen una vez por documento (por contenido) y la reutiliza en las demás páginas
+		canvas.drawImage(self.qr_reader, x, y, width=self.ALTO_QR, height=self.ALTO_QR)
+
+	def _dibujar_encabezado(self, canvas, data):
+		canvas.saveState()
+		y = self.top
+		canvas.setFont("Helvetica-Bold", 20)
+		canvas.drawCentredString(self.width / 2, y - 20, "FACTURA DE COMPRA")
+		y -= self.ALTO_TITULO
+		if self.qr_reader is not None:
+			self._dibujar_qr(canvas, self.width - MARGEN - 6 - self.ALTO_QR, y - self.ALTO_QR)
+			y -= self.ALTO_QR
+		y -= 8
+
+		x = MARGEN + 6
+		canvas.setFont("Helvetica", 10)
+		canvas.drawString(x, y - 10, f"Factura No.: {data['uuid']}")
+		canvas.drawString(x, y - 22, f"Fecha: {data['fecha']}")
+		y -= 12 + 12 + 14
+		canvas.setFont("Helvetica-Bold", 10)
+		canvas.drawString(x, y - 10, "Datos del Cliente")
+		y -= 12 + 6
+		canvas.setFont("Helvetica", 10)
+		canvas.drawString(x, y - 10, f"Nombre: {data['cliente']}")
+		# email puede venir vacío; no rompe
+		canvas.drawString(x, y - 22, "Email: ")
+		canvas.restoreState()
+
+	def _story(self, data):
+		tbl = Table(_filas_items(data), colWidths=COL_WIDTHS_ITEMS)
+		tbl.setStyle(ESTILO_ITEMS)
+		rt = Table(_filas_resumen(data), colWidths=COL_WIDTHS_RESUMEN)
+		rt.setStyle(ESTILO_RESUMEN)
+		return [_Encabezado(self, data), tbl, Spacer(1, 10), rt]
+
+	def render(self, data) -> bytes:
+		buf = BytesIO()
+		self.render_lote([data], buf)
+		pdf_bytes = buf.getvalue()
+		buf.close()
+		return pdf_bytes
+
+	def render_lote(self, datos, destino):
+		"""Escribe en `destino` (archivo o ruta) un solo PDF con una factura por página.
+
+		Cada factura empieza en página nueva; el XObject del QR se registra una vez
+		por documento y lo comparten todas las páginas.
+		"""
+		doc = SimpleDocTemplate(destino, pagesize=letter, leftMargin=MARGEN, rightMargin=MARGEN, topMargin=MARGEN, bottomMargin=MARGEN)
+		story = []
+		for data in datos:
+			if story:
+				story.append(PageBreak())
+			story.extend(self._story(data))
+		doc.build(story)
+
+
+class _Encabezado(Flowable):
+	"""Bloque fijo de la plantilla como flowable; siempre va al inicio de una página."""
+
+	def __init__(self, plantilla: PlantillaFactura, data):
+		super().__init__()
+		self.plantilla = plantilla
+		self.data = data
+
+	def wrap(self, availWidth, availHeight):
+		return availWidth, self.plantilla.alto_encabezado
 
-	pdf_b64 = base64.b64encode(pdf_bytes).decode("ascii")
-	pdf_path = None
+	def draw(self):
+		# El canvas llega trasladado a la esquina inferior del flowable; se vuelve a coordenadas de página
+		self.canv.translate(-(MARGEN + 6), -(self.plantilla.top - self.plantilla.alto_encabezado))
+		self.plantilla._dibujar_encabezado(self.canv, self.data)
+
+
+_plantilla = None
+_plantilla_lock = threading.Lock()
+
+
+def obtener_plantilla() -> PlantillaFactura:
+	global _plantilla
+	if _plantilla is None:
+		with _plantilla_lock:
+			if _plantilla is None:
+				_plantilla = PlantillaFactura()
+	return _plantilla
+
+
+def recargar_plantilla():
+	"""Descarta la plantilla en caché (p. ej. tras cambiar qr.png); se reconstruye en el próximo PDF."""
+	global _plantilla
+	with _plantilla_lock:
+		_plantilla = None
+
+
+def renderizar_pdf(data, motor: str | None = None) -> bytes:
+	"""Genera los bytes del PDF a partir de los datos ya extraídos del XML."""
+	motor = motor or PDF_CONFIG["motor"]
+	if motor == "platypus":
+		return _render_platypus(data)
+	return obtener_plantilla().render(data)
+
+
+def guardar_pdf(pdf_bytes: bytes, output_path: str | None = None, uuid: str | None = None) -> str | None:
+	"""Guarda el PDF en el almacén por hash (con `uuid`) o en `output_path`. Retorna la ruta."""
+	if uuid and blob_store_activo():
+		return blob_store.save(uuid, "pdf", pdf_bytes)
 	if output_path:
 		os.makedirs(os.path.dirname(output_path), exist_ok=True)
 		with open(output_path, "wb") as f:
 			f.write(pdf_bytes)
-		pdf_path = output_path
+		return output_path
+	return None
+
+
+def datos_pdf(comprobante: Comprobante):
+	"""Los mismos datos que `_parse_xml` obtendría del XML, tomados directo del comprobante."""
+	return {
+		"uuid": comprobante.uuid,
+		"cliente": comprobante.cliente_nombre or "",
+		"subtotal": f"{comprobante.subtotal:.2f}",
+		"totalimpuestos": f"{comprobante.impuesto:.2f}",
+		"total": f"{comprobante.total:.2f}",
+		"fecha": comprobante.emitida.strftime("%Y-%m-%d"),
+		"items": [
+			{
+				"desc": linea.descripcion or "",
+				"cant": str(linea.cantidad),
+				"precio": f"{linea.precio:.2f}",
+				"importe": f"{linea.importe:.2f}",
+			}
+			for linea in comprobante.lineas
+		],
+	}
+
+
+def datos_documento(documento):
+	"""Datos para el PDF desde cualquier forma de la factura.
+
+	- `Comprobante` (recién calculado en este proceso): sin pasar por el XML.
+	- dict: datos ya extraídos (lo que viaja a los procesos de `services.pdf_service`).
+	- str: XML cargado de disco o de la BD; es el único caso que se parsea.
+	"""
+	if isinstance(documento, Comprobante):
+		return datos_pdf(documento)
+	if isinstance(documento, dict):
+		return documento
+	return _parse_xml(documento)
+
 
-	return pdf_path, pdf_b64
+def render_documento(documento) -> bytes:
+	"""Bytes del PDF a partir del comprobante, sus datos o el XML (ver `datos_documento`)."""
+	return renderizar_pdf(datos_documento(documento))
+
+
+def generar_pdf_desde_xml(xml_text: str, output_path: str | None = None, incluir_base64: bool = False, uuid: str | None = None):
+	"""Genera un PDF simple desde el XML de factura.
+
+	Con `uuid` y el almacén por hash activo, el PDF se guarda allí (indexado por uuid)
+	en lugar de `output_path`.
+
+	Retorna (pdf_path, pdf_base64). El Base64 solo se calcula con `incluir_base64=True`;
+	si no, el segundo valor es None.
+	"""
+	pdf_bytes = render_documento(xml_text)
+	pdf_b64 = base64.b64encode(pdf_bytes).decode("ascii") if incluir_base64 else None
+	return guardar_pdf(pdf_bytes, output_path, uuid), pdf_b64
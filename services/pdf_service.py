@@ -0,0 +1,161 @@
+"""
+Servicio de renderizado de PDF en un pool de procesos.
+
+ReportLab es Python puro y ligado a CPU; en los hilos de Flask el GIL lo serializa.
+Aquí el renderizado corre en un `ProcessPoolExecutor`:
+
+- Workers calientes: cada proceso importa reportlab y arma la plantilla al iniciar,
+  y `start()` los levanta en segundo plano al arrancar la app.
+- Cola acotada (`max_pending`): con todos los cupos ocupados se renderiza en el
+  mismo proceso en lugar de acumular trabajos.
+- Timeout por trabajo. Si vence con el trabajo aún en espera, se cancela y se
+  renderiza en el proceso; si ya corre en un worker se lanza `TimeoutError` (no se
+  renderiza dos veces) y su cupo sigue ocupado hasta que termine.
+- Si el pool se rompe, se recrea y se renderiza en el proceso.
+- Al pool viajan los datos ya extraídos del comprobante (dict de textos) o el XML
+  cuando la factura viene de disco/BD; de vuelta, solo los bytes. El guardado
+  (almacén por hash o archivo) se hace en el proceso de la app.
+"""
+import multiprocessing
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, TimeoutError as FutureTimeout
+from concurrent.futures.process import BrokenProcessPool
+from typing import Dict, Optional, Tuple, Union
+
+from config.settings import PDF_SERVICE_CONFIG
+from models.comprobante import Comprobante
+from services.pdf_generator import datos_pdf, guardar_pdf, render_documento
+
+
+def _init_worker():
+    # Importa reportlab y arma la plantilla una vez por proceso
+    from services.pdf_generator import obtener_plantilla
+    obtener_plantilla()
+
+
+def _warmup() -> int:
+    return os.getpid()
+
+
+class PdfRenderService:
+    """Pool de procesos con cupos acotados, timeout por trabajo y renderizado local de respaldo."""
+
+    def __init__(self, workers: int = 2, max_pending: int = 8, timeout: float = 20.0):
+        self.workers = max(0, int(workers))
+        self.max_pending = max(1, int(max_pending))
+        self.timeout = float(timeout)
+        self._slots = threading.BoundedSemaphore(self.max_pending)
+        self._lock = threading.Lock()
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._stats = {"pool": 0, "inline": 0, "timeouts": 0, "errores_pool": 0, "ms_total": 0.0}
+
+    # ---------- ciclo de vida ----------
+    def start(self):
+        """Crea el pool y calienta los workers en un hilo: no demora el arranque de la app."""
+        # Con "spawn" (Windows) los workers reimportan el módulo principal: no deben crear su propio pool
+        if self.workers == 0 or multiprocessing.current_process().name != "MainProcess":
+            return
+        threading.Thread(target=self._warmup_pool, name="pdf-warmup", daemon=True).start()
+
+    def _warmup_pool(self):
+        executor = self._get_executor()
+        if executor is None:
+            return
+        try:
+            pids = {f.result(timeout=60) for f in [executor.submit(_warmup) for _ in range(self.workers * 2)]}
+            print(f"[pdf] Pool de renderizado listo: {len(pids)} procesos")
+        except Exception as e:
+            print(f"[pdf] No se pudo calentar el pool de renderizado: {e}")
+            self._reset_executor()
+
+    def _get_executor(self) -> Optional[ProcessPoolExecutor]:
+        if self.workers == 0:
+            return None
+        with self._lock:
+            if self._executor is None:
+                try:
+                    self._executor = ProcessPoolExecutor(max_workers=self.workers, initializer=_init_worker)
+                except Exception as e:
+                    print(f"[pdf] Pool de procesos no disponible, se renderiza en proceso: {e}")
+                    self.workers = 0
+            return self._executor
+
+    def _reset_executor(self):
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=False, cancel_futures=True)
+
+    def shutdown(self):
+        self._reset_executor()
+
+    # ---------- renderizado ----------
+    def render(self, documento: Union[Comprobante, str]) -> bytes:
+        """Bytes del PDF de un comprobante o de un XML; en el pool si hay cupo, si no (o si falla) en este proceso."""
+        t0 = time.perf_counter()
+        # El comprobante se reduce a sus datos de PDF: carga pequeña y sin volver a parsear XML en el worker
+        if isinstance(documento, Comprobante):
+            documento = datos_pdf(documento)
+        pdf_bytes = None
+        executor = self._get_executor()
+        if executor is not None and self._slots.acquire(blocking=False):
+            try:
+                future = executor.submit(render_documento, documento)
+            except (BrokenProcessPool, RuntimeError) as e:
+                # Pool roto o cerrado (p. ej. murió un worker): se recrea y se renderiza en proceso
+                future = None
+                self._slots.release()
+                self._pool_roto(e)
+            if future is not None:
+                # El cupo se libera cuando el trabajo termina en el worker, no cuando se deja de esperar
+                future.add_done_callback(lambda _: self._slots.release())
+                try:
+                    pdf_bytes = future.result(timeout=self.timeout)
+                    self._count("pool")
+                except FutureTimeout:
+                    self._count("timeouts")
+                    if not future.cancel():
+                        raise TimeoutError(f"Renderizado en pool superó {self.timeout}s y sigue en curso")
+                    print(f"[pdf] Renderizado en pool no empezó en {self.timeout}s, se renderiza en proceso")
+                except BrokenProcessPool as e:
+                    self._pool_roto(e)
+        if pdf_bytes is None:
+            pdf_bytes = render_documento(documento)
+            self._count("inline")
+        with self._lock:
+            self._stats["ms_total"] += (time.perf_counter() - t0) * 1000
+        return pdf_bytes
+
+    def generar_pdf(self, documento: Union[Comprobante, str], output_path: Optional[str] = None, uuid: Optional[str] = None) -> Tuple[Optional[str], None]:
+        """Igual que `generar_pdf_desde_xml` (sin Base64) pero renderizando en el pool; acepta comprobante o XML."""
+        return guardar_pdf(self.render(documento), output_path, uuid), None
+
+    def _pool_roto(self, error: Exception):
+        self._count("errores_pool")
+        print(f"[pdf] Pool de renderizado roto ({error}), se recrea")
+        self._reset_executor()
+
+    def _count(self, key: str):
+        with self._lock:
+            self._stats[key] += 1
+
+    def stats(self) -> Dict:
+        with self._lock:
+            total = self._stats["pool"] + self._stats["inline"]
+            return {
+                "workers": self.workers,
+                "max_pending": self.max_pending,
+                "timeout_s": self.timeout,
+                "activo": self._executor is not None,
+                "media_ms": round(self._stats["ms_total"] / total, 2) if total else 0.0,
+                **{k: v for k, v in self._stats.items() if k != "ms_total"},
+            }
+
+
+pdf_service = PdfRenderService(
+    workers=PDF_SERVICE_CONFIG["workers"],
+    max_pending=PDF_SERVICE_CONFIG["max_pending"],
+    timeout=PDF_SERVICE_CONFIG["timeout_seconds"],
+)
@@ -1,11 +1,196 @@
+"""
+Generación del XML base de la factura.
+
+`generar_xml_base` usa plantillas: los elementos constantes del encabezado, del
+detalle y del impuesto se serializan una sola vez al importar el módulo, y por
+factura solo se escapan y concatenan los campos variables. La serialización es
+idéntica byte a byte a la de ElementTree (`_generar_xml_etree`); los importes se
+comparan en test_factura.py con una copia congelada del generador original sobre
+carritos aleatorios, además de los archivos de golden/.
+"""
 import xml.etree.ElementTree as ET
-from datetime import datetime
 
-def generar_xml_base(factura_id, cliente, carrito):
+from models.comprobante import Comprobante
+from models.monto_letras import numero_a_letras
+
+_DECLARACION = "<?xml version='1.0' encoding='utf-8'?>\n"
+
+
+def _escapar(texto: str) -> str:
+    # Mismo escape que ElementTree para el texto de un elemento: solo &, < y >
+    if "&" in texto:
+        texto = texto.replace("&", "&amp;")
+    if "<" in texto:
+        texto = texto.replace("<", "&lt;")
+    if ">" in texto:
+        texto = texto.replace(">", "&gt;")
+    return texto
+
+
+def _elemento(etiqueta: str, texto) -> str:
+    # Sin texto (None o "") ElementTree escribe el elemento vacío "<tag />"
+    if not texto:
+        return f"<{etiqueta} />"
+    return f"<{etiqueta}>{_escapar(str(texto))}</{etiqueta}>"
+
+
+class PlantillaXML:
+    """Secuencia de elementos hermanos con las partes constantes ya serializadas.
+
+    `campos` es una lista de (etiqueta, valor); valor None marca un campo variable
+    que se toma de `render(valores)`.
+    """
+
+    __slots__ = ("_partes",)
+
+    def __init__(self, campos):
+        partes, fijos = [], []
+        for etiqueta, valor in campos:
+            if valor is None:
+                partes.append(("".join(fijos), etiqueta))
+                fijos = []
+            else:
+                fijos.append(_elemento(etiqueta, valor))
+        partes.append(("".join(fijos), None))
+        self._partes = tuple(partes)
+
+    def render(self, valores) -> str:
+        salida = []
+        for fijo, etiqueta in self._partes:
+            salida.append(fijo)
+            if etiqueta is not None:
+                salida.append(_elemento(etiqueta, valores[etiqueta]))
+        return "".join(salida)
+
+
+ENCABEZADO = PlantillaXML([
+    ("llavecomprobante", None),
+    ("nitemisor", "22222222"),
+    ("codSucursal", "Pizzeria 1"),
+    ("noresolucion", "123456789"),
+    ("prefijo", "PZZA"),
+    ("folio", None),
+    ("obligacionesfiscalesreceptor", "R-99-PN"),
+    ("paisreceptor", "CO"),
+    ("moneda", "COP"),
+    ("metodopago", "1"),
+    ("mediopago", "10"),
+    ("terminospago", "0"),
+    ("tipoOpera", "10"),
+    ("xslt", "1"),
+    ("tipocomprobante", "01"),
+    ("totaldescuentos", "0.00"),
+    ("totalcargos", "0.00"),
+    ("totalimpuestosretenidos", "0.00"),
+    ("fecha", None),
+    ("hora", None),
+    ("fechavencimiento", None),
+    ("tiporeceptor", "1"),
+    ("nitreceptor", "52169473"),
+    ("tipoDocRec", "13"),
+    ("digitoverificacion", ""),
+    ("nombrereceptor", None),
+    ("mailreceptor", None),
+    ("apellidosreceptor", ""),
+    ("subtotal", None),
+    ("baseimpuesto", None),
+    ("totalsindescuento", None),
+    ("totalimpuestos", None),
+    ("total", None),
+    ("montoletra", None),
+])
+
+DETALLE = PlantillaXML([
+    ("idConcepto", None),
+    ("llaveComprobante", None),
+    ("unidadmedida", "EA"),
+    ("tasa", "19.00"),
+    ("tipo", "01"),
+    ("identificacionproductos", None),
+    ("impuestolinea", None),
+    ("baseimpuestos", None),
+    ("descripcion", None),
+    ("cantidad", None),
+    ("precioUnitario", None),
+    ("importe", None),
+])
+
+IMPUESTO = PlantillaXML([
+    ("idImpuesto", "1"),
+    ("llaveComprobante", None),
+    ("tasa", "19.00"),
+    ("tipoImpuesto", "01"),
+    ("baseimpuestos", None),
+    ("importe", None),
+])
+
+
+def generar_xml_base(factura_id, cliente, carrito, ahora=None):
     """
     Genera un XML de factura con la estructura correcta.
     Basado en el formato de facturación electrónica colombiano.
+
+    `ahora` fija la fecha/hora del documento (por defecto, el momento actual).
+    """
+    return serializar_xml(Comprobante.desde_carrito(factura_id, cliente, carrito, ahora))
+
+
+def serializar_xml(comprobante: Comprobante) -> str:
+    """XML de un comprobante ya calculado (ver `models.comprobante`)."""
+    factura_id = comprobante.uuid
+    lineas = []
+    for linea in comprobante.lineas:
+        lineas.append("<Det>" + DETALLE.render({
+            "idConcepto": str(linea.numero),
+            "llaveComprobante": factura_id,
+            "identificacionproductos": linea.codigo,
+            "impuestolinea": f"{linea.impuesto:.2f}",
+            "baseimpuestos": f"{linea.importe:.2f}",
+            "descripcion": linea.descripcion,
+            "cantidad": str(linea.cantidad),
+            "precioUnitario": f"{linea.precio:.2f}",
+            "importe": f"{linea.importe:.2f}",
+        }) + "</Det>")
+
+    ahora = comprobante.emitida
+    fecha = ahora.strftime("%Y-%m-%d")
+    subtotal = f"{comprobante.subtotal:.2f}"
+    total_impuestos = f"{comprobante.impuesto:.2f}"
+    encabezado = ENCABEZADO.render({
+        "llavecomprobante": factura_id,
+        "folio": comprobante.folio,
+        "fecha": fecha,
+        "hora": ahora.strftime("%H:%M:%S"),
+        "fechavencimiento": fecha,
+        "nombrereceptor": comprobante.cliente_nombre,
+        "mailreceptor": comprobante.cliente_email,
+        "subtotal": subtotal,
+        "baseimpuesto": subtotal,
+        "totalsindescuento": subtotal,
+        "totalimpuestos": total_impuestos,
+        "total": f"{comprobante.total:.2f}",
+        "montoletra": numero_a_letras(comprobante.total),
+    })
+    impuesto = IMPUESTO.render({
+        "llaveComprobante": factura_id,
+        "baseimpuestos": subtotal,
+        "importe": total_impuestos,
+    })
+    detalle = "<Detalle>" + "".join(lineas) + "</Detalle>" if lineas else "<Detalle />"
+    return (
+        _DECLARACION
+        + "<Factura><Encabezado>" + encabezado + "</Encabezado>"
+        + detalle
+        + "<Impuestos><Imp>" + impuesto + "</Imp></Impuestos></Factura>"
+    )
+
+
+def _generar_xml_etree(factura_id, cliente, carrito, ahora=None):
+    """El mismo XML armado con ElementTree desde el comprobante: prueba el formato de las plantillas y es la base del benchmark.
+
+    Comparte los importes con `serializar_xml`; el oráculo de importes es `_xml_original` en test_factura.py.
     """
+    comprobante = Comprobante.desde_carrito(factura_id, cliente, carrito, ahora)
     factura = ET.Element("Factura")
     
     # Encabezado
@@ -17,10 +202,7 @@ def generar_xml_base(factura_id, cliente, carrito):
     ET.SubElement(encabezado, "codSucursal").text = "Pizzeria 1"
     ET.SubElement(encabezado, "noresolucion").text = "123456789"
     ET.SubElement(encabezado, "prefijo").text = "PZZA"
-    
-    # Extraer folio del factura_id (ej: "FAC-41" -> "41")
-    folio = factura_id.split("-")[-1] if "-" in factura_id else "0"
-    ET.SubElement(encabezado, "folio").text = folio
+    ET.SubElement(encabezado, "folio").text = comprobante.folio
     
     # Información del receptor
     ET.SubElement(encabezado, "obligacionesfiscalesreceptor").text = "R-99-PN"
@@ -37,7 +219,7 @@ def generar_xml_base(factura_id, cliente, carrito):
     ET.SubElement(encabezado, "totalimpuestosretenidos").text = "0.00"
     
     # Fecha y hora
-    ahora = datetime.now()
+    ahora = comprobante.emitida
     ET.SubElement(encabezado, "fecha").text = ahora.strftime("%Y-%m-%d")
     ET.SubElement(encabezado, "hora").text = ahora.strftime("%H:%M:%S")
     ET.SubElement(encabezado, "fechavencimiento").text = ahora.strftime("%Y-%m-%d")
@@ -47,60 +229,37 @@ def generar_xml_base(factura_id, cliente, carrito):
     ET.SubElement(encabezado, "nitreceptor").text = "52169473"
     ET.SubElement(encabezado, "tipoDocRec").text = "13"
     ET.SubElement(encabezado, "digitoverificacion").text = ""
-    ET.SubElement(encabezado, "nombrereceptor").text = cliente.get("nombre", "Cliente")
-    ET.SubElement(encabezado, "mailreceptor").text = cliente.get("email", "")
+    ET.SubElement(encabezado, "nombrereceptor").text = comprobante.cliente_nombre
+    ET.SubElement(encabezado, "mailreceptor").text = comprobante.cliente_email
     ET.SubElement(encabezado, "apellidosreceptor").text = ""
     
-    # Calcular totales
-    subtotal = 0
-    total_impuestos = 0
-    items_count = 0
-    
-    for item in carrito:
-        importe = item["cantidad"] * item["precio"]
-        impuesto = round(importe * 0.19, 2)
-        subtotal += importe
-        total_impuestos += impuesto
-    
-    total = subtotal + total_impuestos
-    
     # Totales en encabezado
-    ET.SubElement(encabezado, "subtotal").text = f"{subtotal:.2f}"
-    ET.SubElement(encabezado, "baseimpuesto").text = f"{subtotal:.2f}"
-    ET.SubElement(encabezado, "totalsindescuento").text = f"{subtotal:.2f}"
-    ET.SubElement(encabezado, "totalimpuestos").text = f"{total_impuestos:.2f}"
-    ET.SubElement(encabezado, "total").text = f"{total:.2f}"
+    ET.SubElement(encabezado, "subtotal").text = f"{comprobante.subtotal:.2f}"
+    ET.SubElement(encabezado, "baseimpuesto").text = f"{comprobante.subtotal:.2f}"
+    ET.SubElement(encabezado, "totalsindescuento").text = f"{comprobante.subtotal:.2f}"
+    ET.SubElement(encabezado, "totalimpuestos").text = f"{comprobante.impuesto:.2f}"
+    ET.SubElement(encabezado, "total").text = f"{comprobante.total:.2f}"
     
     # Convertir total a letras (aproximado)
-    ET.SubElement(encabezado, "montoletra").text = numero_a_letras(int(total))
+    ET.SubElement(encabezado, "montoletra").text = numero_a_letras(comprobante.total)
     
     # Detalle de items
     detalle = ET.SubElement(factura, "Detalle")
-    id_concepto = 1
     
-    for item in carrito:
+    for linea in comprobante.lineas:
         det = ET.SubElement(detalle, "Det")
-        ET.SubElement(det, "idConcepto").text = str(id_concepto)
+        ET.SubElement(det, "idConcepto").text = str(linea.numero)
         ET.SubElement(det, "llaveComprobante").text = factura_id
         ET.SubElement(det, "unidadmedida").text = "EA"
         ET.SubElement(det, "tasa").text = "19.00"
         ET.SubElement(det, "tipo").text = "01"
-        
-        # Código de producto (simplificado)
-        codigo_producto = f"PZ{id_concepto:02d}"
-        ET.SubElement(det, "identificacionproductos").text = codigo_producto
-        
-        importe = item["cantidad"] * item["precio"]
-        impuesto = round(importe * 0.19, 2)
-        
-        ET.SubElement(det, "impuestolinea").text = f"{impuesto:.2f}"
-        ET.SubElement(det, "baseimpuestos").text = f"{importe:.2f}"
-        ET.SubElement(det, "descripcion").text = item["nombre"]
-        ET.SubElement(det, "cantidad").text = str(item["cantidad"])
-        ET.SubElement(det, "precioUnitario").text = f"{item['precio']:.2f}"
-        ET.SubElement(det, "importe").text = f"{importe:.2f}"
-        
-        id_concepto += 1
+        ET.SubElement(det, "identificacionproductos").text = linea.codigo
+        ET.SubElement(det, "impuestolinea").text = f"{linea.impuesto:.2f}"
+        ET.SubElement(det, "baseimpuestos").text = f"{linea.importe:.2f}"
+        ET.SubElement(det, "descripcion").text = linea.descripcion
+        ET.SubElement(det, "cantidad").text = str(linea.cantidad)
+        ET.SubElement(det, "precioUnitario").text = f"{linea.precio:.2f}"
+        ET.SubElement(det, "importe").text = f"{linea.importe:.2f}"
     
     # Impuestos
     impuestos = ET.SubElement(factura, "Impuestos")
@@ -109,40 +268,7 @@ def generar_xml_base(factura_id, cliente, carrito):
     ET.SubElement(imp, "llaveComprobante").text = factura_id
     ET.SubElement(imp, "tasa").text = "19.00"
     ET.SubElement(imp, "tipoImpuesto").text = "01"
-    ET.SubElement(imp, "baseimpuestos").text = f"{subtotal:.2f}"
-    ET.SubElement(imp, "importe").text = f"{total_impuestos:.2f}"
+    ET.SubElement(imp, "baseimpuestos").text = f"{comprobante.subtotal:.2f}"
+    ET.SubElement(imp, "importe").text = f"{comprobante.impuesto:.2f}"
     
     return ET.tostring(factura, encoding="utf-8", xml_declaration=True).decode()
-
-
-def numero_a_letras(numero):
-    """Convierte un número a palabras en español."""
-    unidades = ["", "UNO", "DOS", "TRES", "CUATRO", "CINCO", "SEIS", "SIETE", "OCHO", "NUEVE"]
-    decenas = ["", "", "VEINTE", "TREINTA", "CUARENTA", "CINCUENTA", "SESENTA", "SETENTA", "OCHENTA", "NOVENTA"]
-    centenas = ["", "CIENTO", "DOSCIENTOS", "TRESCIENTOS", "CUATROCIENTOS", "QUINIENTOS", "SEISCIENTOS", "SETECIENTOS", "OCHOCIENTOS", "NOVECIENTOS"]
-    
-    if numero == 0:
-        return "CERO PESOS CON 00 CENTAVOS"
-    
-    if numero < 10:
-        return f"{unidades[numero]} PESOS CON 00 CENTAVOS"
-    elif numero < 20:
-        especiales = ["DIEZ", "ONCE", "DOCE", "TRECE", "CATORCE", "QUINCE", "DIECISEIS", "DIECISIETE", "DIECIOCHO", "DIECINUEVE"]
-        return f"{especiales[numero - 10]} PESOS CON 00 CENTAVOS"
-    elif numero < 100:
-        d = numero // 10
-        u = numero % 10
-        resultado = decenas[d]
-        if u > 0:
-            resultado += f" Y {unidades[u]}"
-        return f"{resultado} PESOS CON 00 CENTAVOS"
-    elif numero < 1000:
-        c = numero // 100
-        resto = numero % 100
-        resultado = centenas[c]
-        if resto > 0:
-            resultado += f" {numero_a_letras(resto).split(' PESOS')[0]}"
-        return f"{resultado} PESOS CON 00 CENTAVOS"
-    else:
-        # Simplificado para números grandes
-        return f"CANTIDAD {numero} PESOS CON 00 CENTAVOS"
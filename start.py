@@ -16,35 +16,23 @@ if sys.platform == 'win32':
     sys.stdout = io.TextIOWrapper(sys.stdout.buffer, encoding='utf-8', errors='replace')
     sys.stderr = io.TextIOWrapper(sys.stderr.buffer, encoding='utf-8', errors='replace')
 
-os.chdir(r'c:\Facturacion_Pizza')
-sys.path.insert(0, r'c:\Facturacion_Pizza')
+# Paso 1: Verificar PostgreSQL (en segundo plano: Flask arranca aunque la BD no responda)
+def preparar_postgres():
+    try:
+        from database.connection import pooled_connection
 
-print("\n" + "="*60)
-print("INICIANDO FACTURACION_PIZZA")
-print("="*60 + "\n")
+        with pooled_connection() as conn:
+            if conn is None:
+                raise RuntimeError("sin conexión")
+            print("[+] PostgreSQL conectado")
 
-# Paso 1: Verificar PostgreSQL
-print("[1/2] Verificando PostgreSQL...")
-try:
-    import psycopg2
-    from config.settings import DB_CONFIG
-    
-    conn = psycopg2.connect(
-        dbname=DB_CONFIG["dbname"],
-        user=DB_CONFIG["user"],
-        password=DB_CONFIG["password"],
-        host=DB_CONFIG["host"],
-        port=DB_CONFIG["port"]
-    )
-    print("[+] PostgreSQL conectado")
-    
-    from models.log import Log
-    Log.create_table(conn)
-    print("[+] Tabla de logs lista")
-    conn.close()
-except Exception as e:
-    print(f"[-] Error al conectar con PostgreSQL: {e}")
-    print("[*] Continuando sin PostgreSQL...")
+            from models.log import Log
+            Log.create_table(conn)
+            print("[+] Tabla de logs lista")
+            # Las migraciones las aplica app.iniciar_servicios()
+    except Exception as e:
+        print(f"[-] Error al conectar con PostgreSQL: {e}")
+        print("[*] Continuando sin PostgreSQL...")
 
 # Paso 2: Abrir navegador automáticamente
 def open_browser():
@@ -56,23 +44,34 @@ def open_browser():
     except Exception as e:
         print(f"[*] No se pudo abrir navegador automáticamente: {e}")
 
-# Iniciar thread para abrir navegador
-browser_thread = threading.Thread(target=open_browser, daemon=True)
-browser_thread.start()
+# Con "spawn" (Windows) los procesos del pool de PDF reimportan este archivo como
+# __mp_main__: todo el arranque queda bajo este guard.
+if __name__ == "__main__":
+    os.chdir(r'c:\Facturacion_Pizza')
+    sys.path.insert(0, r'c:\Facturacion_Pizza')
+
+    print("\n" + "="*60)
+    print("INICIANDO FACTURACION_PIZZA")
+    print("="*60 + "\n")
 
-# Paso 3: Iniciar Flask
-print("[2/2] Iniciando Flask...\n")
+    print("[1/2] Verificando PostgreSQL en segundo plano...")
+    threading.Thread(target=preparar_postgres, name="preparar-postgres", daemon=True).start()
 
-try:
-    from app import app
-    app.run(host="127.0.0.1", port=5000, debug=False, use_reloader=False, threaded=True)
-except KeyboardInterrupt:
-    print("\n[*] Servidor detenido")
-    sys.exit(0)
-except Exception as e:
-    print(f"[-] Error: {e}")
-    import traceback
-    traceback.print_exc()
-    sys.exit(1)
+    # Iniciar thread para abrir navegador
+    browser_thread = threading.Thread(target=open_browser, daemon=True)
+    browser_thread.start()
 
+    # Paso 3: Iniciar Flask
+    print("[2/2] Iniciando Flask...\n")
 
+    try:
+        from app import app
+        app.run(host="127.0.0.1", port=5000, debug=False, use_reloader=False, threaded=True)
+    except KeyboardInterrupt:
+        print("\n[*] Servidor detenido")
+        sys.exit(0)
+    except Exception as e:
+        print(f"[-] Error: {e}")
+        import traceback
+        traceback.print_exc()
+        sys.exit(1)
@@ -0,0 +1,327 @@
+"""
+Pruebas golden de la generación de XML.
+
+Cada caso se compara byte a byte con golden/xml_<caso>.xml y con el serializador
+basado en ElementTree. Además, carritos aleatorios se comparan con
+`_xml_original`, copia congelada del generador original (importes en float): el
+oráculo no comparte código con `models.comprobante`. Para regenerar los archivos
+tras un cambio intencional del formato:
+
+    ACTUALIZAR_GOLDEN=1 python -m pytest -q test_factura.py
+"""
+import os
+import random
+import xml.etree.ElementTree as ET
+from datetime import datetime
+from decimal import Decimal
+
+import pytest
+
+from services.xml_generator import _generar_xml_etree, generar_xml_base
+
+GOLDEN_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "golden")
+AHORA = datetime(2025, 3, 14, 9, 26, 53)
+
+CASOS = {
+    "una_linea": (
+        "FAC-41",
+        {"nombre": "Juan Pérez", "nit": "1020304050", "email": "juan@example.com"},
+        [{"nombre": "Pizza Hawaiana", "precio": 35000, "cantidad": 1}],
+    ),
+    "varias_lineas": (
+        "FAC-1207",
+        {"nombre": "Ana Gómez", "nit": "52169473", "email": "ana@example.com"},
+        [
+            {"nombre": "Pizza Pepperoni", "precio": 42000, "cantidad": 2},
+            {"nombre": "Gaseosa 1.5L", "precio": 7500, "cantidad": 3},
+            {"nombre": "Pan de ajo", "precio": 9900, "cantidad": 1},
+            {"nombre": "Pizza Vegetariana", "precio": 38500, "cantidad": 4},
+        ],
+    ),
+    "caracteres_especiales": (
+        "FAC-7",
+        {"nombre": "Peña & Hijos <S.A.S.>", "email": "ventas&co@example.com"},
+        [{"nombre": "Pizza \"4 quesos\" & piña > 'normal'", "precio": 51000, "cantidad": 1}],
+    ),
+    "cliente_sin_datos": (
+        "FAC-100",
+        {},
+        [{"nombre": "Pizza Margarita", "precio": 29000, "cantidad": 1}],
+    ),
+    "campos_vacios": (
+        "FAC-101",
+        {"nombre": "", "email": None},
+        [{"nombre": "", "precio": 0, "cantidad": 1}],
+    ),
+    "precios_decimales": (
+        "FAC-88",
+        {"nombre": "Cliente Decimal", "email": "dec@example.com"},
+        [
+            {"nombre": "Porción", "precio": 12345.67, "cantidad": 7},
+            {"nombre": "Salsa extra", "precio": 0.5, "cantidad": 3},
+        ],
+    ),
+    # Con centavos el redondeo es el de models.comprobante (mitad hacia arriba en Decimal),
+    # no el `round()` en float del generador original: estos golden fijan los valores nuevos
+    "iva_medio_centavo": (
+        "FAC-512",
+        {"nombre": "Cliente Centavos", "email": "centavos@example.com"},
+        [
+            {"nombre": "Salsa extra", "precio": 12.5, "cantidad": 3},
+            {"nombre": "Pizza Familiar", "precio": 2150.75, "cantidad": 2},
+        ],
+    ),
+    "precio_tres_decimales": (
+        "FAC-513",
+        {"nombre": "Cliente Tres Decimales", "email": "tres@example.com"},
+        [
+            {"nombre": "Pizza Especial", "precio": 35000.125, "cantidad": 1},
+            {"nombre": "Combo", "precio": 15200.445, "cantidad": 2},
+        ],
+    ),
+    "carrito_vacio": (
+        "FAC-0",
+        {"nombre": "Sin compra"},
+        [],
+    ),
+    "sin_guion": (
+        "12345",
+        {"nombre": "Cliente", "email": "c@example.com"},
+        [{"nombre": "Pizza", "precio": 8, "cantidad": 1}],
+    ),
+}
+
+
+def _golden_path(caso: str) -> str:
+    return os.path.join(GOLDEN_DIR, f"xml_{caso}.xml")
+
+
+@pytest.mark.parametrize("caso", sorted(CASOS))
+def test_xml_coincide_con_golden(caso):
+    factura_id, cliente, carrito = CASOS[caso]
+    xml = generar_xml_base(factura_id, cliente, carrito, ahora=AHORA).encode("utf-8")
+    if os.getenv("ACTUALIZAR_GOLDEN"):
+        os.makedirs(GOLDEN_DIR, exist_ok=True)
+        with open(_golden_path(caso), "wb") as f:
+            f.write(xml)
+    with open(_golden_path(caso), "rb") as f:
+        assert xml == f.read()
+
+
+@pytest.mark.parametrize("caso", sorted(CASOS))
+def test_xml_igual_a_elementtree(caso):
+    """La plantilla serializa igual que ElementTree (mismos importes: solo prueba el formato)."""
+    factura_id, cliente, carrito = CASOS[caso]
+    assert generar_xml_base(factura_id, cliente, carrito, ahora=AHORA) == \
+        _generar_xml_etree(factura_id, cliente, carrito, ahora=AHORA)
+
+
+# ---------- oráculo: generador original ----------
+def _xml_original(factura_id, cliente, carrito, ahora):
+    """Copia congelada del `generar_xml_base` original (ElementTree + float). No modificar.
+
+    Únicos cambios: `ahora` como parámetro y el monto en letras de
+    `models.monto_letras` (el original solo escribía pesos enteros).
+    """
+    from models.monto_letras import numero_a_letras
+
+    factura = ET.Element("Factura")
+    encabezado = ET.SubElement(factura, "Encabezado")
+    ET.SubElement(encabezado, "llavecomprobante").text = factura_id
+    ET.SubElement(encabezado, "nitemisor").text = "22222222"
+    ET.SubElement(encabezado, "codSucursal").text = "Pizzeria 1"
+    ET.SubElement(encabezado, "noresolucion").text = "123456789"
+    ET.SubElement(encabezado, "prefijo").text = "PZZA"
+    folio = factura_id.split("-")[-1] if "-" in factura_id else "0"
+    ET.SubElement(encabezado, "folio").text = folio
+    ET.SubElement(encabezado, "obligacionesfiscalesreceptor").text = "R-99-PN"
+    ET.SubElement(encabezado, "paisreceptor").text = "CO"
+    ET.SubElement(encabezado, "moneda").text = "COP"
+    ET.SubElement(encabezado, "metodopago").text = "1"
+    ET.SubElement(encabezado, "mediopago").text = "10"
+    ET.SubElement(encabezado, "terminospago").text = "0"
+    ET.SubElement(encabezado, "tipoOpera").text = "10"
+    ET.SubElement(encabezado, "xslt").text = "1"
+    ET.SubElement(encabezado, "tipocomprobante").text = "01"
+    ET.SubElement(encabezado, "totaldescuentos").text = "0.00"
+    ET.SubElement(encabezado, "totalcargos").text = "0.00"
+    ET.SubElement(encabezado, "totalimpuestosretenidos").text = "0.00"
+    ET.SubElement(encabezado, "fecha").text = ahora.strftime("%Y-%m-%d")
+    ET.SubElement(encabezado, "hora").text = ahora.strftime("%H:%M:%S")
+    ET.SubElement(encabezado, "fechavencimiento").text = ahora.strftime("%Y-%m-%d")
+    ET.SubElement(encabezado, "tiporeceptor").text = "1"
+    ET.SubElement(encabezado, "nitreceptor").text = "52169473"
+    ET.SubElement(encabezado, "tipoDocRec").text = "13"
+    ET.SubElement(encabezado, "digitoverificacion").text = ""
+    ET.SubElement(encabezado, "nombrereceptor").text = cliente.get("nombre", "Cliente")
+    ET.SubElement(encabezado, "mailreceptor").text = cliente.get("email", "")
+    ET.SubElement(encabezado, "apellidosreceptor").text = ""
+
+    subtotal = 0
+    total_impuestos = 0
+    for item in carrito:
+        importe = item["cantidad"] * item["precio"]
+        impuesto = round(importe * 0.19, 2)
+        subtotal += importe
+        total_impuestos += impuesto
+    total = subtotal + total_impuestos
+
+    ET.SubElement(encabezado, "subtotal").text = f"{subtotal:.2f}"
+    ET.SubElement(encabezado, "baseimpuesto").text = f"{subtotal:.2f}"
+    ET.SubElement(encabezado, "totalsindescuento").text = f"{subtotal:.2f}"
+    ET.SubElement(encabezado, "totalimpuestos").text = f"{total_impuestos:.2f}"
+    ET.SubElement(encabezado, "total").text = f"{total:.2f}"
+    ET.SubElement(encabezado, "montoletra").text = numero_a_letras(Decimal(f"{total:.2f}"))
+
+    detalle = ET.SubElement(factura, "Detalle")
+    id_concepto = 1
+    for item in carrito:
+        det = ET.SubElement(detalle, "Det")
+        ET.SubElement(det, "idConcepto").text = str(id_concepto)
+        ET.SubElement(det, "llaveComprobante").text = factura_id
+        ET.SubElement(det, "unidadmedida").text = "EA"
+        ET.SubElement(det, "tasa").text = "19.00"
+        ET.SubElement(det, "tipo").text = "01"
+        ET.SubElement(det, "identificacionproductos").text = f"PZ{id_concepto:02d}"
+        importe = item["cantidad"] * item["precio"]
+        impuesto = round(importe * 0.19, 2)
+        ET.SubElement(det, "impuestolinea").text = f"{impuesto:.2f}"
+        ET.SubElement(det, "baseimpuestos").text = f"{importe:.2f}"
+        ET.SubElement(det, "descripcion").text = item["nombre"]
+        ET.SubElement(det, "cantidad").text = str(item["cantidad"])
+        ET.SubElement(det, "precioUnitario").text = f"{item['precio']:.2f}"
+        ET.SubElement(det, "importe").text = f"{importe:.2f}"
+        id_concepto += 1
+
+    impuestos = ET.SubElement(factura, "Impuestos")
+    imp = ET.SubElement(impuestos, "Imp")
+    ET.SubElement(imp, "idImpuesto").text = "1"
+    ET.SubElement(imp, "llaveComprobante").text = factura_id
+    ET.SubElement(imp, "tasa").text = "19.00"
+    ET.SubElement(imp, "tipoImpuesto").text = "01"
+    ET.SubElement(imp, "baseimpuestos").text = f"{subtotal:.2f}"
+    ET.SubElement(imp, "importe").text = f"{total_impuestos:.2f}"
+    return ET.tostring(factura, encoding="utf-8", xml_declaration=True).decode()
+
+
+NOMBRES = ["Pizza Hawaiana", "Gaseosa 1.5L", "Peña & Hijos", "<Combo> \"x2\"", "Piña 'colada'", ""]
+
+
+def _carrito_aleatorio(rnd: random.Random, centavos: bool):
+    carrito = []
+    for _ in range(rnd.randint(0, 8)):
+        precio = rnd.randint(1, 9_999_999) / 100 if centavos else rnd.randint(0, 250_000)
+        carrito.append({"nombre": rnd.choice(NOMBRES), "precio": precio, "cantidad": rnd.randint(1, 12)})
+    cliente = {"nombre": rnd.choice(NOMBRES), "email": rnd.choice(["", "a&b@example.com"])}
+    return f"FAC-{rnd.randint(0, 99999)}", cliente, carrito
+
+
+def test_xml_igual_al_original_con_pesos():
+    """Con precios en pesos enteros la salida es idéntica byte a byte al generador original."""
+    rnd = random.Random(20250314)
+    for _ in range(500):
+        factura_id, cliente, carrito = _carrito_aleatorio(rnd, centavos=False)
+        assert generar_xml_base(factura_id, cliente, carrito, ahora=AHORA) == \
+            _xml_original(factura_id, cliente, carrito, AHORA), carrito
+
+
+def _comparar_seccion(nuevo, original, tolerancia):
+    """Mismas etiquetas y textos; los campos de `tolerancia` pueden diferir hasta ese monto."""
+    assert [e.tag for e in nuevo] == [e.tag for e in original]
+    for n, o in zip(nuevo, original):
+        if n.tag in tolerancia:
+            assert abs(Decimal(n.text) - Decimal(o.text)) <= tolerancia[n.tag], n.tag
+        elif n.tag != "montoletra":
+            assert n.text == o.text, n.tag
+
+
+def _iva_medio_centavo(item) -> bool:
+    # IVA exacto en centavos = importe en centavos * 19 / 100; empate si termina en ,5
+    return int(round(item["precio"] * 100)) * item["cantidad"] * 19 % 100 == 50
+
+
+def test_xml_con_centavos_difiere_solo_en_redondeo_del_iva():
+    """Con centavos solo cambia el IVA de medio centavo exacto (ver models.comprobante), en 0.01 por línea."""
+    rnd = random.Random(1207)
+    empates = 0
+    for _ in range(500):
+        factura_id, cliente, carrito = _carrito_aleatorio(rnd, centavos=True)
+        nuevo = ET.fromstring(generar_xml_base(factura_id, cliente, carrito, ahora=AHORA).encode("utf-8"))
+        original = ET.fromstring(_xml_original(factura_id, cliente, carrito, AHORA).encode("utf-8"))
+        dets_nuevo, dets_original = nuevo.findall("Detalle/Det"), original.findall("Detalle/Det")
+        assert len(dets_nuevo) == len(dets_original) == len(carrito)
+        for item, n, o in zip(carrito, dets_nuevo, dets_original):
+            _comparar_seccion(n, o, {"impuestolinea": Decimal("0.01") if _iva_medio_centavo(item) else Decimal(0)})
+        acumulado = Decimal("0.01") * sum(map(_iva_medio_centavo, carrito))
+        empates += acumulado > 0
+        _comparar_seccion(nuevo.find("Encabezado"), original.find("Encabezado"),
+                          {"totalimpuestos": acumulado, "total": acumulado})
+        _comparar_seccion(nuevo.find("Impuestos/Imp"), original.find("Impuestos/Imp"), {"importe": acumulado})
+        enc = nuevo.find("Encabezado")
+        assert Decimal(enc.findtext("total")) == Decimal(enc.findtext("subtotal")) + Decimal(enc.findtext("totalimpuestos"))
+    # Los carritos aleatorios deben ejercitar el caso que difiere
+    assert empates > 0
+
+
+@pytest.mark.parametrize("caso", sorted(CASOS))
+def test_comprobante_sin_reparsear(caso):
+    """El PDF y la BD reciben del comprobante lo mismo que leerían del XML."""
+    from models.comprobante import Comprobante
+    from services.pdf_generator import _parse_xml, datos_pdf
+    from services.xml_generator import serializar_xml
+
+    factura_id, cliente, carrito = CASOS[caso]
+    comprobante = Comprobante.desde_carrito(factura_id, cliente, carrito, AHORA)
+    xml = serializar_xml(comprobante)
+    assert datos_pdf(comprobante) == _parse_xml(xml)
+    assert serializar_xml(Comprobante.desde_xml(xml)) == xml
+
+
+def test_comprobante_folio_asignado_despues():
+    """/generar-xml arma el comprobante antes de pedir folio: el XML es el mismo."""
+    from models.comprobante import Comprobante
+    from services.xml_generator import serializar_xml
+
+    factura_id, cliente, carrito = CASOS["una_linea"]
+    comprobante = Comprobante.desde_carrito(None, cliente, carrito, AHORA)
+    comprobante.asignar_uuid(factura_id)
+    assert comprobante.folio == factura_id.split("-")[-1]
+    assert serializar_xml(comprobante) == serializar_xml(Comprobante.desde_carrito(factura_id, cliente, carrito, AHORA))
+
+
+def test_pdf_con_qr_compartido():
+    """Un lote de facturas incrusta el QR una sola vez y lo dibuja en cada página."""
+    from io import BytesIO
+
+    from models.comprobante import Comprobante
+    from services.pdf_generator import datos_pdf, obtener_plantilla
+
+    plantilla = obtener_plantilla()
+    assert plantilla.qr_reader is not None
+    datos = [datos_pdf(Comprobante.desde_carrito(*CASOS[caso], AHORA)) for caso in sorted(CASOS)]
+    buf = BytesIO()
+    plantilla.render_lote(datos, buf)
+    pdf = buf.getvalue()
+    assert pdf.startswith(b"%PDF")
+    assert pdf.count(b"/Subtype /Image") == 1
+    # Cada página (una por factura) referencia el mismo XObject
+    assert pdf.count(b"/XObject <<") == len(datos)
+
+
+@pytest.mark.parametrize("monto, letras", [
+    (0, "CERO PESOS CON 00 CENTAVOS"),
+    (1, "UN PESO CON 00 CENTAVOS"),
+    (21, "VEINTIUN PESOS CON 00 CENTAVOS"),
+    (100, "CIEN PESOS CON 00 CENTAVOS"),
+    (1001, "MIL UN PESOS CON 00 CENTAVOS"),
+    (21000, "VEINTIUN MIL PESOS CON 00 CENTAVOS"),
+    ("102841.22", "CIENTO DOS MIL OCHOCIENTOS CUARENTA Y UN PESOS CON 22 CENTAVOS"),
+    (1000000, "UN MILLON DE PESOS CON 00 CENTAVOS"),
+    (2500000, "DOS MILLONES QUINIENTOS MIL PESOS CON 00 CENTAVOS"),
+    (1001000000, "MIL UN MILLONES DE PESOS CON 00 CENTAVOS"),
+    (71.555, "SETENTA Y UN PESOS CON 56 CENTAVOS"),
+])
+def test_numero_a_letras(monto, letras):
+    from models.monto_letras import numero_a_letras
+
+    assert numero_a_letras(monto) == letras
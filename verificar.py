@@ -76,18 +76,15 @@ def ensure_project_dirs() -> bool:
 def try_postgres_soft_check():
     print("[4] Prueba rápida de PostgreSQL (opcional)...")
     try:
-        from database.connection import get_connection
-        conn = get_connection()
-        if conn is None:
-            print(f"{WARN} PostgreSQL no disponible. Se continuará sin DB.")
-            return
-        try:
+        from database.connection import pooled_connection
+        with pooled_connection() as conn:
+            if conn is None:
+                print(f"{WARN} PostgreSQL no disponible. Se continuará sin DB.")
+                return
             cur = conn.cursor()
             cur.execute("SELECT 1;")
             cur.fetchone()
             print(f"{OK} PostgreSQL responde")
-        finally:
-            conn.close()
     except Exception as e:
         print(f"{WARN} No se pudo verificar PostgreSQL: {e}")
 